@@ -0,0 +1,50 @@
+"""
+Benchmark the character-based neural language model's pipeline
+
+Measures vectorization, building training windows, training steps and per-character
+generation on a small CPU model. Results are saved as JSON. Pass the results of an
+earlier commit with --compare to flag the benchmarks which got slower, and --profile
+to also record where each benchmark spends its time and memory.
+
+Example:
+    python benchmark_neural_language_model.py --output after.json --compare before.json
+"""
+
+import argparse
+
+from benchmarking.harness import (
+    compare_results,
+    format_comparison,
+    format_results,
+    load_results,
+    save_results,
+)
+from benchmarking.neural_benchmarks import run_neural_benchmarks
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--num-poems", type=int, nargs="+", default=[100, 1000])
+parser.add_argument("--units", type=int, default=64)
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--leaves-of-grass", default="../data/leaves-of-grass.txt")
+parser.add_argument("--profile", action="store_true", help="Also record hotspots and allocations")
+parser.add_argument("--output", default="neural_benchmarks.json")
+parser.add_argument("--compare", help="Results of an earlier run to compare against")
+parser.add_argument("--threshold", type=float, default=0.1)
+args = parser.parse_args()
+
+results = run_neural_benchmarks(
+    num_synthetic_poems=args.num_poems,
+    leaves_of_grass_path=args.leaves_of_grass or None,
+    repeat=args.repeat,
+    units=args.units,
+    profile=args.profile,
+)
+print(format_results(results))
+save_results(results, args.output)
+print(f"Saved results to {args.output}")
+
+if args.compare:
+    comparison = compare_results(load_results(args.compare), results, args.threshold)
+    print(format_comparison(comparison))
+    regressions = [row for row in comparison if row["regression"]]
+    print(f"{len(regressions)} regression(s) of more than {args.threshold:.0%}")
@@ -0,0 +1,55 @@
+"""
+Benchmark training, scoring and generating with the n-gram language model
+
+Results are saved as JSON. Pass the results of an earlier commit with --compare to
+flag the benchmarks which got slower.
+
+Example:
+    python benchmark_ngram_language_model.py --output after.json --compare before.json
+"""
+
+import argparse
+
+from benchmarking.harness import (
+    compare_results,
+    format_comparison,
+    format_results,
+    load_results,
+    save_results,
+)
+from benchmarking.ngram_benchmarks import run_ngram_benchmarks
+from models.ngram_language_model import BackoffLanguageModel, LanguageModel
+
+MODEL_CLASSES = {"count": LanguageModel, "backoff": BackoffLanguageModel}
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+parser.add_argument("--n", type=int, default=3)
+parser.add_argument("--vocabulary-size", type=int, default=5000)
+parser.add_argument("--model", choices=MODEL_CLASSES, default="count")
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--leaves-of-grass", default="../data/leaves-of-grass.txt")
+parser.add_argument("--profile", action="store_true", help="Also record hotspots and allocations")
+parser.add_argument("--output", default="ngram_benchmarks.json")
+parser.add_argument("--compare", help="Results of an earlier run to compare against")
+parser.add_argument("--threshold", type=float, default=0.1)
+args = parser.parse_args()
+
+results = run_ngram_benchmarks(
+    corpus_sizes=args.sizes,
+    n=args.n,
+    vocabulary_size=args.vocabulary_size,
+    leaves_of_grass_path=args.leaves_of_grass or None,
+    repeat=args.repeat,
+    model_class=MODEL_CLASSES[args.model],
+    profile=args.profile,
+)
+print(format_results(results))
+save_results(results, args.output)
+print(f"Saved results to {args.output}")
+
+if args.compare:
+    comparison = compare_results(load_results(args.compare), results, args.threshold)
+    print(format_comparison(comparison))
+    regressions = [row for row in comparison if row["regression"]]
+    print(f"{len(regressions)} regression(s) of more than {args.threshold:.0%}")
@@ -1,5 +1,10 @@
 """
-Builds training, validation, and testing datasets in the Tensorflow format
+Builds training, validation, and testing datasets of integer character ids
+
+Each split is saved as a single flat array of ids, along with the offset at which each
+poem starts. Training windows are sliced out of it lazily, with
+`dataprep.sequence_datasets.iter_poem_batches`, rather than being expanded and saved
+to disk.
 
 REQUIRES:
     - data/leaves_of_grass.csv has already been derived
@@ -7,14 +12,13 @@ REQUIRES:
 
 import itertools
 
-from keras.utils import timeseries_dataset_from_array
 import pandas as pd
-import numpy as np
 
 from dataprep.neural_lm_dataprep import (
     Vectorizer,
     preprocess_for_neural_lm,
 )
+from dataprep.sequence_datasets import concatenate_poems, save_sequence
 
 
 # Load the poems from disk
@@ -36,8 +40,9 @@ print(poems[0][:17], "...")
 # Fit a vectorizer to the vocabulary of characters
 vectorizer = Vectorizer()
 vectorizer.fit(itertools.chain(*poems))
-# Vectorize all characters
-vectorized_poems = [vectorizer.tokens_to_vectors(poem) for poem in poems]
+# Encode all characters as integer ids (int8 for a character vocabulary)
+# rather than one-hot vectors, which would be vocab_size times larger
+vectorized_poems = [vectorizer.tokens_to_ints(poem) for poem in poems]
 
 print("Vocabulary:")
 print(vectorizer.vocabulary())
@@ -52,47 +57,25 @@ validation_set_size = int(0.15 * len(vectorized_poems))
 test_set_size = int(0.15 * len(vectorized_poems))
 
 train_set = vectorized_poems[:train_set_size]
-train_set = np.array(list(itertools.chain(*train_set)))
+train_set, train_set_offsets = concatenate_poems(train_set)
 print(f"# characters in train set:       {len(train_set)}")
 
 validation_set = vectorized_poems[train_set_size:(train_set_size + validation_set_size)]
-validation_set = np.array(list(itertools.chain(*validation_set)))
+validation_set, validation_set_offsets = concatenate_poems(validation_set)
 print(f"# characters in validation set:  {len(validation_set)}")
 
 test_set = vectorized_poems[train_set_size+validation_set_size:]
-test_set = np.array(list(itertools.chain(*test_set)))
+test_set, test_set_offsets = concatenate_poems(test_set)
 print(f"# characters in test set:        {len(test_set)}")
 
-# Each sample given to the model for training will be a sequence of 100 characters
-SEQUENCE_LENGTH = 100
-# I do not want to skip any samples, so sampling rate is 1
-SAMPLING_RATE = 1
-BATCH_SIZE = 4096
-
-# Build timeseries datasets using Keras helpers
-print("Building train dataset...")
-train_dataset = timeseries_dataset_from_array(
-    data=train_set[:-SEQUENCE_LENGTH],
-    targets=train_set[SEQUENCE_LENGTH:],
-    sampling_rate=SAMPLING_RATE,
-    sequence_length=SEQUENCE_LENGTH,
-    batch_size=BATCH_SIZE)
-train_dataset.save(path="../data/training_dataset_tensorflow/", compression="GZIP")
-
-print("Building validation dataset...")
-validation_dataset = timeseries_dataset_from_array(
-    data=validation_set[:-SEQUENCE_LENGTH],
-    targets=validation_set[SEQUENCE_LENGTH:],
-    sampling_rate=SAMPLING_RATE,
-    sequence_length=SEQUENCE_LENGTH,
-    batch_size=BATCH_SIZE)
-validation_dataset.save(path="../data/validation_dataset_tensorflow/", compression="GZIP")
-
-print("Building testing dataset...")
-testing_dataset = timeseries_dataset_from_array(
-    data=test_set[:-SEQUENCE_LENGTH],
-    targets=test_set[SEQUENCE_LENGTH:],
-    sampling_rate=SAMPLING_RATE,
-    sequence_length=SEQUENCE_LENGTH,
-    batch_size=BATCH_SIZE)
-testing_dataset.save(path="../data/testing_dataset_tensorflow/", compression="GZIP")
+print("Saving train dataset...")
+save_sequence(train_set, "../data/training_ids.npy")
+save_sequence(train_set_offsets, "../data/training_offsets.npy")
+
+print("Saving validation dataset...")
+save_sequence(validation_set, "../data/validation_ids.npy")
+save_sequence(validation_set_offsets, "../data/validation_offsets.npy")
+
+print("Saving testing dataset...")
+save_sequence(test_set, "../data/testing_ids.npy")
+save_sequence(test_set_offsets, "../data/testing_offsets.npy")
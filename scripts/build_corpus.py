@@ -0,0 +1,21 @@
+"""
+Build a corpus of preprocessed poems out of a directory of Project Gutenberg books
+
+Each book is parsed and preprocessed in parallel, and saved as its own shard. Running
+this again only rebuilds the shards of books which were added or changed.
+
+REQUIRES:
+    - GUTENBERG_DIR holds one or more Project Gutenberg .txt files laid out like
+      data/leaves-of-grass.txt
+"""
+
+from dataprep.corpus import build_corpus, load_corpus
+
+GUTENBERG_DIR = "../data/gutenberg/"
+CORPUS_DIR = "../data/corpus/"
+
+rebuilt = build_corpus(GUTENBERG_DIR, CORPUS_DIR)
+print(f"Rebuilt {len(rebuilt)} book(s): {rebuilt}")
+
+corpus = load_corpus(CORPUS_DIR)
+print(f"# poems in corpus: {len(corpus)}")
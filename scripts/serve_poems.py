@@ -0,0 +1,55 @@
+"""
+Serve poem generation from models which are loaded once and kept warm
+
+Requests which arrive close together are generated in one batch. Listens on a TCP port,
+or on a Unix socket if --unix-socket is given.
+
+Example:
+    python serve_poems.py --ngram-model ngram_model/ \
+        --neural-model model/character_based_lm --vectorizer model/vectorizer.pkl
+    curl -X POST localhost:8000/generate -d '{"model": "neural", "seed": "i sing "}'
+"""
+
+import argparse
+import os
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"  # Suppress tensorflow debugging info
+
+from models.ngram_language_model import BackoffLanguageModel, LanguageModel
+from serving.server import GenerationHTTPServer, UnixGenerationHTTPServer, load_service
+
+MODEL_CLASSES = {"count": LanguageModel, "backoff": BackoffLanguageModel}
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--ngram-model", help="Directory of a saved n-gram model")
+parser.add_argument("--ngram-model-class", choices=MODEL_CLASSES, default="count")
+parser.add_argument("--neural-model", help="Path of a saved Keras model")
+parser.add_argument("--vectorizer", default="model/vectorizer.pkl")
+parser.add_argument("--host", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8000)
+parser.add_argument("--unix-socket", help="Path of a Unix socket to listen on instead")
+parser.add_argument("--max-batch-size", type=int, default=32)
+parser.add_argument("--max-wait-ms", type=float, default=5)
+args = parser.parse_args()
+
+service = load_service(
+    ngram_model_path=args.ngram_model,
+    ngram_model_class=MODEL_CLASSES[args.ngram_model_class],
+    neural_model_path=args.neural_model,
+    vectorizer_path=args.vectorizer,
+    max_batch_size=args.max_batch_size,
+    max_wait_seconds=args.max_wait_ms / 1000,
+)
+if args.unix_socket:
+    server = UnixGenerationHTTPServer(args.unix_socket, service)
+    print(f"Serving {service.models} on {args.unix_socket}")
+else:
+    server = GenerationHTTPServer((args.host, args.port), service)
+    print(f"Serving {service.models} on http://{args.host}:{args.port}")
+
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    pass
+finally:
+    server.server_close()
+    service.close()
@@ -9,28 +9,72 @@ import pickle
 import os
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"  # Suppress tensorflow debugging info
 
+import numpy as np
 import tensorflow as tf
 from keras.layers import LSTM, Dropout
+from dataprep.sequence_datasets import iter_poem_batches, load_sequence
 from models.neural_language_models import build_character_lstm_model
 
 VECTORIZER_PATH = "../data/vectorizer.pkl"
-TRAIN_DATASET_PATH = "../data/training_dataset_tensorflow"
-VALIDATION_DATASET_PATH = "../data/validation_dataset_tensorflow"
+TRAIN_DATASET_PATH = "../data/training_ids.npy"
+TRAIN_OFFSETS_PATH = "../data/training_offsets.npy"
+VALIDATION_DATASET_PATH = "../data/validation_ids.npy"
+VALIDATION_OFFSETS_PATH = "../data/validation_offsets.npy"
+EMBEDDING_DIM = 32
+
+# Each sample given to the model for training will be a sequence of 100 characters
+SEQUENCE_LENGTH = 100
+# Poems shorter than SEQUENCE_LENGTH are trained on with these shorter sequences,
+# so that no sequence spans two poems
+BUCKET_SEQUENCE_LENGTHS = (25, 50, 75)
+BATCH_SIZE = 4096
+SHUFFLE_BUFFER_SIZE = 100_000
+
+
+def windowed_dataset(ids, offsets, shuffle):
+    """Wrap lazily gathered windows of a flat id array in a prefetching tf.data pipeline"""
+    rng = np.random.default_rng()
+    signature = (
+        tf.TensorSpec(shape=(None, None), dtype=tf.int32),
+        tf.TensorSpec(shape=(None,), dtype=tf.int32),
+    )
+    return tf.data.Dataset.from_generator(
+        lambda: (
+            (x.astype(np.int32), y.astype(np.int32))
+            for x, y in iter_poem_batches(
+                ids,
+                offsets,
+                SEQUENCE_LENGTH,
+                BATCH_SIZE,
+                bucket_sequence_lengths=BUCKET_SEQUENCE_LENGTHS,
+                shuffle_buffer_size=SHUFFLE_BUFFER_SIZE if shuffle else None,
+                rng=rng,
+            )
+        ),
+        output_signature=signature,
+    ).prefetch(tf.data.AUTOTUNE)
+
 
 print("Loading vectorizer...")
 with open(VECTORIZER_PATH, "rb") as infile:
     vectorizer = pickle.load(infile)
 
 print("Loading training dataset...")
-train_dataset = tf.data.Dataset.load(TRAIN_DATASET_PATH, compression="GZIP")
+train_dataset = windowed_dataset(
+    load_sequence(TRAIN_DATASET_PATH), load_sequence(TRAIN_OFFSETS_PATH), shuffle=True
+)
 
 print("Loading validation dataset...")
-validation_dataset = tf.data.Dataset.load(VALIDATION_DATASET_PATH, compression="GZIP")
+validation_dataset = windowed_dataset(
+    load_sequence(VALIDATION_DATASET_PATH), load_sequence(VALIDATION_OFFSETS_PATH), shuffle=False
+)
 
-# Build the model, with LSTM layers for handling the timeseries data
+# Build the model, with an embedding of the integer character ids,
+# LSTM layers for handling the timeseries data
 # and Dropout layers to help reduce overfitting
 model = build_character_lstm_model(
     vocab_size=vectorizer.vocab_size(),
+    embedding_dim=EMBEDDING_DIM,
     hidden_layers=[LSTM(256, return_sequences=True),
                    Dropout(0.3),
                    LSTM(256),
@@ -0,0 +1,303 @@
+"""
+Shared functionality for timing code, measuring its peak memory, and comparing results
+
+Results are plain dictionaries, saved as JSON alongside a description of the
+environment they were measured in, so that the results of two commits can be
+compared to catch regressions.
+"""
+
+import cProfile
+import datetime
+import json
+import platform
+import pstats
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def measure(function, repeat=3, num_items=None, trace_memory=True, profile=False):
+    """Time a function, and optionally measure the peak memory it allocates
+
+    The function is timed `repeat` times without tracing memory, then run once more
+    under `tracemalloc` if `trace_memory` is set, since tracing slows it down. If
+    `profile` is set, it is run twice more: once under cProfile and once taking a
+    `tracemalloc` snapshot.
+
+    Args:
+        function (Callable[[], Any]): The code to measure
+        repeat (int): Number of timed runs
+        num_items (int): If given, how many items (tokens, poems, queries...) a single
+            run processes, to report throughput
+        trace_memory (bool): Whether to measure the peak memory allocated by a run
+        profile (bool): Whether to report the functions which take the most time and
+            the lines which hold the most memory once a run returns
+
+    Returns:
+        dict: The "best_seconds" and "mean_seconds" of the timed runs, the
+        "items_per_second" and "seconds_per_item" of the best run if `num_items` is
+        given, the "peak_memory_bytes" if `trace_memory` is set, and the "hotspots"
+        and "allocations" if `profile` is set
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    measurement = {
+        "best_seconds": min(timings),
+        "mean_seconds": float(np.mean(timings)),
+    }
+    if num_items is not None:
+        measurement["num_items"] = num_items
+        measurement["items_per_second"] = num_items / max(min(timings), 1e-12)
+        measurement["seconds_per_item"] = min(timings) / max(num_items, 1)
+    if trace_memory:
+        measurement["peak_memory_bytes"] = peak_memory(function)
+    if profile:
+        measurement["hotspots"] = cprofile_hotspots(function)
+        measurement["allocations"] = top_allocations(function)
+    return measurement
+
+
+def peak_memory(function):
+    """Measure the peak memory allocated while running a function
+
+    NumPy reports its array allocations to `tracemalloc`, so these are included.
+
+    Args:
+        function (Callable[[], Any]): The code to measure
+
+    Returns:
+        int: The peak number of bytes allocated, above what was allocated beforehand
+    """
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    return peak - baseline
+
+
+def cprofile_hotspots(function, limit=20):
+    """Profile a function with cProfile, and find where it spends the most time
+
+    Args:
+        function (Callable[[], Any]): The code to profile
+        limit (int): Number of functions to report
+
+    Returns:
+        list[dict]: The `limit` functions with the most cumulative time, with their
+        "function" location, number of "calls", and "total_seconds" spent in the
+        function itself and "cumulative_seconds" spent in it and its callees
+    """
+    profiler = cProfile.Profile()
+    profiler.runcall(function)
+    stats = pstats.Stats(profiler).stats
+    hotspots = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{filename}:{line}({name})",
+            "calls": num_calls,
+            "total_seconds": total_seconds,
+            "cumulative_seconds": cumulative_seconds,
+        }
+        for (filename, line, name), (_, num_calls, total_seconds, cumulative_seconds, _) in hotspots
+    ]
+
+
+def top_allocations(function, limit=10):
+    """Find the lines which hold the most memory once a function has run
+
+    Args:
+        function (Callable[[], Any]): The code to profile
+        limit (int): Number of lines to report
+
+    Returns:
+        list[dict]: The `limit` lines holding the most memory still allocated when
+        `function` returns, including memory held by its return value, with their
+        "location", "size_bytes" and number of blocks ("count")
+    """
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = function()
+        after = tracemalloc.take_snapshot()
+        del result
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    differences = after.compare_to(before, "lineno")[:limit]
+    return [
+        {
+            "location": f"{difference.traceback[0].filename}:{difference.traceback[0].lineno}",
+            "size_bytes": difference.size_diff,
+            "count": difference.count_diff,
+        }
+        for difference in differences
+    ]
+
+
+def benchmark_result(name, parameters, measurement):
+    """Label a measurement with the benchmark it came from
+
+    Args:
+        name (str): Name of the benchmark, e.g. "ngram.train"
+        parameters (dict): The parameters the benchmark ran with. Together with
+            `name`, they identify the benchmark when comparing results
+        measurement (dict): As returned by `measure`
+
+    Returns:
+        dict: The benchmark's "name", "parameters", and measurement
+    """
+    return {"name": name, "parameters": parameters, **measurement}
+
+
+def environment_info():
+    """Describe the environment benchmarks are run in
+
+    Returns:
+        dict[str, str]: The git commit (None outside of a git checkout), Python and
+        NumPy versions, platform, processor and time of the run
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def save_results(results, path):
+    """Save benchmark results as JSON, alongside a description of the environment
+
+    Args:
+        results (list[dict]): Results, as returned by `benchmark_result`
+        path (str): Path to a .json file
+
+    Returns:
+        None
+    """
+    with open(path, "w") as outfile:
+        json.dump({"environment": environment_info(), "results": results}, outfile, indent=2)
+
+
+def load_results(path):
+    """Load benchmark results saved with `save_results`
+
+    Args:
+        path (str): Path to a .json file
+
+    Returns:
+        list[dict]: The results
+    """
+    with open(path) as infile:
+        return json.load(infile)["results"]
+
+
+def _result_key(result):
+    """Identify a result by its benchmark's name and parameters
+
+    Args:
+        result (dict): A result, as returned by `benchmark_result`
+
+    Returns:
+        str: A key which is equal for results of the same benchmark
+    """
+    return result["name"] + json.dumps(result["parameters"], sort_keys=True)
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """Compare the timings of two sets of benchmark results
+
+    Args:
+        baseline (list[dict]): Results measured before a change
+        current (list[dict]): Results measured after a change
+        threshold (float): How much slower, as a fraction of the baseline's best time,
+            a benchmark must get to count as a regression
+
+    Returns:
+        list[dict]: For each benchmark in both sets of results, its "name",
+        "parameters", "baseline_seconds", "current_seconds", "ratio" of current to
+        baseline time, and whether it is a "regression"
+    """
+    baseline_by_key = {_result_key(result): result for result in baseline}
+    comparison = []
+    for result in current:
+        before = baseline_by_key.get(_result_key(result))
+        if before is None:
+            continue
+        ratio = result["best_seconds"] / max(before["best_seconds"], 1e-12)
+        comparison.append(
+            {
+                "name": result["name"],
+                "parameters": result["parameters"],
+                "baseline_seconds": before["best_seconds"],
+                "current_seconds": result["best_seconds"],
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold,
+            }
+        )
+    return comparison
+
+
+def format_results(results):
+    """Format benchmark results as a table
+
+    Args:
+        results (list[dict]): Results, as returned by `benchmark_result`
+
+    Returns:
+        str: One line per result, with its time, throughput and peak memory
+    """
+    lines = []
+    for result in results:
+        parameters = ", ".join(f"{key}={value}" for key, value in result["parameters"].items())
+        line = f"{result['name']:<40} {result['best_seconds'] * 1000:>12.3f} ms"
+        if "items_per_second" in result:
+            line += f" {result['items_per_second']:>14,.0f} items/s"
+        if "peak_memory_bytes" in result:
+            line += f" {result['peak_memory_bytes'] / 2**20:>10.2f} MiB"
+        lines.append(f"{line}  ({parameters})")
+    return "\n".join(lines)
+
+
+def format_comparison(comparison):
+    """Format a comparison of benchmark results as a table
+
+    Args:
+        comparison (list[dict]): As returned by `compare_results`
+
+    Returns:
+        str: One line per benchmark, with its time before and after, flagging
+        regressions
+    """
+    lines = []
+    for row in comparison:
+        parameters = ", ".join(f"{key}={value}" for key, value in row["parameters"].items())
+        flag = "REGRESSION" if row["regression"] else ""
+        lines.append(
+            f"{row['name']:<40} {row['baseline_seconds'] * 1000:>12.3f} ms -> "
+            f"{row['current_seconds'] * 1000:>12.3f} ms ({row['ratio']:.2f}x) "
+            f"{flag:<10} ({parameters})"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,256 @@
+"""
+Benchmarks of the character-based neural language model's pipeline
+
+Covers each stage of the pipeline: vectorizing characters, slicing training windows
+out of the flat id array, training steps, and incremental generation. Everything runs
+on a small model built with `build_character_lstm_model`, so that the benchmarks run
+on a CPU in seconds.
+"""
+
+import itertools
+import os
+
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")  # Suppress tensorflow debugging info
+
+import numpy as np
+from keras.layers import LSTM
+
+from benchmarking.harness import benchmark_result, measure
+from dataprep.neural_lm_dataprep import Vectorizer, preprocess_for_neural_lm
+from dataprep.parse_leaves_of_grass import iter_leaves_of_grass
+from dataprep.sequence_datasets import concatenate_poems, iter_poem_batches
+from models.neural_generation import CharacterGenerator
+from models.neural_language_models import build_character_lstm_model
+
+
+def synthetic_poems(num_poems, poem_length=500, seed=0):
+    """Generate random poems of lowercase words and line breaks
+
+    Args:
+        num_poems (int): Number of poems
+        poem_length (int): Number of characters in each poem
+        seed (int): Seed of the random number generator
+
+    Returns:
+        list[str]: The poems
+    """
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list("abcdefghijklmnopqrstuvwxyz" + " " * 6 + "\n,."))
+    return ["".join(rng.choice(alphabet, size=poem_length)) for _ in range(num_poems)]
+
+
+def leaves_of_grass_poems(path):
+    """Read every poem of Leaves of Grass
+
+    Args:
+        path (str): Path to the Project Gutenberg .txt file of Leaves of Grass
+
+    Returns:
+        list[str]: The poems
+    """
+    with open(path) as f:
+        return [poem for _, _, poem in iter_leaves_of_grass(f)]
+
+
+def build_benchmark_model(vocab_size, embedding_dim=16, units=64):
+    """Build a small character-based LSTM model to benchmark with
+
+    Args:
+        vocab_size (int): The size of the vocabulary
+        embedding_dim (int): The size of the character embedding
+        units (int): Number of units in the LSTM layer
+
+    Returns:
+        keras.Sequential: An untrained model
+    """
+    return build_character_lstm_model(
+        vocab_size, [LSTM(units)], lr=0.01, embedding_dim=embedding_dim
+    )
+
+
+def benchmark_neural_pipeline(
+    poems,
+    corpus_name,
+    repeat=3,
+    sequence_length=100,
+    bucket_sequence_lengths=(25, 50, 75),
+    batch_size=256,
+    max_training_batches=20,
+    max_length=150,
+    generation_batch_size=16,
+    embedding_dim=16,
+    units=64,
+    seed=0,
+    profile=False,
+):
+    """Benchmark every stage of the neural pipeline on one corpus
+
+    Args:
+        poems (list[str]): The raw poems
+        corpus_name (str): Name of the corpus, to identify the results by
+        repeat (int): Number of timed runs of each benchmark
+        sequence_length (int): Number of characters in each training window
+        bucket_sequence_lengths (tuple[int]): Shorter windows for short poems
+        batch_size (int): Number of windows per training batch
+        max_training_batches (int): Number of batches in a benchmarked training epoch
+        max_length (int): Maximum number of characters in each generated poem
+        generation_batch_size (int): Number of poems generated at once by
+            `generate_batch`
+        embedding_dim (int): The size of the model's character embedding
+        units (int): Number of units in the model's LSTM layer
+        seed (int): Seed of the random number generators
+        profile (bool): Whether to profile the time and memory of each benchmark
+
+    Returns:
+        list[dict]: The results of the "neural.vectorize", "neural.windowed_batches",
+        "neural.train_epoch", "neural.generate" and "neural.generate_batch" benchmarks
+    """
+    preprocessed = [preprocess_for_neural_lm(poem) for poem in poems]
+    num_characters = sum(len(poem) for poem in preprocessed)
+    parameters = {"corpus": corpus_name, "num_characters": num_characters}
+
+    vectorizer = Vectorizer()
+
+    def vectorize():
+        vectorizer.fit(itertools.chain(*preprocessed))
+        return [vectorizer.tokens_to_ints(poem) for poem in preprocessed]
+
+    results = [
+        benchmark_result(
+            "neural.vectorize",
+            parameters,
+            measure(vectorize, repeat, num_items=num_characters, profile=profile),
+        )
+    ]
+    ids, offsets = concatenate_poems(vectorize())
+
+    window_parameters = {
+        **parameters,
+        "sequence_length": sequence_length,
+        "batch_size": batch_size,
+    }
+
+    def iter_batches():
+        return iter_poem_batches(
+            ids,
+            offsets,
+            sequence_length,
+            batch_size,
+            bucket_sequence_lengths=bucket_sequence_lengths,
+            shuffle_buffer_size=100_000,
+            rng=np.random.default_rng(seed),
+        )
+
+    num_windows = sum(len(targets) for _, targets in iter_batches())
+    results.append(
+        benchmark_result(
+            "neural.windowed_batches",
+            window_parameters,
+            measure(
+                lambda: [batch for batch in iter_batches()],
+                repeat,
+                num_items=num_windows,
+                profile=profile,
+            ),
+        )
+    )
+
+    model = build_benchmark_model(vectorizer.vocab_size(), embedding_dim, units)
+    training_batches = [
+        (inputs.astype(np.int32), targets.astype(np.int32))
+        for inputs, targets in itertools.islice(iter_batches(), max_training_batches)
+    ]
+
+    def train_epoch():
+        for inputs, targets in training_batches:
+            model.train_on_batch(inputs, targets)
+
+    # The first steps of each window length trace and compile the training function
+    train_epoch()
+    results.append(
+        benchmark_result(
+            "neural.train_epoch",
+            {**window_parameters, "units": units, "num_batches": len(training_batches)},
+            measure(
+                train_epoch,
+                repeat,
+                num_items=sum(len(targets) for _, targets in training_batches),
+                trace_memory=False,
+                profile=profile,
+            ),
+        )
+    )
+
+    generator = CharacterGenerator(model, vectorizer)
+    seed_phrase = preprocessed[0][: min(20, len(preprocessed[0]))]
+    generation_parameters = {**parameters, "units": units, "max_length": max_length}
+
+    def generate():
+        return generator.generate(
+            "".join(seed_phrase), max_length=max_length, rng=np.random.default_rng(seed)
+        )
+
+    num_generated = len(generate()) - len(seed_phrase)
+    results.append(
+        benchmark_result(
+            "neural.generate",
+            generation_parameters,
+            measure(generate, repeat, num_items=num_generated, profile=profile),
+        )
+    )
+
+    def generate_batch():
+        return generator.generate_batch(
+            ["".join(seed_phrase)] * generation_batch_size,
+            max_length=max_length,
+            rng=np.random.default_rng(seed),
+        )
+
+    num_generated = sum(len(poem) - len(seed_phrase) for poem in generate_batch())
+    results.append(
+        benchmark_result(
+            "neural.generate_batch",
+            {**generation_parameters, "batch_size": generation_batch_size},
+            measure(generate_batch, repeat, num_items=num_generated, profile=profile),
+        )
+    )
+    return results
+
+
+def run_neural_benchmarks(
+    num_synthetic_poems=(100, 1000),
+    leaves_of_grass_path=None,
+    repeat=3,
+    units=64,
+    seed=0,
+    profile=False,
+):
+    """Run every neural pipeline benchmark on synthetic poems, and optionally on Leaves of Grass
+
+    Args:
+        num_synthetic_poems (tuple[int]): Number of poems in each synthetic corpus
+        leaves_of_grass_path (str): If given, path to the Project Gutenberg .txt file
+            of Leaves of Grass to also benchmark on
+        repeat (int): Number of timed runs of each benchmark
+        units (int): Number of units in the model's LSTM layer
+        seed (int): Seed of the random number generators
+        profile (bool): Whether to profile the time and memory of each benchmark
+
+    Returns:
+        list[dict]: The results of every benchmark on every corpus
+    """
+    corpora = [
+        (f"synthetic-{num_poems}", synthetic_poems(num_poems, seed=seed))
+        for num_poems in num_synthetic_poems
+    ]
+    if leaves_of_grass_path is not None:
+        corpora.append(("leaves-of-grass", leaves_of_grass_poems(leaves_of_grass_path)))
+
+    results = []
+    for corpus_name, poems in corpora:
+        results.extend(
+            benchmark_neural_pipeline(
+                poems, corpus_name, repeat=repeat, units=units, seed=seed, profile=profile
+            )
+        )
+    return results
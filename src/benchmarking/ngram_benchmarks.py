@@ -0,0 +1,226 @@
+"""
+Benchmarks of training, scoring and generating with the n-gram language model
+
+Each benchmark runs on synthetic corpora of increasing size, whose token frequencies
+follow Zipf's law like natural text does, and optionally on Leaves of Grass.
+"""
+
+import random
+
+import numpy as np
+
+from benchmarking.harness import benchmark_result, measure
+from dataprep.ngram_lm_dataprep import stream_ngram_lm_tokens
+from dataprep.parse_leaves_of_grass import iter_leaves_of_grass
+from models.ngram_language_model import LanguageModel
+
+
+def synthetic_corpus(num_tokens, vocabulary_size, n, poem_length=100, seed=0):
+    """Generate a corpus of random poems whose token frequencies follow Zipf's law
+
+    Args:
+        num_tokens (int): Number of tokens in the corpus, not counting padding
+        vocabulary_size (int): Number of distinct tokens to draw from
+        n (int): The n-gram order the poems are padded for
+        poem_length (int): Number of tokens in each poem, not counting padding
+        seed (int): Seed of the random number generator
+
+    Returns:
+        list[list[str]]: The tokens of each poem, wrapped with n-1 POEM_BEGIN and
+        POEM_END symbols
+    """
+    rng = np.random.default_rng(seed)
+    frequencies = 1 / np.arange(1, vocabulary_size + 1)
+    ids = rng.choice(vocabulary_size, size=num_tokens, p=frequencies / frequencies.sum())
+    words = np.array([f"w{i}" for i in range(vocabulary_size)])[ids].tolist()
+    padding = max(0, n - 1)
+    return [
+        [LanguageModel.POEM_BEGIN] * padding
+        + words[start : start + poem_length]
+        + [LanguageModel.POEM_END] * padding
+        for start in range(0, num_tokens, poem_length)
+    ]
+
+
+def leaves_of_grass_corpus(path, n):
+    """Tokenize every poem of Leaves of Grass for an n-gram language model
+
+    Args:
+        path (str): Path to the Project Gutenberg .txt file of Leaves of Grass
+        n (int): The n-gram order the poems are padded for
+
+    Returns:
+        list[list[str]]: The tokens of each poem, wrapped with n-1 POEM_BEGIN and
+        POEM_END symbols
+    """
+    with open(path) as f:
+        return list(stream_ngram_lm_tokens((poem for _, _, poem in iter_leaves_of_grass(f)), n))
+
+
+def benchmark_language_model(
+    poems,
+    n,
+    corpus_name,
+    repeat=3,
+    num_scored_poems=200,
+    num_generated_poems=20,
+    max_words=100,
+    num_prefix_queries=10_000,
+    model_class=LanguageModel,
+    seed=0,
+    profile=False,
+):
+    """Benchmark training, scoring, generating and prefix counting on one corpus
+
+    Args:
+        poems (list[list[str]]): The tokens of each poem, padded for order n
+        n (int): The n-gram order of the model
+        corpus_name (str): Name of the corpus, to identify the results by
+        repeat (int): Number of timed runs of each benchmark
+        num_scored_poems (int): Number of poems to score one at a time with `score`
+        num_generated_poems (int): Number of poems to generate per run
+        max_words (int): Maximum number of words in each generated poem
+        num_prefix_queries (int): Number of prefixes to count per run
+        model_class (type): The language model class to benchmark
+        seed (int): Seed of the random number generators
+        profile (bool): Whether to profile the time and memory of each benchmark
+
+    Returns:
+        list[dict]: The results of the "ngram.train", "ngram.score",
+        "ngram.score_batch", "ngram.generate_poem" and "ngram.count_ngrams_with_prefix"
+        benchmarks
+    """
+    tokens = [token for poem in poems for token in poem]
+    parameters = {
+        "corpus": corpus_name,
+        "num_tokens": len(tokens),
+        "n": n,
+        "model": model_class.__name__,
+    }
+
+    def make_model():
+        if model_class is LanguageModel:
+            return LanguageModel(n, False, replacement_threshold=1)
+        return model_class(n, replacement_threshold=1)
+
+    model = make_model()
+    results = [
+        benchmark_result(
+            "ngram.train",
+            parameters,
+            measure(
+                lambda: make_model().train(tokens),
+                repeat,
+                num_items=len(tokens),
+                profile=profile,
+            ),
+        )
+    ]
+    model.train(tokens)
+
+    scored_poems = poems[:num_scored_poems]
+    results.append(
+        benchmark_result(
+            "ngram.score",
+            parameters,
+            measure(
+                lambda: [model.score(poem) for poem in scored_poems],
+                repeat,
+                num_items=len(scored_poems),
+                profile=profile,
+            ),
+        )
+    )
+    results.append(
+        benchmark_result(
+            "ngram.score_batch",
+            parameters,
+            measure(
+                lambda: model.score_batch(poems),
+                repeat,
+                num_items=len(tokens),
+                profile=profile,
+            ),
+        )
+    )
+
+    def generate():
+        random.seed(seed)
+        model.clear_caches()
+        for _ in range(num_generated_poems):
+            model.generate_poem(max_words)
+
+    results.append(
+        benchmark_result(
+            "ngram.generate_poem",
+            {**parameters, "max_words": max_words},
+            measure(generate, repeat, num_items=num_generated_poems, profile=profile),
+        )
+    )
+
+    rng = np.random.default_rng(seed)
+    query_starts = rng.integers(0, max(1, len(tokens) - n + 2), size=num_prefix_queries)
+    prefixes = [tuple(tokens[start : start + n - 1]) for start in query_starts.tolist()]
+
+    def count_prefixes():
+        model.clear_caches()
+        for prefix in prefixes:
+            model.count_ngrams_with_prefix(prefix)
+
+    results.append(
+        benchmark_result(
+            "ngram.count_ngrams_with_prefix",
+            parameters,
+            measure(count_prefixes, repeat, num_items=num_prefix_queries, profile=profile),
+        )
+    )
+    return results
+
+
+def run_ngram_benchmarks(
+    corpus_sizes=(10_000, 100_000, 1_000_000),
+    n=3,
+    vocabulary_size=5000,
+    leaves_of_grass_path=None,
+    repeat=3,
+    model_class=LanguageModel,
+    seed=0,
+    profile=False,
+):
+    """Run every n-gram benchmark on synthetic corpora, and optionally on Leaves of Grass
+
+    Args:
+        corpus_sizes (tuple[int]): Number of tokens in each synthetic corpus
+        n (int): The n-gram order of the model
+        vocabulary_size (int): Number of distinct tokens in the synthetic corpora
+        leaves_of_grass_path (str): If given, path to the Project Gutenberg .txt file
+            of Leaves of Grass to also benchmark on
+        repeat (int): Number of timed runs of each benchmark
+        model_class (type): The language model class to benchmark
+        seed (int): Seed of the random number generators
+        profile (bool): Whether to profile the time and memory of each benchmark
+
+    Returns:
+        list[dict]: The results of every benchmark on every corpus
+    """
+    corpora = [
+        (f"synthetic-{num_tokens}", synthetic_corpus(num_tokens, vocabulary_size, n, seed=seed))
+        for num_tokens in corpus_sizes
+    ]
+    if leaves_of_grass_path is not None:
+        corpora.append(("leaves-of-grass", leaves_of_grass_corpus(leaves_of_grass_path, n)))
+
+    results = []
+    for corpus_name, poems in corpora:
+        results.extend(
+            benchmark_language_model(
+                poems,
+                n,
+                corpus_name,
+                repeat=repeat,
+                model_class=model_class,
+                seed=seed,
+                profile=profile,
+            )
+        )
+    return results
@@ -0,0 +1,246 @@
+"""
+Functionality for building a corpus of poems out of many Project Gutenberg books
+
+Each book is parsed and preprocessed for both kinds of language model in its own
+worker process, and written to its own compressed shard of NumPy arrays. Text columns
+are stored as one UTF-8 byte buffer plus offsets, and n-gram tokens as ids into a
+vocabulary, so that a shard is no larger than the book it was built from. A manifest
+records the checksum of the file each shard was built from, and the versions of the
+shard format and tokenizer it was built with, so rebuilding only redoes the books
+which changed.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataprep.ngram_lm_dataprep import TOKENIZER_VERSION, preprocess_for_ngram_lm
+from dataprep.neural_lm_dataprep import preprocess_for_neural_lm
+from dataprep.parse_leaves_of_grass import iter_leaves_of_grass
+
+
+MANIFEST_FILE = "manifest.json"
+# Bump whenever the arrays `build_shard` writes change, so that old shards are rebuilt
+SHARD_FORMAT_VERSION = 2
+TEXT_COLUMNS = ("book_title", "poem_title", "poem", "neural_poem")
+
+
+def file_checksum(path, block_size=1 << 20):
+    """Compute the SHA-256 checksum of a file without reading it all into memory
+
+    Args:
+        path (str): Path to a file
+        block_size (int): Number of bytes to read at a time
+
+    Returns:
+        str: The checksum, as a hex string
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_shard(path):
+    """Parse one Project Gutenberg book and preprocess its poems for both language models
+
+    Args:
+        path (str): Path to the book's .txt file
+
+    Returns:
+        dict[str, np.ndarray]: Columns of the shard. Each text column is stored as
+        `<column>_bytes` and `<column>_offsets`, as returned by `pack_strings`. Every
+        poem's n-gram tokens are stored as ids into the packed `ngram_vocabulary`,
+        concatenated into `ngram_token_ids`, and poem i's ids are
+        `ngram_token_ids[ngram_offsets[i]:ngram_offsets[i+1]]`
+    """
+    with open(path) as f:
+        records = list(iter_leaves_of_grass(f))
+    poems = [poem for _, _, poem in records]
+    columns = {
+        "book_title": [book for book, _, _ in records],
+        "poem_title": [title for _, title, _ in records],
+        "poem": poems,
+        "neural_poem": ["".join(preprocess_for_neural_lm(poem)) for poem in poems],
+    }
+    shard = {}
+    for column, strings in columns.items():
+        shard[column + "_bytes"], shard[column + "_offsets"] = pack_strings(strings)
+
+    ngram_tokens = [preprocess_for_ngram_lm(poem) for poem in poems]
+    vocabulary = sorted({token for tokens in ngram_tokens for token in tokens})
+    token_ids = {token: i for i, token in enumerate(vocabulary)}
+    num_tokens = sum(len(tokens) for tokens in ngram_tokens)
+    shard["ngram_vocabulary_bytes"], shard["ngram_vocabulary_offsets"] = pack_strings(
+        vocabulary
+    )
+    shard["ngram_token_ids"] = np.fromiter(
+        (token_ids[token] for tokens in ngram_tokens for token in tokens),
+        dtype=np.int32,
+        count=num_tokens,
+    )
+    shard["ngram_offsets"] = np.concatenate(
+        ([0], np.cumsum([len(tokens) for tokens in ngram_tokens]))
+    ).astype(np.int64)
+    return shard
+
+
+def pack_strings(strings):
+    """Pack strings into one UTF-8 byte buffer, rather than a fixed-width string array
+
+    Args:
+        strings (list[str]): The strings
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The concatenated UTF-8 bytes of the strings, and
+        the offsets of each string in them, so that string i is
+        `data[offsets[i]:offsets[i+1]]`
+    """
+    encoded = [string.encode() for string in strings]
+    offsets = np.concatenate(([0], np.cumsum([len(data) for data in encoded])))
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets.astype(np.int64)
+
+
+def unpack_strings(data, offsets):
+    """Unpack strings packed by `pack_strings`
+
+    Args:
+        data (np.ndarray): The concatenated UTF-8 bytes of the strings
+        offsets (np.ndarray): The offsets of each string in `data`
+
+    Returns:
+        list[str]: The strings
+    """
+    buffer = data.tobytes()
+    offsets = offsets.tolist()
+    return [
+        buffer[start:stop].decode() for start, stop in zip(offsets[:-1], offsets[1:])
+    ]
+
+
+def _build_and_save_shard(paths):
+    """Build the shard of one book and save it, for `build_corpus`
+
+    Args:
+        paths (tuple[str, str]): Path to the book's .txt file, and path to save its
+                                 shard to
+
+    Returns:
+        None
+    """
+    input_path, shard_path = paths
+    np.savez_compressed(shard_path, **build_shard(input_path))
+
+
+def build_corpus(input_dir, output_dir, processes=None):
+    """Build or refresh a corpus out of every .txt book in a directory
+
+    Books whose checksum, shard format version and tokenizer version match the
+    manifest from a previous build are skipped, and shards of books which were removed
+    from `input_dir` are deleted.
+
+    Args:
+        input_dir (str): Directory of Project Gutenberg .txt files
+        output_dir (str): Directory to write the shards and manifest to
+        processes (int): Number of worker processes. Defaults to the number of CPUs
+
+    Returns:
+        list[str]: The names of the books which were (re)built
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    names = sorted(name for name in os.listdir(input_dir) if name.endswith(".txt"))
+    checksums = {name: file_checksum(os.path.join(input_dir, name)) for name in names}
+    entries = {
+        name: {
+            "checksum": checksums[name],
+            "shard": name + ".npz",
+            "format_version": SHARD_FORMAT_VERSION,
+            "tokenizer_version": TOKENIZER_VERSION,
+        }
+        for name in names
+    }
+    stale = [
+        name
+        for name in names
+        if manifest.get(name) != entries[name]
+        or not os.path.exists(os.path.join(output_dir, manifest[name]["shard"]))
+    ]
+
+    if stale:
+        with multiprocessing.Pool(processes) as pool:
+            pool.map(
+                _build_and_save_shard,
+                [
+                    (os.path.join(input_dir, name), os.path.join(output_dir, name + ".npz"))
+                    for name in stale
+                ],
+            )
+    for name in stale:
+        manifest[name] = entries[name]
+
+    for name in set(manifest) - set(names):
+        shard_path = os.path.join(output_dir, manifest.pop(name)["shard"])
+        if os.path.exists(shard_path):
+            os.remove(shard_path)
+
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as outfile:
+        json.dump(manifest, outfile, indent=2, sort_keys=True)
+    return stale
+
+
+def load_manifest(output_dir):
+    """Load the manifest of a corpus built by `build_corpus`
+
+    Args:
+        output_dir (str): Directory the corpus was built in
+
+    Returns:
+        dict[str, dict]: A mapping of {Book file name -> {"checksum", "shard",
+                         "format_version", "tokenizer_version"}}, empty if the
+                         corpus has not been built
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as infile:
+        return json.load(infile)
+
+
+def load_corpus(output_dir):
+    """Load every shard of a corpus built by `build_corpus` into a DataFrame of poems
+
+    Args:
+        output_dir (str): Directory the corpus was built in
+
+    Returns:
+        pd.DataFrame: One row per poem, with the columns "source", "book_title",
+                      "poem_title", "poem", "ngram_tokens", and "neural_poem"
+    """
+    frames = []
+    for name, entry in sorted(load_manifest(output_dir).items()):
+        with np.load(os.path.join(output_dir, entry["shard"])) as shard:
+            frame = {"source": name}
+            for column in TEXT_COLUMNS:
+                frame[column] = unpack_strings(
+                    shard[column + "_bytes"], shard[column + "_offsets"]
+                )
+            vocabulary = unpack_strings(
+                shard["ngram_vocabulary_bytes"], shard["ngram_vocabulary_offsets"]
+            )
+            tokens = [vocabulary[i] for i in shard["ngram_token_ids"].tolist()]
+            offsets = shard["ngram_offsets"].tolist()
+            frame["ngram_tokens"] = [
+                tokens[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])
+            ]
+            frames.append(pd.DataFrame(frame))
+    columns = ["source", "book_title", "poem_title", "poem", "ngram_tokens", "neural_poem"]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
@@ -14,6 +14,7 @@ class Vectorizer:
     def __init__(self):
         self.token_to_int_mapping = {}
         self.int_to_token_mapping = {}
+        self._lookup_tables = None
     
     def fit(self, tokens):
         """Fit the vectorizer to a vocabulary 
@@ -25,6 +26,7 @@ class Vectorizer:
             if token not in self.token_to_int_mapping:
                 self._insert_token(token)
         self.int_to_token_mapping = {v:k for k,v in self.token_to_int_mapping.items()}
+        self._lookup_tables = None
 
     def vocab_size(self):
         """Get the size of the vocabulary
@@ -48,9 +50,72 @@ class Vectorizer:
         Args:
             tokens (list[str]): Tokens to vectorize
         """
-        return to_categorical(
-            [self.token_to_int(t) for t in tokens], num_classes=self.vocab_size()
-        )
+        return to_categorical(self.tokens_to_ints(tokens), num_classes=self.vocab_size())
+
+    def tokens_to_ints(self, tokens):
+        """Encode tokens as integer ids, in the smallest integer type that fits the vocabulary
+
+        If every token in the vocabulary is a single character, tokens are encoded with
+        one lookup into a table indexed by code point, rather than one dict lookup each.
+
+        Args:
+            tokens (str | list[str]): Tokens to encode. A string is encoded as a
+                sequence of character tokens
+
+        Returns:
+            np.ndarray: The id of each token
+        """
+        code_point_table, _ = self._get_lookup_tables()
+        if code_point_table is None:
+            return np.fromiter(
+                map(self.token_to_int, tokens), dtype=self.int_dtype(), count=len(tokens)
+            )
+
+        text = tokens if isinstance(tokens, str) else "".join(tokens)
+        if not isinstance(tokens, str) and len(text) != len(tokens):
+            raise ValueError("Tokens of a character vocabulary must be single characters")
+        code_points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        ids = code_point_table[np.minimum(code_points, len(code_point_table) - 1)]
+        unknown = (ids < 0) | (code_points >= len(code_point_table))
+        if unknown.any():
+            raise KeyError(text[np.flatnonzero(unknown)[0]])
+        return ids.astype(self.int_dtype())
+
+    def ints_to_tokens(self, ints):
+        """Convert integer ids back into tokens
+
+        Args:
+            ints (list[int]): Token ids
+
+        Returns:
+            list[str]: A list of tokens
+        """
+        _, token_table = self._get_lookup_tables()
+        return token_table[np.asarray(ints, dtype=np.int64)].tolist()
+
+    def ints_to_strings(self, batch, sep=""):
+        """Convert a batch of id sequences back into strings
+
+        Args:
+            batch (Iterable[np.ndarray]): Sequences of token ids
+            sep (str): String to join the tokens of each sequence with
+
+        Returns:
+            list[str]: The tokens of each sequence, joined
+        """
+        _, token_table = self._get_lookup_tables()
+        return [sep.join(token_table[np.asarray(ids, dtype=np.int64)]) for ids in batch]
+
+    def int_dtype(self):
+        """Get the smallest signed integer type which can hold every id in the vocabulary
+
+        Returns:
+            np.dtype: The integer type
+        """
+        for dtype in (np.int8, np.int16, np.int32):
+            if self.vocab_size() <= np.iinfo(dtype).max + 1:
+                return np.dtype(dtype)
+        return np.dtype(np.int64)
 
     def vectors_to_tokens(self, vectors):
         """Convert one-hot encoded vectors back into tokens
@@ -91,11 +156,31 @@ class Vectorizer:
         Args:
             token (str): A token
         """
-        if self.token_to_int_mapping == {}:
-            self.token_to_int_mapping[token] = 0
-        else:
-            curr_max = max(self.token_to_int_mapping.values())
-            self.token_to_int_mapping[token] = curr_max + 1
+        # Ids are assigned densely in insertion order, so the next id is the size
+        self.token_to_int_mapping[token] = len(self.token_to_int_mapping)
+
+    def _get_lookup_tables(self):
+        """Get the tables used to encode and decode many tokens at once
+
+        The tables are built the first time they are needed after fitting.
+
+        Returns:
+            tuple[np.ndarray | None, np.ndarray]: A table of token ids indexed by code
+            point (-1 for characters outside the vocabulary), or None if the vocabulary
+            is not made of single characters, and a table of tokens indexed by id
+        """
+        # Vectorizers pickled before the tables existed do not have the attribute
+        if getattr(self, "_lookup_tables", None) is None:
+            vocabulary = self.vocabulary()
+            code_point_table = None
+            if vocabulary and all(len(token) == 1 for token in vocabulary):
+                code_points = [ord(token) for token in vocabulary]
+                code_point_table = np.full(max(code_points) + 1, -1, dtype=np.int64)
+                code_point_table[code_points] = list(self.token_to_int_mapping.values())
+            token_table = np.empty(len(vocabulary), dtype=object)
+            token_table[:] = vocabulary
+            self._lookup_tables = (code_point_table, token_table)
+        return self._lookup_tables
 
 
 def preprocess_for_neural_lm(poem):
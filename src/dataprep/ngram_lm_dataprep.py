@@ -3,8 +3,33 @@ Functionality for preprocessing data to be used in n-gram language models
 
 """
 
+import hashlib
 import re
-from nltk.tokenize import word_tokenize
+import shelve
+
+import pandas as pd
+
+
+# Bump whenever the tokenizer's output changes, so that cached tokens are not reused
+TOKENIZER_VERSION = 1
+
+# Matches the tokens NLTK's `word_tokenize` produces: words (which may contain inner
+# hyphens and straight apostrophes, and end with a hyphen split across lines),
+# ellipses, double dashes, newlines, and any other single character
+_COARSE_TOKEN = re.compile(r"\n|\.\.\.|--|'?\w+(?:[-']\w+)*(?:-(?!-))?|\S")
+# Clitics which `word_tokenize` splits off the end of a word
+_CLITIC = re.compile(r"^(.+?)(n't|'s|'m|'d|'ll|'re|'ve)$")
+# Words which `word_tokenize` splits in two
+_SPLIT_WORDS = {
+    "cannot": ["can", "not"],
+    "gimme": ["gim", "me"],
+    "gonna": ["gon", "na"],
+    "gotta": ["got", "ta"],
+    "lemme": ["lem", "me"],
+    "wanna": ["wan", "na"],
+    "'tis": ["'t", "is"],
+    "'twas": ["'t", "was"],
+}
 
 
 def preprocess_for_ngram_lm(poem, newline_sym="<nl>"):
@@ -17,11 +42,68 @@ def preprocess_for_ngram_lm(poem, newline_sym="<nl>"):
     Returns:
         list[str]: A list of tokens
     """
-    poem = poem.lower()
-    poem = poem.replace("\n", "NEWLINE")
-    poem = word_tokenize(poem)
-    poem = [word if not word == "NEWLINE" else newline_sym for word in poem]
-    return poem
+    return tokenize(poem.lower(), newline_sym)
+
+
+def tokenize(text, newline_sym="<nl>"):
+    """Split text into word and punctuation tokens with a compiled regular expression
+
+    The tokens match those of NLTK's `word_tokenize` on poetry, at a fraction of the
+    cost, except that every newline becomes its own `newline_sym` token.
+
+    Args:
+        text (str): Text to tokenize
+        newline_sym (str): Symbol to replace newline characters with
+
+    Returns:
+        list[str]: A list of tokens
+    """
+    tokens = []
+    for match in _COARSE_TOKEN.finditer(text):
+        token = match.group()
+        if token == "\n":
+            tokens.append(newline_sym)
+        elif token == '"':
+            # Like `word_tokenize`, turn double quotes into opening and closing quotes
+            start = match.start()
+            opening = start == 0 or text[start - 1].isspace() or text[start - 1] in "([{<"
+            tokens.append("``" if opening else "''")
+        elif token in _SPLIT_WORDS:
+            tokens.extend(_SPLIT_WORDS[token])
+        else:
+            clitic = _CLITIC.match(token)
+            tokens.extend(clitic.groups() if clitic else [token])
+    return tokens
+
+
+def preprocess_poems_for_ngram_lm(poems, newline_sym="<nl>", cache_path=None):
+    """Convert many poems into tokens, reusing tokens cached on disk by earlier runs
+
+    Args:
+        poems (Iterable[str]): Poems, each as a single string
+        newline_sym (str): Symbol to replace newline characters with
+        cache_path (str): If given, path of an on-disk cache of tokenized poems, keyed
+                          by a hash of each poem's content. It is created if it does
+                          not exist
+
+    Returns:
+        list[list[str]]: The tokens of each poem
+    """
+    if cache_path is None:
+        return [preprocess_for_ngram_lm(poem, newline_sym) for poem in poems]
+
+    tokenized_poems = []
+    with shelve.open(str(cache_path)) as cache:
+        for poem in poems:
+            key = hashlib.sha256(
+                f"{TOKENIZER_VERSION}\0{newline_sym}\0{poem}".encode()
+            ).hexdigest()
+            tokens = cache.get(key)
+            if tokens is None:
+                tokens = preprocess_for_ngram_lm(poem, newline_sym)
+                cache[key] = tokens
+            tokenized_poems.append(tokens)
+    return tokenized_poems
 
 
 def postprocess_for_ngram_lm(poem):
@@ -42,4 +124,57 @@ def postprocess_for_ngram_lm(poem):
     poem = re.sub(replace_with_single_space, " ", poem)
     poem = poem.strip()
 
-    return poem
\ No newline at end of file
+    return poem
+
+
+def read_poems_csv(path, column="poem", chunksize=1000):
+    """Lazily read poems from a CSV file, such as data/leaves_of_grass.csv
+
+    Args:
+        path (str): Path to the CSV file
+        column (str): Name of the column holding the poems
+        chunksize (int): Number of rows to read from the file at a time
+
+    Returns:
+        Iterator[str]: The poems, one at a time
+    """
+    with pd.read_csv(path, usecols=[column], chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield from chunk[column]
+
+
+def read_poems_text(paths):
+    """Lazily read poems from text files which each hold a single poem
+
+    Args:
+        paths (Iterable[str]): Paths to the text files
+
+    Returns:
+        Iterator[str]: The poems, one at a time
+    """
+    for path in paths:
+        with open(path) as f:
+            yield f.read()
+
+
+def stream_ngram_lm_tokens(poems, n, newline_sym="<nl>", poem_begin="<p>", poem_end="</p>"):
+    """Lazily tokenize poems for an `n`-gram language model
+
+    Args:
+        poems (Iterable[str]): Poems, each as a single string
+        n (int): The n-gram order of the language model
+        newline_sym (str): Symbol to replace newline characters with
+        poem_begin (str): Symbol to wrap the start of each poem with
+        poem_end (str): Symbol to wrap the end of each poem with
+
+    Returns:
+        Iterator[list[str]]: The tokens of each poem, wrapped with n-1 `poem_begin`
+        and `poem_end` symbols
+    """
+    padding = max(0, n - 1)
+    for poem in poems:
+        yield (
+            [poem_begin] * padding
+            + preprocess_for_ngram_lm(poem, newline_sym)
+            + [poem_end] * padding
+        )
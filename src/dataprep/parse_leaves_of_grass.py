@@ -92,17 +92,45 @@ def split_into_books(lines):
     return split_into_blocks(lines, is_book_title, read_book_body)
 
 
+def iter_leaves_of_grass(lines):
+    """Parse poems out of a leaves of grass copy from Project Gutenberg in a single pass
+
+    Walks the lines once with a small state machine, so it can read straight from a
+    file handle without holding the whole book in memory. Lines before the first book
+    heading, and lines of a book before its first poem title, are skipped.
+
+    Args:
+        lines (Iterable[str]): Lines from the Project Gutenberg .txt file
+
+    Returns:
+        Iterator[tuple[str, str, str]]: The book title, poem title, and poem of
+                                        each poem, in order
+    """
+    book_title = None
+    poem_title = None
+    poem_lines = []
+    for line in lines:
+        if is_book_title(line) or is_poem_title(line):
+            if poem_title is not None:
+                yield book_title.strip(), poem_title.strip(), "".join(poem_lines).strip()
+            poem_lines = []
+            if is_book_title(line):
+                book_title, poem_title = line, None
+            elif book_title is not None:
+                poem_title = line
+        elif poem_title is not None:
+            poem_lines.append(line)
+    if poem_title is not None:
+        yield book_title.strip(), poem_title.strip(), "".join(poem_lines).strip()
+
+
 def leaves_of_grass_gutenberg_to_df(lines):
     """Convert a leaves of grass copy from Project Gutenberg into a DataFrame of poems
 
     Args:
-        lines (list[str]): Lines from the Project Gutenberg .txt file
+        lines (Iterable[str]): Lines from the Project Gutenberg .txt file, such as
+                               an open file handle
     """
-    books = split_into_books(lines)
-    all_poems = []
-    for book_title, book_content in books:
-        poems = split_into_poems(book_content)
-        for poem_title, poem_content in poems:
-            all_poems.append((book_title.strip(), poem_title.strip(), ("".join(poem_content)).strip()))
-    return pd.DataFrame(all_poems, columns=["book_title", "poem_title", "poem"])
-            
\ No newline at end of file
+    return pd.DataFrame(
+        iter_leaves_of_grass(lines), columns=["book_title", "poem_title", "poem"]
+    )
@@ -0,0 +1,238 @@
+"""
+Input pipelines which slice training windows out of a flat array of character ids
+
+Rather than saving every expanded window to disk, only the flat array of integer
+character ids is kept. It is memory-mapped, and windows are strided views into it,
+so a batch is only copied into memory when it is gathered.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def save_sequence(ids, path):
+    """Save a flat array of token ids so that it can be memory-mapped later
+
+    Args:
+        ids (np.ndarray): A 1-dimensional array of token ids
+        path (str): Path to a .npy file
+    """
+    np.save(path, np.ascontiguousarray(ids))
+
+
+def load_sequence(path):
+    """Memory-map a flat array of token ids saved with `save_sequence`
+
+    Args:
+        path (str): Path to a .npy file
+
+    Returns:
+        np.ndarray: A read-only, memory-mapped array of token ids
+    """
+    return np.load(path, mmap_mode="r")
+
+
+def shuffled_indices(n, shuffle_buffer_size, rng):
+    """Shuffle the indices 0..n-1 while holding at most a bounded number of them at once
+
+    The indices are split into consecutive blocks of `shuffle_buffer_size`. Blocks are
+    visited in a random order, and each block is shuffled in place.
+
+    Args:
+        n (int): Number of indices
+        shuffle_buffer_size (int): Number of indices held in memory at once
+        rng (np.random.Generator): Source of randomness
+
+    Returns:
+        Iterator[np.ndarray]: Blocks of shuffled indices
+    """
+    block_starts = np.arange(0, n, shuffle_buffer_size)
+    for start in rng.permutation(block_starts):
+        yield start + rng.permutation(min(shuffle_buffer_size, n - start))
+
+
+def iter_windowed_batches(
+    ids, sequence_length, batch_size, shuffle_buffer_size=None, rng=None
+):
+    """Lazily yield batches of (window, next token) pairs from a flat array of token ids
+
+    Yields every window which has a next token, `len(ids) - sequence_length` in all.
+    These are the samples of `keras.utils.timeseries_dataset_from_array` with
+    `data=ids[:-sequence_length]` and `targets=ids[sequence_length:]`, followed by
+    the last `sequence_length - 1` windows, which that call drops because they run
+    past the end of its data.
+
+    Args:
+        ids (np.ndarray): A flat, possibly memory-mapped, array of token ids
+        sequence_length (int): Number of tokens in each input window
+        batch_size (int): Number of windows per batch
+        shuffle_buffer_size (int): If given, shuffle the windows with a buffer of
+            this many window indices. Otherwise, windows are yielded in order
+        rng (np.random.Generator): Source of randomness for shuffling
+
+    Returns:
+        Iterator[tuple[np.ndarray, np.ndarray]]: Batches of input windows of shape
+        (batch_size, sequence_length), and the token following each window
+    """
+    if len(ids) <= sequence_length:
+        return
+    # A strided view: no window is copied until it is gathered into a batch
+    windows = sliding_window_view(ids, sequence_length + 1)
+
+    for indices in _iter_index_batches(
+        len(windows), batch_size, shuffle_buffer_size, rng or np.random.default_rng()
+    ):
+        batch = windows[indices]
+        yield batch[:, :-1], batch[:, -1]
+
+
+def _iter_index_batches(n, batch_size, shuffle_buffer_size, rng):
+    """Split the indices 0..n-1 into batches, optionally shuffling them with a bounded buffer
+
+    Args:
+        n (int): Number of indices
+        batch_size (int): Number of indices per batch
+        shuffle_buffer_size (int): If given, shuffle the indices with a buffer of this
+            many indices. Otherwise, they are batched in order
+        rng (np.random.Generator): Source of randomness for shuffling
+
+    Returns:
+        Iterator[np.ndarray]: Batches of indices. Only the last may be smaller than
+        `batch_size`
+    """
+    if shuffle_buffer_size is None:
+        index_blocks = iter([np.arange(n)])
+    else:
+        index_blocks = shuffled_indices(n, shuffle_buffer_size, rng)
+
+    pending = np.zeros(0, dtype=np.int64)
+    for block in index_blocks:
+        pending = np.concatenate((pending, block))
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+    if len(pending) > 0:
+        yield pending
+
+
+def concatenate_poems(encoded_poems):
+    """Pack encoded poems into one contiguous buffer, with an index of where each starts
+
+    Args:
+        encoded_poems (list[np.ndarray]): The token ids of each poem
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The ids of every poem concatenated, and an
+        array of P+1 offsets, so that poem i is `ids[offsets[i]:offsets[i+1]]`
+    """
+    lengths = np.array([len(poem) for poem in encoded_poems], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    return np.concatenate(encoded_poems), offsets
+
+
+def poem_window_starts(offsets, window_length, poems=None):
+    """Find the start of every window which lies entirely within a single poem
+
+    Args:
+        offsets (np.ndarray): Poem offsets, as returned by `concatenate_poems`
+        window_length (int): Number of tokens in each window
+        poems (np.ndarray): If given, only the indices of the poems to take windows from
+
+    Returns:
+        np.ndarray: The position of the first token of every window in the buffer
+    """
+    poems = np.arange(len(offsets) - 1) if poems is None else np.asarray(poems)
+    poem_starts = offsets[poems]
+    windows_per_poem = np.maximum(offsets[poems + 1] - poem_starts - window_length + 1, 0)
+    # Each window's start is its poem's start plus its position within the poem
+    first_window = np.repeat(np.cumsum(windows_per_poem) - windows_per_poem, windows_per_poem)
+    return np.repeat(poem_starts, windows_per_poem) + (
+        np.arange(windows_per_poem.sum()) - first_window
+    )
+
+
+def iter_poem_batches(
+    ids,
+    offsets,
+    sequence_length,
+    batch_size,
+    bucket_sequence_lengths=(),
+    shuffle_buffer_size=None,
+    rng=None,
+):
+    """Lazily yield batches of (window, next token) pairs that never span two poems
+
+    Poems long enough hold windows of `sequence_length` tokens. A poem too short for
+    that is assigned to the longest bucket in `bucket_sequence_lengths` which fits it
+    and holds windows of that bucket's length instead, so short poems need no padding.
+    Every batch holds windows of a single length, and is gathered from the buffer
+    with one vectorized index.
+
+    Args:
+        ids (np.ndarray): A flat, possibly memory-mapped, buffer of token ids
+        offsets (np.ndarray): Poem offsets, as returned by `concatenate_poems`
+        sequence_length (int): Number of tokens in each input window
+        batch_size (int): Number of windows per batch
+        bucket_sequence_lengths (tuple[int]): Shorter input window lengths for poems
+            with fewer than `sequence_length` + 1 tokens. Poems too short for every
+            bucket are skipped
+        shuffle_buffer_size (int): If given, shuffle the windows of each length with a
+            buffer of this many window indices, and shuffle the order of the batches.
+            Otherwise, batches are yielded in order, longest windows first
+        rng (np.random.Generator): Source of randomness for shuffling
+
+    Returns:
+        Iterator[tuple[np.ndarray, np.ndarray]]: Batches of input windows of shape
+        (batch_size, window_length), and the token following each window
+    """
+    rng = rng or np.random.default_rng()
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    window_lengths = sorted({sequence_length, *bucket_sequence_lengths}, reverse=True)
+
+    # Each poem is assigned to the longest window length it can hold
+    unassigned = np.ones(len(lengths), dtype=bool)
+    batch_generators = []
+    for window_length in window_lengths:
+        fits = unassigned & (lengths >= window_length + 1)
+        unassigned &= ~fits
+        starts = poem_window_starts(offsets, window_length + 1, np.flatnonzero(fits))
+        batch_generators.append(
+            _iter_gathered_batches(
+                ids, starts, window_length + 1, batch_size, shuffle_buffer_size, rng
+            )
+        )
+
+    if shuffle_buffer_size is None:
+        for batches in batch_generators:
+            yield from batches
+        return
+    # Interleave the lengths at random, so that no epoch ends on all short windows
+    while batch_generators:
+        i = rng.integers(len(batch_generators))
+        batch = next(batch_generators[i], None)
+        if batch is None:
+            batch_generators.pop(i)
+        else:
+            yield batch
+
+
+def _iter_gathered_batches(ids, starts, window_length, batch_size, shuffle_buffer_size, rng):
+    """Gather batches of windows which start at the given positions of a buffer
+
+    Args:
+        ids (np.ndarray): A flat buffer of token ids
+        starts (np.ndarray): The position of the first token of each window
+        window_length (int): Number of tokens in each window, including the target
+        batch_size (int): Number of windows per batch
+        shuffle_buffer_size (int): If given, shuffle the windows with a buffer of
+            this many window indices
+        rng (np.random.Generator): Source of randomness for shuffling
+
+    Returns:
+        Iterator[tuple[np.ndarray, np.ndarray]]: Batches of input windows and targets
+    """
+    positions = np.arange(window_length)
+    for indices in _iter_index_batches(len(starts), batch_size, shuffle_buffer_size, rng):
+        batch = ids[starts[indices, None] + positions]
+        yield batch[:, :-1], batch[:, -1]
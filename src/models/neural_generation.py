@@ -0,0 +1,326 @@
+"""
+Incremental text generation with a trained character-based LSTM language model
+
+Running the Keras model on the whole sequence generated so far costs O(L) LSTM steps
+for every new character, so a poem of length L costs O(L^2) steps. Instead, the
+weights of a model built by `build_character_lstm_model` are copied out once, and
+the LSTM cells are stepped manually in NumPy, carrying their hidden state forward
+so that each new character costs a single step.
+"""
+
+import numpy as np
+
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 0.5 * (1 + np.tanh(0.5 * x)),
+    "relu": lambda x: np.maximum(x, 0),
+    "linear": lambda x: x,
+}
+
+
+def _activation(name):
+    """Look up a NumPy implementation of a Keras activation function
+
+    Args:
+        name (str): Name of the activation in the layer's config
+
+    Returns:
+        Callable[np.ndarray, np.ndarray]: The activation function
+    """
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation for incremental generation: {name}")
+    return ACTIVATIONS[name]
+
+
+class CharacterGenerator:
+    BOUNDARY_TOKENS = ("@", "$")
+
+    def __init__(self, model, vectorizer):
+        """Copy the weights out of a trained character-based LSTM model
+
+        Args:
+            model (keras.Sequential): A model built by `build_character_lstm_model`,
+                with or without an Embedding input layer, made of LSTM and Dropout
+                hidden layers and a softmax Dense output layer
+            vectorizer (Vectorizer): The vectorizer fit to the model's vocabulary
+        """
+        self.vectorizer = vectorizer
+        self.lstm_layers = []
+        self.output_layer = None
+        embeddings = None
+        for layer in model.layers:
+            layer_type = type(layer).__name__
+            config = layer.get_config()
+            if layer_type == "Dropout":
+                # Dropout is a no-op at inference time
+                continue
+            if self.output_layer is not None:
+                raise ValueError("The output Dense layer must be the model's last layer")
+            weights = layer.get_weights()
+            if layer_type == "Embedding":
+                embeddings = weights[0]
+            elif layer_type == "LSTM":
+                kernel, recurrent_kernel = weights[0], weights[1]
+                if not self.lstm_layers and embeddings is not None:
+                    # Fold the embedding into the first kernel, so that the input
+                    # projection stays a single row lookup
+                    kernel = embeddings @ kernel
+                bias = weights[2] if config["use_bias"] else np.zeros(kernel.shape[1])
+                self.lstm_layers.append(
+                    (
+                        kernel,
+                        recurrent_kernel,
+                        bias,
+                        _activation(config["activation"]),
+                        _activation(config["recurrent_activation"]),
+                    )
+                )
+            elif layer_type == "Dense":
+                if config["activation"] != "softmax":
+                    raise ValueError("The output Dense layer must use a softmax activation")
+                kernel = weights[0]
+                bias = weights[1] if config["use_bias"] else np.zeros(kernel.shape[1])
+                if not self.lstm_layers and embeddings is not None:
+                    kernel = embeddings @ kernel
+                self.output_layer = (kernel, bias)
+            else:
+                raise ValueError(f"Unsupported layer for incremental generation: {layer_type}")
+        if self.output_layer is None:
+            raise ValueError("The model must end with a softmax Dense layer")
+
+    def initial_state(self, batch_size=1):
+        """Get the hidden state of every LSTM layer before any input is seen
+
+        Args:
+            batch_size (int): Number of sequences to track state for
+
+        Returns:
+            list[tuple[np.ndarray, np.ndarray]]: The hidden and cell state of each LSTM
+            layer, each of shape (batch_size, units)
+        """
+        return [
+            (
+                np.zeros((batch_size, recurrent_kernel.shape[0]), dtype=np.float32),
+                np.zeros((batch_size, recurrent_kernel.shape[0]), dtype=np.float32),
+            )
+            for _, recurrent_kernel, _, _, _ in self.lstm_layers
+        ]
+
+    def step(self, token_ids, state):
+        """Advance the model by a single token
+
+        Args:
+            token_ids (np.ndarray): The id of the next input token of each sequence,
+                of shape (batch_size,)
+            state (list[tuple[np.ndarray, np.ndarray]]): The state returned by
+                `initial_state` or by the previous call to `step`
+
+        Returns:
+            tuple[np.ndarray, list[tuple[np.ndarray, np.ndarray]]]: The probability
+            distribution over the next token, of shape (batch_size, vocab_size), and
+            the new state
+        """
+        new_state = []
+        inputs = None
+        for i, (kernel, recurrent_kernel, bias, activation, recurrent_activation) in enumerate(
+            self.lstm_layers
+        ):
+            h, c = state[i]
+            # The first layer's inputs are one-hot (or embedded, with the embedding
+            # folded into the kernel), so multiplying by the kernel is a row lookup
+            projected = kernel[token_ids] if inputs is None else inputs @ kernel
+            z = projected + h @ recurrent_kernel + bias
+            input_gate, forget_gate, candidate, output_gate = np.split(z, 4, axis=-1)
+            c = recurrent_activation(forget_gate) * c + recurrent_activation(
+                input_gate
+            ) * activation(candidate)
+            h = recurrent_activation(output_gate) * activation(c)
+            new_state.append((h, c))
+            inputs = h
+
+        kernel, bias = self.output_layer
+        logits = (kernel[token_ids] if inputs is None else inputs @ kernel) + bias
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=-1, keepdims=True), new_state
+
+    def prime(self, seed_phrases):
+        """Run the model over a batch of seed phrases
+
+        Seed phrases may differ in length. Each row's state stops advancing once its
+        own seed phrase has been consumed.
+
+        Args:
+            seed_phrases (list[str]): Text to condition generation on, one per row.
+                Each must be non-empty
+
+        Returns:
+            tuple[np.ndarray, list[tuple[np.ndarray, np.ndarray]]]: The probability
+            distribution over the token after each seed phrase, of shape
+            (batch_size, vocab_size), and the state after each seed phrase
+        """
+        lengths = np.array([len(seed) for seed in seed_phrases])
+        seed_ids = np.zeros((len(seed_phrases), lengths.max()), dtype=np.int64)
+        for row, seed in enumerate(seed_phrases):
+            seed_ids[row, : len(seed)] = self.vectorizer.tokens_to_ints(seed)
+
+        state = self.initial_state(len(seed_phrases))
+        distributions = None
+        for position in range(seed_ids.shape[1]):
+            step_distributions, step_state = self.step(seed_ids[:, position], state)
+            if distributions is None:
+                distributions = step_distributions
+            still_priming = (position < lengths)[:, None]
+            distributions = np.where(still_priming, step_distributions, distributions)
+            state = [
+                (np.where(still_priming, h, old_h), np.where(still_priming, c, old_c))
+                for (h, c), (old_h, old_c) in zip(step_state, state)
+            ]
+        return distributions, state
+
+    def generate(self, seed_phrase, max_length=150, temperature=1.0, top_k=None, rng=None):
+        """Generate a poem which continues a seed phrase
+
+        Args:
+            seed_phrase (str): Text to condition generation on. Must be non-empty
+            max_length (int): Maximum number of characters to generate, in case a
+                poem boundary character is never sampled
+            temperature (float): Divides the model's log probabilities before sampling.
+                Values below 1 make generation more conservative
+            top_k (int): If given, only sample from the `top_k` most likely characters
+            rng (np.random.Generator): Source of randomness. Defaults to a fresh,
+                unseeded generator
+
+        Returns:
+            str: The seed phrase followed by the generated characters
+        """
+        return self.generate_batch(
+            [seed_phrase], max_length, temperature=temperature, top_k=top_k, rng=rng
+        )[0]
+
+    def iter_characters(
+        self, seed_phrase, max_length=150, temperature=1.0, top_k=None, rng=None
+    ):
+        """Lazily generate the characters which continue a seed phrase, one step at a time
+
+        The model is only advanced when the next character is requested, so the first
+        character costs priming the seed phrase and nothing more.
+
+        Args:
+            seed_phrase (str): Text to condition generation on. Must be non-empty
+            max_length (int): Maximum number of characters to generate
+            temperature (float): Divides the model's log probabilities before sampling
+            top_k (int): If given, only sample from the `top_k` most likely characters
+            rng (np.random.Generator): Source of randomness. Defaults to a fresh,
+                unseeded generator
+
+        Returns:
+            Iterator[str]: The generated characters, ending with a poem boundary
+            character if one is sampled before `max_length`
+        """
+        rng = rng or np.random.default_rng()
+        boundary_ids = [
+            self.vectorizer.token_to_int(token)
+            for token in self.BOUNDARY_TOKENS
+            if token in self.vectorizer.token_to_int_mapping
+        ]
+        distributions, state = self.prime([seed_phrase])
+        for position in range(max_length):
+            ids = sample_from_distributions(
+                distributions, temperature=temperature, top_k=top_k, rng=rng
+            )
+            yield self.vectorizer.int_to_token(int(ids[0]))
+            if ids[0] in boundary_ids or position == max_length - 1:
+                return
+            distributions, state = self.step(ids, state)
+
+    def generate_batch(
+        self, seed_phrases, max_length=150, temperature=1.0, top_k=None, rng=None
+    ):
+        """Generate many poems at once, advancing all of them in a single batched step
+
+        A row stops once it samples a poem boundary character, and finished rows are
+        dropped from the batch so that later steps only compute the unfinished poems.
+
+        Args:
+            seed_phrases (list[str]): Text to condition each poem on. Each must be
+                non-empty. To generate N poems from one seed, repeat it N times
+            max_length (int): Maximum number of characters to generate per poem, in
+                case a poem boundary character is never sampled
+            temperature (float | np.ndarray): Divides the model's log probabilities
+                before sampling, either for every poem or per poem
+            top_k (int): If given, only sample from the `top_k` most likely characters
+            rng (np.random.Generator): Source of randomness. Defaults to a fresh,
+                unseeded generator
+
+        Returns:
+            list[str]: Each seed phrase followed by its generated characters
+        """
+        rng = rng or np.random.default_rng()
+        temperature = np.broadcast_to(
+            np.asarray(temperature, dtype=np.float64), (len(seed_phrases),)
+        )
+        boundary_ids = [
+            self.vectorizer.token_to_int(token)
+            for token in self.BOUNDARY_TOKENS
+            if token in self.vectorizer.token_to_int_mapping
+        ]
+
+        distributions, state = self.prime(seed_phrases)
+        generated = np.zeros((len(seed_phrases), max_length), dtype=np.int64)
+        lengths = np.zeros(len(seed_phrases), dtype=np.int64)
+        rows = np.arange(len(seed_phrases))
+        for position in range(max_length):
+            ids = sample_from_distributions(
+                distributions, temperature=temperature[rows], top_k=top_k, rng=rng
+            )
+            generated[rows, position] = ids
+            lengths[rows] += 1
+
+            # If the character is one of the poem segmenting symbols, end early
+            unfinished = ~np.isin(ids, boundary_ids)
+            if not unfinished.all():
+                rows, ids = rows[unfinished], ids[unfinished]
+                state = [(h[unfinished], c[unfinished]) for h, c in state]
+            if len(rows) == 0 or position == max_length - 1:
+                break
+            distributions, state = self.step(ids, state)
+
+        generated_text = self.vectorizer.ints_to_strings(
+            generated[row, : lengths[row]] for row in range(len(seed_phrases))
+        )
+        return [seed + text for seed, text in zip(seed_phrases, generated_text)]
+
+
+def sample_from_distributions(distributions, temperature=1.0, top_k=None, rng=None):
+    """Sample one token id from each row of a batch of probability distributions
+
+    Args:
+        distributions (np.ndarray): Probability distributions of shape
+            (batch_size, vocab_size)
+        temperature (float | np.ndarray): Divides the log probabilities before
+            sampling, either for every row or per row. Must be positive
+        top_k (int): If given, only sample from the `top_k` most likely ids of each row
+        rng (np.random.Generator): Source of randomness. Defaults to a fresh,
+            unseeded generator
+
+    Returns:
+        np.ndarray: The sampled id of each row, of shape (batch_size,)
+    """
+    rng = rng or np.random.default_rng()
+    temperature = np.asarray(temperature, dtype=np.float64)
+    if temperature.ndim == 1:
+        temperature = temperature[:, None]
+    with np.errstate(divide="ignore"):
+        logits = np.log(distributions) / temperature
+    if top_k is not None and top_k < distributions.shape[1]:
+        kth_largest = np.partition(logits, -top_k, axis=1)[:, -top_k, None]
+        logits = np.where(logits >= kth_largest, logits, -np.inf)
+    weights = np.exp(logits - logits.max(axis=1, keepdims=True))
+
+    cumulative_weights = np.cumsum(weights, axis=1)
+    thresholds = rng.random(len(weights))[:, None] * cumulative_weights[:, -1:]
+    ids = (cumulative_weights <= thresholds).sum(axis=1)
+    # Guard against floating point error when a threshold rounds up to the total
+    return np.minimum(ids, weights.shape[1] - 1)
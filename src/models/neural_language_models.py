@@ -6,11 +6,11 @@ The implementation was adapted from my homework 4 submission.
 
 import keras
 from keras.models import Sequential
-from keras.layers import Dense
+from keras.layers import Dense, Embedding
 from keras.optimizers import Adam 
 
 
-def build_character_lstm_model(vocab_size, hidden_layers, lr):
+def build_character_lstm_model(vocab_size, hidden_layers, lr, embedding_dim=None):
     """Build a character-based LSTM neural language model
 
     A character-based model predicts the next character in a sequence of characters.
@@ -18,6 +18,10 @@ def build_character_lstm_model(vocab_size, hidden_layers, lr):
     here indicates that a single sequence can be arbitrary length. In the context
     of this project, that is important because poems are arbitrary in length.
 
+    If `embedding_dim` is given, the model instead accepts batches of integer character
+    ids of shape (batch_size, Any), embeds them, and is trained against integer ids
+    rather than one-hot targets.
+
     Args:
         vocab_size (PositiveInteger):
             The size of the vocabulary
@@ -25,16 +29,24 @@ def build_character_lstm_model(vocab_size, hidden_layers, lr):
             A list of hidden layers to add to the model
         lr (float): 
             Learning rate
+        embedding_dim (PositiveInteger):
+            If given, the size of the embedding of integer character ids
 
     Returns:
         keras.Sequential: A Keras Sequential neural network which uses an LSTM layer.
     """
     model = Sequential()
-    model.add(keras.Input(shape=(None, vocab_size)))  # `None` indicates the sequence is of arbitrary length
+    if embedding_dim is None:
+        model.add(keras.Input(shape=(None, vocab_size)))  # `None` indicates the sequence is of arbitrary length
+        loss = "categorical_crossentropy"
+    else:
+        model.add(keras.Input(shape=(None,), dtype="int32"))
+        model.add(Embedding(vocab_size, embedding_dim))
+        loss = "sparse_categorical_crossentropy"
     for layer in hidden_layers:
         model.add(layer)
     model.add(Dense(vocab_size, activation="softmax"))
-    model.compile(loss="categorical_crossentropy", optimizer=Adam(learning_rate=lr))
+    model.compile(loss=loss, optimizer=Adam(learning_rate=lr))
     model.build()
     return model
 
@@ -4,9 +4,14 @@ This module implements a basic n-gram language model
 The implementation was adapted from my homework 2 submission.
 """
 
+import itertools
+import json
+import multiprocessing
+import os
 import random
+import threading
+from collections import OrderedDict
 
-from nltk.util import ngrams
 import numpy as np
 
 
@@ -15,24 +20,67 @@ class LanguageModel:
     POEM_BEGIN = "<p>"
     POEM_END = "</p>"
 
-    def __init__(self, n, is_laplace_smoothing, replacement_threshold=2):
+    METADATA_FILE = "metadata.json"
+    VOCABULARY_FILE = "vocabulary.json"
+    ARRAY_FILES = {
+        "_context_keys": "context_keys.bin",
+        "_context_offsets": "context_offsets.bin",
+        "n_gram_keys": "n_gram_keys.bin",
+        "n_gram_counts": "n_gram_counts.bin",
+        "_cumulative_counts": "cumulative_counts.bin",
+    }
+    # Bump whenever the arrays `save` writes change, so that older models are not misread
+    FORMAT_VERSION = 2
+
+    def __init__(
+        self,
+        n,
+        is_laplace_smoothing,
+        replacement_threshold=2,
+        use_sampling_tables=True,
+        cache_size=10_000,
+    ):
         """Initializes an untrained LanguageModel
 
         Parameters:
             n_gram (int): the n-gram order of the language model to create
             is_laplace_smoothing (bool): whether or not to use Laplace smoothing
             replacement_threshold (int): how many times a token must appear to be kept
+            use_sampling_tables (bool): whether or not to cache the cumulative
+                                        distribution tables tokens are sampled from.
+                                        Generation revisits the same prefixes, such as
+                                        the POEM_BEGIN symbols, over and over
+            cache_size (int): how many prefixes' counts, distributions and sampling
+                              tables to cache, each keeping the most recently used.
+                              0 disables caching, and None leaves the caches unbounded
         """
         self.n = n
         self.is_laplace_smoothing = is_laplace_smoothing
         self.replacement_threshold = replacement_threshold
-        self.token_frequency_distribution = None
-        self.n_gram_frequencies = None
+        self.use_sampling_tables = use_sampling_tables
+        self.cache_size = cache_size
+        self._prefix_counts = LRUCache(cache_size)
+        self._distributions = LRUCache(cache_size)
+        self._sampling_tables = LRUCache(cache_size if use_sampling_tables else 0)
+        # The directory the model was loaded from, while its arrays still map its files
+        self._loaded_from = None
         self.vocabulary = None
+        self.token_ids = None
+        # The keys of the n-grams' prefixes of every length from 1 to n-1, concatenated
+        self._context_keys = None
+        self._context_offsets = None
+        self._levels = None
+        self.n_gram_keys = None
+        self.n_gram_counts = None
+        self._cumulative_counts = None
 
     def train(self, tokens):
         """Trains the language model on tokens
 
+        Tokens are interned to integer ids, and every prefix of the n-grams is interned
+        to a dense id, so the counts are stored as a trie of sorted NumPy arrays rather
+        than a dictionary of tuples of strings (see `count_ngrams`).
+
         Parameters:
             tokens (list[str]): Tokens to use for training. Each poem must be wrapped
                                 with n-1 POEM_START and POEM_END symbols
@@ -40,17 +88,334 @@ class LanguageModel:
         Returns:
           None
         """
-        # TODO: Can frequency_distribution just be replaced with Counter() ??
-        self.token_frequency_distribution = frequency_distribution(tokens)
-        tokens = replace_infrequent_tokens(
-            tokens,
-            self.token_frequency_distribution,
-            threshold=self.replacement_threshold,
-            replacement_token=self.UNK,
+        self._set_vocabulary(
+            build_vocabulary(
+                frequency_distribution(tokens), self.replacement_threshold, self.UNK
+            )
+        )
+        self._set_counts(
+            *count_ngrams(ngram_id_rows(self.encode(tokens), self.n), len(self.vocabulary))
+        )
+
+    def train_parallel(self, tokens, processes=None, num_shards=None):
+        """Trains the language model on tokens, counting shards of them in a process pool
+
+        The tokens are split into contiguous shards. Each shard is counted in its own
+        process and the count tables are merged, which gives exactly the same model
+        as `train`.
+
+        Parameters:
+            tokens (list[str]): Tokens to use for training. Each poem must be wrapped
+                                with n-1 POEM_START and POEM_END symbols
+            processes (int): Number of worker processes. Defaults to the number of CPUs
+            num_shards (int): Number of shards to split the tokens into. Defaults to
+                              four per worker process
+
+        Returns:
+          None
+        """
+        processes = processes or os.cpu_count()
+        num_shards = num_shards or 4 * processes
+        shard_size = max(1, -(-len(tokens) // num_shards))
+        shard_starts = range(0, max(1, len(tokens)), shard_size)
+
+        with multiprocessing.Pool(processes) as pool:
+            token_frequencies = {}
+            shard_frequencies = pool.map(
+                frequency_distribution,
+                (tokens[i : i + shard_size] for i in shard_starts),
+            )
+            for frequencies in shard_frequencies:
+                for token, count in frequencies.items():
+                    token_frequencies[token] = token_frequencies.get(token, 0) + count
+            self._set_vocabulary(
+                build_vocabulary(token_frequencies, self.replacement_threshold, self.UNK)
+            )
+
+            # Shards overlap by n-1 tokens so that every n-gram is counted exactly once
+            shard_counts = pool.map(
+                _count_shard,
+                (
+                    (tokens[i : i + shard_size + self.n - 1], self.token_ids, self.UNK, self.n)
+                    for i in shard_starts
+                ),
+            )
+        self._set_counts(*merge_ngram_counts(shard_counts, len(self.vocabulary)))
+
+    def train_from_stream(self, make_poems, chunk_size=1_000_000):
+        """Trains the language model on a stream of poems without materializing the corpus
+
+        The stream is read twice: once to count tokens and build the vocabulary, and
+        once to encode the tokens and count n-grams in chunks of `chunk_size` tokens.
+        Peak memory is bounded by the chunk size and the size of the count tables,
+        not by the size of the corpus. The result is the same as calling `train` on
+        all of the poems' tokens concatenated.
+
+        Parameters:
+            make_poems (Callable[[], Iterable[list[str]]]): Returns a fresh iterable of
+                poems each time it is called. Each poem is a list of tokens wrapped with
+                n-1 POEM_START and POEM_END symbols
+            chunk_size (int): Number of tokens to encode and count at a time
+
+        Returns:
+          None
+        """
+        token_frequencies = {}
+        for poem in make_poems():
+            for token in poem:
+                token_frequencies[token] = token_frequencies.get(token, 0) + 1
+        self._set_vocabulary(
+            build_vocabulary(token_frequencies, self.replacement_threshold, self.UNK)
+        )
+        del token_frequencies
+
+        base = len(self.vocabulary)
+        counts = count_ngrams(np.zeros((0, self.n), dtype=np.int32), base)
+        # The last n-1 ids of each chunk start the next one, so that the n-grams
+        # spanning two chunks are counted exactly once
+        carry = np.zeros(0, dtype=np.int32)
+        chunk = []
+        for poem in itertools.chain(make_poems(), [None]):
+            if poem is not None:
+                chunk.extend(poem)
+            if len(chunk) >= chunk_size or (poem is None and chunk):
+                ids = np.concatenate((carry, self.encode(chunk)))
+                counts = merge_ngram_counts(
+                    [counts, count_ngrams(ngram_id_rows(ids, self.n), base)], base
+                )
+                carry = ids[len(ids) - (self.n - 1) :] if self.n > 1 else ids[:0]
+                chunk = []
+        self._set_counts(*counts)
+
+    def update(self, tokens):
+        """Adds more tokens to a trained language model without recounting its corpus
+
+        The vocabulary is not re-derived: tokens which are not in it are replaced
+        with UNK, which is added to the vocabulary if it is not already there.
+
+        Parameters:
+            tokens (list[str]): Tokens to add. Each poem must be wrapped with n-1
+                                POEM_START and POEM_END symbols
+
+        Returns:
+          None
+        """
+        old_rows = unpack_ngrams(self._levels[:-1], self.n_gram_keys, len(self.vocabulary))
+        if self.UNK not in self.token_ids and any(
+            token not in self.token_ids for token in tokens
+        ):
+            self._set_vocabulary(self.vocabulary + [self.UNK])
+        new_rows = ngram_id_rows(self.encode(tokens), self.n)
+        self._set_counts(
+            *count_ngrams(
+                np.concatenate((old_rows, new_rows)),
+                len(self.vocabulary),
+                weights=np.concatenate((self.n_gram_counts, np.ones(len(new_rows)))),
+            )
+        )
+
+    def _set_vocabulary(self, vocabulary):
+        """Sets the vocabulary of the model and interns its tokens to ids
+
+        Parameters:
+            vocabulary (list[str]): The tokens of the vocabulary, in id order
+
+        Returns:
+          None
+        """
+        self.vocabulary = vocabulary
+        self.token_ids = {token: i for i, token in enumerate(vocabulary)}
+
+    def _set_counts(self, context_keys, n_gram_keys, n_gram_counts):
+        """Sets the n-gram count table of the model
+
+        Parameters:
+            context_keys (list[np.ndarray]): The keys of the n-grams' prefixes of
+                                             lengths 1 to n-1
+            n_gram_keys (np.ndarray): Sorted, unique n-gram keys
+            n_gram_counts (np.ndarray): The count of each n-gram
+
+        Returns:
+          None
+        """
+        self._context_keys = np.concatenate([np.zeros(0, dtype=np.int64)] + context_keys)
+        self._context_offsets = np.cumsum([0] + [len(keys) for keys in context_keys])
+        self.n_gram_keys = n_gram_keys
+        self.n_gram_counts = n_gram_counts
+        self._cumulative_counts = np.concatenate(([0], np.cumsum(n_gram_counts)))
+        self._set_levels()
+        self._loaded_from = None
+        self.clear_caches()
+
+    def _set_levels(self):
+        """Split the concatenated prefix keys back into the levels of the count trie
+
+        Returns:
+          None
+        """
+        offsets = np.asarray(self._context_offsets).tolist()
+        self._levels = [
+            self._context_keys[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])
+        ] + [self.n_gram_keys]
+
+    def clear_caches(self):
+        """Drops every cached prefix count, distribution and sampling table
+
+        Training and updating the model call this, since they change the counts the
+        cached values were computed from.
+
+        Returns:
+          None
+        """
+        self._prefix_counts.clear()
+        self._distributions.clear()
+        self._sampling_tables.clear()
+
+    def cache_info(self):
+        """Get the size and hit and miss counts of each of the model's caches
+
+        Returns:
+          dict[str, dict[str, int]]: The `LRUCache.info` of the "prefix_counts",
+                                     "distributions" and "sampling_tables" caches
+        """
+        return {
+            "prefix_counts": self._prefix_counts.info(),
+            "distributions": self._distributions.info(),
+            "sampling_tables": self._sampling_tables.info(),
+        }
+
+    def save(self, path):
+        """Saves a trained model to a directory
+
+        The n-gram arrays are written as flat binary files so that `load` can memory-map
+        them instead of deserializing them. Every file is written under a temporary
+        name and renamed into place, with the metadata last, so a model can be saved
+        over one which processes still have memory-mapped: they keep reading the old
+        files until they load the model again.
+
+        Parameters:
+            path (str): Directory to save the model in. It is created if it does not exist
+
+        Returns:
+          None
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = {}
+        for attribute, filename in self.ARRAY_FILES.items():
+            array = np.ascontiguousarray(getattr(self, attribute))
+            write_file_atomically(os.path.join(path, filename), array.tofile, binary=True)
+            arrays[attribute] = {"dtype": array.dtype.str, "length": len(array)}
+        metadata = {
+            **self._parameters(),
+            "format_version": self.FORMAT_VERSION,
+            "arrays": arrays,
+        }
+        write_file_atomically(
+            os.path.join(path, self.VOCABULARY_FILE),
+            lambda outfile: json.dump(self.vocabulary, outfile),
         )
-        self.vocabulary = set(tokens)
-        self.n_gram_frequencies = frequency_distribution(
-            ngrams(tokens, self.n)
+        write_file_atomically(
+            os.path.join(path, self.METADATA_FILE),
+            lambda outfile: json.dump(metadata, outfile),
+        )
+
+    def _parameters(self):
+        """Get the constructor arguments which `save` records alongside the counts
+
+        Returns:
+          dict: Keyword arguments which recreate an untrained copy of this model
+        """
+        return {
+            "n": self.n,
+            "is_laplace_smoothing": self.is_laplace_smoothing,
+            "replacement_threshold": self.replacement_threshold,
+        }
+
+    @classmethod
+    def load(cls, path, use_sampling_tables=True, cache_size=10_000):
+        """Loads a model saved with `save`
+
+        The n-gram arrays are memory-mapped read-only, so loading does not read them
+        into memory, and processes which load the same model share one copy of it
+        through the page cache.
+
+        Parameters:
+            path (str): Directory the model was saved in
+            use_sampling_tables (bool): whether or not to cache the cumulative
+                                        distribution tables tokens are sampled from
+            cache_size (int): how many prefixes to cache values for
+
+        Returns:
+          LanguageModel: The trained model
+        """
+        with open(os.path.join(path, cls.METADATA_FILE)) as infile:
+            metadata = json.load(infile)
+        if metadata.get("format_version") != cls.FORMAT_VERSION:
+            raise ValueError(
+                f"The model in {path} was saved in format version "
+                f"{metadata.get('format_version', 1)}, expected {cls.FORMAT_VERSION}. "
+                "Train and save it again"
+            )
+        with open(os.path.join(path, cls.VOCABULARY_FILE)) as infile:
+            vocabulary = json.load(infile)
+
+        parameters = {
+            key: value
+            for key, value in metadata.items()
+            if key not in ("arrays", "format_version")
+        }
+        model = cls(
+            **parameters, use_sampling_tables=use_sampling_tables, cache_size=cache_size
+        )
+        model.vocabulary = vocabulary
+        model.token_ids = {token: i for i, token in enumerate(vocabulary)}
+        for attribute, filename in cls.ARRAY_FILES.items():
+            dtype = np.dtype(metadata["arrays"][attribute]["dtype"])
+            length = metadata["arrays"][attribute]["length"]
+            if length == 0:
+                # Empty files cannot be memory-mapped
+                array = np.zeros(0, dtype=dtype)
+            else:
+                array = np.memmap(
+                    os.path.join(path, filename), dtype=dtype, mode="r", shape=(length,)
+                )
+            setattr(model, attribute, array)
+        model._set_levels()
+        model._loaded_from = path
+        return model
+
+    @property
+    def n_gram_frequencies(self):
+        """The n-gram counts of a trained model as a mapping of {N-gram -> Count}
+
+        The mapping is decoded from the array-backed counts every time it is accessed,
+        so it is meant for inspection rather than for lookups.
+        """
+        if self.n_gram_keys is None:
+            return None
+        id_rows = unpack_ngrams(self._levels[:-1], self.n_gram_keys, len(self.vocabulary))
+        return {
+            tuple(self.vocabulary[i] for i in row): int(count)
+            for row, count in zip(id_rows.tolist(), self.n_gram_counts)
+        }
+
+    def encode(self, tokens):
+        """Convert tokens into their integer ids in the vocabulary
+
+        Tokens outside of the vocabulary are mapped to the id of UNK, or to -1 if
+        UNK is not part of the vocabulary.
+
+        Parameters:
+          tokens (list[str]): A sequence of tokens
+
+        Returns:
+          np.ndarray: An array of token ids
+        """
+        unk_id = self.token_ids.get(self.UNK, -1)
+        return np.fromiter(
+            (self.token_ids.get(token, unk_id) for token in tokens),
+            dtype=np.int32,
+            count=len(tokens),
         )
 
     def score(self, tokens):
@@ -62,17 +427,82 @@ class LanguageModel:
         Returns:
           float: the probability value of the given string for this model
         """
-        tokens = replace_infrequent_tokens(
-            tokens,
-            self.token_frequency_distribution,
-            threshold=self.replacement_threshold,
-            replacement_token=self.UNK,
+        log_probabilities, _ = self.score_batch([tokens])
+        return np.exp(log_probabilities[0])
+
+    def score_batch(self, poems):
+        """Calculates the log probability and perplexity of many poems in one vectorized pass
+
+        All poems are encoded into a single array of token ids, and the counts of every
+        n-gram and n-gram prefix are gathered with binary searches over the sorted
+        n-gram keys. Results stay in log space, so long poems do not underflow to 0.
+
+        Parameters:
+          poems (list[list[str]]): A list of poems, each a sequence of tokens or an
+            array of token ids, such as `generate_poem(..., return_ids=True)` returns
+
+        Returns:
+          tuple[np.ndarray, np.ndarray]: The log probability of each poem, and the
+                                         perplexity of each poem (NaN for poems
+                                         shorter than n tokens)
+        """
+        base = len(self.vocabulary)
+        ids, starts, poem_of_ngram = self._encode_ngrams(poems)
+        id_rows = ngram_id_rows(ids, self.n)[starts]
+
+        # Prefixes and n-grams with unknown (-1) tokens are never found
+        prefix_indices, prefix_found = find_ngram_prefixes(self._levels, id_rows[:, :-1], base)
+        prefix_starts, prefix_stops = ngram_prefix_ranges(
+            self._levels, prefix_indices, self.n - 1, base
+        )
+        ngram_prefix_freqs = np.where(
+            prefix_found,
+            self._cumulative_counts[prefix_stops] - self._cumulative_counts[prefix_starts],
+            0,
         )
-        n_grams = ngrams(tokens, self.n)
-        log_probabilities = [
-            self.maximum_likelihood_estimate(ng) for ng in n_grams
+        positions, found = extend_ngram_prefixes(
+            self.n_gram_keys, prefix_indices, prefix_found, id_rows[:, -1], base
+        )
+        ngram_freqs = np.zeros(len(starts), dtype=np.int64)
+        ngram_freqs[found] = self.n_gram_counts[positions[found]]
+        if self.is_laplace_smoothing:
+            ngram_freqs = ngram_freqs + 1
+            ngram_prefix_freqs = ngram_prefix_freqs + base
+
+        # Only take logs of seen n-grams, whose prefixes were necessarily seen too
+        seen = ngram_freqs > 0
+        ngram_log_probabilities = np.full(len(ngram_freqs), -np.inf)
+        ngram_log_probabilities[seen] = np.log(ngram_freqs[seen]) - np.log(
+            ngram_prefix_freqs[seen]
+        )
+        return sum_poem_scores(ngram_log_probabilities, poem_of_ngram, len(poems))
+
+    def _encode_ngrams(self, poems):
+        """Encode a batch of poems and find every n-gram which lies within a single poem
+
+        Parameters:
+          poems (list[list[str]]): A list of poems, each a sequence of tokens or an
+            array of token ids, such as `generate_poem(..., return_ids=True)` returns
+
+        Returns:
+          tuple[np.ndarray, np.ndarray, np.ndarray]: The ids of every poem concatenated,
+            with unknown tokens as -1, the position of the first token of each n-gram,
+            and the poem each n-gram belongs to
+        """
+        encoded = [
+            poem if isinstance(poem, np.ndarray) else self.encode(poem) for poem in poems
         ]
-        return np.exp(np.sum(log_probabilities))
+        lengths = np.array([len(ids) for ids in encoded], dtype=np.int64)
+        ids = np.concatenate(encoded) if encoded else np.zeros(0, dtype=np.int32)
+
+        # Only keep the n-grams which lie entirely within a single poem
+        poem_ends = np.cumsum(lengths)
+        poem_of_position = np.repeat(np.arange(len(poems)), lengths)
+        is_ngram_start = (
+            np.arange(len(ids)) + self.n <= poem_ends[poem_of_position]
+        )
+        starts = np.flatnonzero(is_ngram_start)
+        return ids, starts, poem_of_position[starts]
 
     def maximum_likelihood_estimate(self, n_gram):
         """Calculates the MLE as a relative frequency in log probability for a single n_gram.
@@ -88,7 +518,7 @@ class LanguageModel:
         Returns
           float: the probability value of the given n_gram for this model
         """
-        ngram_freq = self.n_gram_frequencies.get(n_gram, 0)
+        ngram_freq = self.count_ngrams_with_prefix(n_gram)
         ngram_prefix_freq = self.count_ngrams_with_prefix(n_gram[:-1])
         if self.is_laplace_smoothing:
             ngram_freq += 1
@@ -97,67 +527,225 @@ class LanguageModel:
         with np.errstate(divide="ignore"):
             return np.log(ngram_freq / ngram_prefix_freq)
 
-    def generate_poem(self, max_words):
+    def generate_poem(
+        self, max_words, temperature=1.0, top_k=None, top_p=None, rng=None, return_ids=False
+    ):
         """Generates a single poem from a trained language model using the Shannon technique.
 
+        The sampled token ids are collected in a buffer sized for the longest possible
+        poem, and the poem is only joined into a string once it is complete.
+
         Parameters:
-            max_words (int): Maximum number of words in the poem
+            max_words (int): Maximum number of words in the poem, counting its
+                             POEM_BEGIN symbols as one word
+            temperature (float): Raises the weight of each candidate token to the power
+                                 1 / temperature. Values below 1 make generation more
+                                 conservative
+            top_k (int): If given, only sample from the `top_k` most likely tokens
+            top_p (float): If given, only sample from the most likely tokens whose
+                           probabilities sum to at least `top_p`
+            rng (random.Random): Source of randomness. Defaults to the `random` module
+            return_ids (bool): Whether to return the poem's token ids rather than a string
 
         Returns:
-          str: the generated poem
+          str: the generated poem, or if `return_ids` is set, np.ndarray: the ids of its
+               tokens, wrapped with n-1 POEM_BEGIN and, if the poem ended before
+               `max_words`, n-1 POEM_END ids like a training poem, ready for `score_batch`
         """
-        poem = "<p>" * max(1, (self.n - 1))
-        current_prefix = tuple(
-            [self.POEM_BEGIN for _ in range((self.n - 1))]
+        num_padding = self.n - 1
+        token_ids = np.empty(2 * num_padding + max(1, max_words - 1), dtype=np.int32)
+        if num_padding:
+            token_ids[:num_padding] = self.token_ids[self.POEM_BEGIN]
+        num_tokens = num_padding
+        for token_id in self._iter_poem_token_ids(max_words, temperature, top_k, top_p, rng):
+            token_ids[num_tokens] = token_id
+            num_tokens += 1
+        ended = (
+            num_tokens > num_padding
+            and self.vocabulary[token_ids[num_tokens - 1]] == self.POEM_END
         )
-        while True:
-            predicted_token = self.sample_token_given_prefix(current_prefix)
-            if predicted_token == self.POEM_END:
-                poem += self.POEM_END * max(1, (self.n - 1))
-                return poem
-            else:
-                poem += (" " + predicted_token)
-                if self.n > 1:
-                    current_prefix = current_prefix[1:] + (predicted_token,)
 
-            if len(poem.split()) >= max_words:
-                return poem
+        if return_ids:
+            if ended and num_padding > 1:
+                token_ids[num_tokens : num_tokens + num_padding - 1] = token_ids[num_tokens - 1]
+                num_tokens += num_padding - 1
+            return token_ids[:num_tokens].copy()
 
-    def sample_token_given_prefix(self, prefix):
+        words = [
+            self.vocabulary[token_id]
+            for token_id in token_ids[num_padding : num_tokens - ended].tolist()
+        ]
+        poem = self.POEM_BEGIN * max(1, num_padding)
+        if words:
+            poem += " " + " ".join(words)
+        if ended:
+            poem += self.POEM_END * max(1, num_padding)
+        return poem
+
+    def iter_poem_tokens(self, max_words, temperature=1.0, top_k=None, top_p=None, rng=None):
+        """Lazily generate the tokens of a single poem, one sampled token at a time
+
+        Parameters:
+            max_words (int): Maximum number of words in the poem, counting its
+                             POEM_BEGIN symbols as one word like `generate_poem` does
+            temperature (float): Raises the weight of each candidate token to the power
+                                 1 / temperature
+            top_k (int): If given, only sample from the `top_k` most likely tokens
+            top_p (float): If given, only sample from the most likely tokens whose
+                           probabilities sum to at least `top_p`
+            rng (random.Random): Source of randomness. Defaults to the `random` module
+
+        Returns:
+            Iterator[str]: The sampled tokens, ending with POEM_END if it is sampled
+                           before the poem reaches `max_words`
+        """
+        for token_id in self._iter_poem_token_ids(max_words, temperature, top_k, top_p, rng):
+            yield self.vocabulary[token_id]
+
+    def _iter_poem_token_ids(self, max_words, temperature, top_k, top_p, rng):
+        """Lazily sample the token ids of a single poem, as `iter_poem_tokens` does
+
+        Parameters:
+            max_words (int): Maximum number of words in the poem, counting its
+                             POEM_BEGIN symbols as one word
+            temperature (float): Raises the weight of each candidate token to the power
+                                 1 / temperature
+            top_k (int): If given, only sample from the `top_k` most likely tokens
+            top_p (float): If given, only sample from the most likely tokens whose
+                           probabilities sum to at least `top_p`
+            rng (random.Random): Source of randomness. None uses the `random` module
+
+        Returns:
+            Iterator[int]: The ids of the sampled tokens, ending with the id of
+                           POEM_END if it is sampled before the poem reaches `max_words`
+        """
+        current_prefix = tuple(self.POEM_BEGIN for _ in range(self.n - 1))
+        for _ in range(max(1, max_words - 1)):
+            token_id = self._sample_token_id(current_prefix, temperature, top_k, top_p, rng)
+            yield token_id
+            predicted_token = self.vocabulary[token_id]
+            if predicted_token == self.POEM_END:
+                return
+            if self.n > 1:
+                current_prefix = current_prefix[1:] + (predicted_token,)
+
+    def sample_token_given_prefix(
+        self, prefix, temperature=1.0, top_k=None, top_p=None, rng=None
+    ):
         """Samples a token given some prefix sequence of tokens
 
         Parameters:
             prefix (tuple[str]): An n_gram of length n-1
+            temperature (float): Raises the weight of each candidate token to the power
+                                 1 / temperature
+            top_k (int): If given, only sample from the `top_k` most likely tokens
+            top_p (float): If given, only sample from the most likely tokens whose
+                           probabilities sum to at least `top_p`
+            rng (random.Random): Source of randomness. Defaults to the `random` module
 
         Returns:
             token (str): A randomly sampled token given the prefix
         """
-        distribution = self.next_token_prob_dist_given_prefix(prefix)
-        candidate_tokens = list(distribution.keys())
-        choice = random.choices(
-            candidate_tokens, weights=distribution.values(), k=1
-        )[0]
-        return choice
+        return self.vocabulary[self._sample_token_id(prefix, temperature, top_k, top_p, rng)]
+
+    def _sample_token_id(self, prefix, temperature, top_k, top_p, rng):
+        """Samples the id of a token given some prefix sequence of tokens
+
+        Parameters:
+            prefix (tuple[str]): An n_gram of length n-1
+            temperature (float): Raises the weight of each candidate token to the power
+                                 1 / temperature
+            top_k (int): If given, only sample from the `top_k` most likely tokens
+            top_p (float): If given, only sample from the most likely tokens whose
+                           probabilities sum to at least `top_p`
+            rng (random.Random): Source of randomness. None uses the `random` module
+
+        Returns:
+            int: The id of a randomly sampled token given the prefix
+        """
+        candidate_ids, cumulative_weights = self.sampling_table(
+            prefix, temperature=temperature, top_k=top_k, top_p=top_p
+        )
+        return int(candidate_ids[sample_from_cumulative_weights(cumulative_weights, rng)])
+
+    def sampling_table(self, prefix, temperature=1.0, top_k=None, top_p=None):
+        """Get the cumulative distribution table used to sample the token after a prefix
+
+        If the model uses sampling tables, each table is cached for its prefix and
+        sampling options.
+
+        Parameters:
+            prefix (tuple[str]): An sequence of tokens of length n-1
+            temperature (float): Raises the weight of each candidate token to the power
+                                 1 / temperature
+            top_k (int): If given, only keep the `top_k` most likely tokens
+            top_p (float): If given, only keep the most likely tokens whose
+                           probabilities sum to at least `top_p`
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The ids of the candidate tokens that could come
+                                           after the prefix, and their cumulative weights
+        """
+        return self._sampling_tables.get_or_compute(
+            (prefix, temperature, top_k, top_p),
+            lambda: truncate_sampling_table(
+                *self._candidate_weights(prefix),
+                temperature=temperature,
+                top_k=top_k,
+                top_p=top_p,
+            ),
+        )
+
+    def _candidate_weights(self, prefix):
+        """Get the tokens which could come after a prefix, and their unnormalized weights
+
+        Parameters:
+            prefix (tuple[str]): An sequence of tokens of length n-1
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The ids of the candidate tokens, and the
+                                           count of each after the prefix
+        """
+        start, stop = self._prefix_range(prefix)
+        candidate_ids = self.n_gram_keys[start:stop] % len(self.vocabulary)
+        counts = self.n_gram_counts[start:stop]
+        keep = candidate_ids != self.token_ids.get("<s>", -1)
+        if not keep.any():
+            raise ValueError(f"No tokens follow the prefix {prefix}")
+        return candidate_ids[keep].astype(np.int32), counts[keep]
 
     def next_token_prob_dist_given_prefix(self, prefix):
         """Get the probability distribution for the next token given some sequence of tokens
 
+        Distributions are cached per prefix, so the returned dict must not be modified.
+
         Parameters:
             prefix (tuple[str]): An sequence of tokens of length n-1
 
         Returns:
             dict[str, float]: Probability distribution of tokens that could come after the given sequence
         """
-        ngram_prefix_freq = self.count_ngrams_with_prefix(prefix)
-        candidate_tokens = [
-            ng[-1]
-            for ng in self.n_gram_frequencies.keys()
-            if (ng[:-1] == prefix) and (ng[-1] != "<s>")
-        ]
+        return self._distributions.get_or_compute(
+            tuple(prefix), lambda: self._next_token_prob_dist(prefix)
+        )
+
+    def _next_token_prob_dist(self, prefix):
+        """Compute the probability distribution for the next token given some sequence of tokens
+
+        Parameters:
+            prefix (tuple[str]): An sequence of tokens of length n-1
+
+        Returns:
+            dict[str, float]: Probability distribution of tokens that could come after the given sequence
+        """
+        start, stop = self._prefix_range(prefix)
+        ngram_prefix_freq = self._cumulative_counts[stop] - self._cumulative_counts[start]
+        candidate_ids = self.n_gram_keys[start:stop] % len(self.vocabulary)
         prob_dist = dict()
-        for token in candidate_tokens:
-            ngram_freq = self.n_gram_frequencies.get(prefix + (token,))
-            prob_dist[token] = ngram_freq / ngram_prefix_freq
+        for i, ngram_freq in zip(candidate_ids, self.n_gram_counts[start:stop]):
+            token = self.vocabulary[i]
+            if token != "<s>":
+                prob_dist[token] = ngram_freq / ngram_prefix_freq
         return prob_dist
 
     def count_ngrams_with_prefix(self, prefix):
@@ -169,23 +757,568 @@ class LanguageModel:
         Returns:
           The numer of ngrams which have the same prefix as the given prefix
         """
-        return sum(
-            [
-                count
-                for ng, count in self.n_gram_frequencies.items()
-                if ng[0 : len(prefix)] == prefix
-            ]
+        return self._prefix_counts.get_or_compute(tuple(prefix), lambda: self._count(prefix))
+
+    def _count(self, prefix):
+        """Count the ngrams which have some prefix, without going through the cache
+
+        Parameters:
+          prefix (tuple[str]): A prefix which must have length <= self.n_gram
+
+        Returns:
+          int: The numer of ngrams which have the same prefix as the given prefix
+        """
+        start, stop = self._prefix_range(prefix)
+        return int(self._cumulative_counts[stop] - self._cumulative_counts[start])
+
+    def _prefix_range(self, prefix):
+        """Find the slice of the sorted n-gram arrays holding the n-grams with some prefix
+
+        The n-grams sharing a prefix are contiguous, and are found with one binary
+        search per level of the count trie.
+
+        Parameters:
+          prefix (tuple[str]): A prefix which must have length <= self.n_gram
+
+        Returns:
+          tuple[int, int]: The start and stop index of the n-grams with the prefix
+        """
+        if any(token not in self.token_ids for token in prefix):
+            return 0, 0
+        return ngram_prefix_range(
+            self._levels, [self.token_ids[token] for token in prefix], len(self.vocabulary)
         )
 
-    def generate(self, n):
+    def generate(
+        self,
+        n,
+        max_words,
+        temperature=1.0,
+        top_k=None,
+        top_p=None,
+        seed=None,
+        processes=1,
+        chunk_size=None,
+    ):
         """Generates n poems from a trained language model using the Shannon technique.
+
+        Every poem draws from its own random number generator, seeded from `seed` and
+        the poem's index, so the same seed gives the same poems however many processes
+        generate them. With more than one process, the poems are generated in a
+        process pool. Where the platform can fork, the workers share the parent's copy
+        of the model. Otherwise, workers load a model loaded with `load` from its
+        directory, so they share its memory-mapped arrays through the page cache, and
+        any other model is copied into every worker.
+
         Parameters:
           n (int): the number of poems to generate
+          max_words (int): Maximum number of words in each poem
+          temperature (float): Raises the weight of each candidate token to the power
+                               1 / temperature
+          top_k (int): If given, only sample from the `top_k` most likely tokens
+          top_p (float): If given, only sample from the most likely tokens whose
+                         probabilities sum to at least `top_p`
+          seed (int): Seed of the poems' random number generators. Defaults to one
+                      drawn from the `random` module
+          processes (int): Number of worker processes. None uses the number of CPUs,
+                           and 1 generates in the calling process
+          chunk_size (int): Number of poems each worker generates per task. Defaults
+                            to splitting the poems into four tasks per worker process
 
         Returns:
           list[str]: A list of poems
         """
-        return [self.generate_poem() for _ in range(n)]
+        if seed is None:
+            seed = random.getrandbits(64)
+        poem_seeds = np.random.SeedSequence(seed).generate_state(n, np.uint64).tolist()
+        options = (max_words, temperature, top_k, top_p)
+        processes = processes or os.cpu_count()
+        if processes == 1 or n <= 1:
+            return _generate_poems(self, poem_seeds, *options)
+
+        chunk_size = chunk_size or max(1, -(-n // (4 * processes)))
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            initializer, initargs = _set_generation_model, (self,)
+        elif self._loaded_from is not None:
+            # Pickling memory-mapped arrays would copy them into every worker
+            context = multiprocessing.get_context()
+            initializer = _load_generation_model
+            initargs = (
+                type(self), self._loaded_from, self.use_sampling_tables, self.cache_size
+            )
+        else:
+            context = multiprocessing.get_context()
+            initializer, initargs = _set_generation_model, (self,)
+        with context.Pool(processes, initializer=initializer, initargs=initargs) as pool:
+            chunks = pool.map(
+                _generate_poems_in_worker,
+                (
+                    (poem_seeds[i : i + chunk_size], *options)
+                    for i in range(0, n, chunk_size)
+                ),
+            )
+        return [poem for chunk in chunks for poem in chunk]
+
+
+class BackoffLanguageModel(LanguageModel):
+    SMOOTHING_METHODS = ("kneser_ney", "stupid_backoff")
+
+    def __init__(
+        self,
+        n,
+        smoothing="kneser_ney",
+        discount=0.75,
+        backoff_factor=0.4,
+        replacement_threshold=2,
+        use_sampling_tables=True,
+        cache_size=10_000,
+    ):
+        """Initializes an untrained n-gram language model which backs off to lower orders
+
+        Every order from 1 to n is derived from the n-gram counts after training, so
+        a query needs one binary search per order, and an n-gram or prefix which was
+        never seen still has a well-defined distribution.
+
+        Parameters:
+            n (int): the n-gram order of the language model to create
+            smoothing (str): "kneser_ney" for interpolated Kneser-Ney smoothing, which
+                             gives a normalized distribution, or "stupid_backoff" for
+                             unnormalized stupid backoff scores
+            discount (float): the absolute discount of Kneser-Ney smoothing, in (0, 1)
+            backoff_factor (float): how much stupid backoff scales a lower order's score
+            replacement_threshold (int): how many times a token must appear to be kept
+            use_sampling_tables (bool): whether or not to cache the cumulative
+                                        distribution tables tokens are sampled from
+            cache_size (int): how many prefixes' counts, distributions and sampling
+                              tables to cache, each keeping the most recently used
+        """
+        if smoothing not in self.SMOOTHING_METHODS:
+            raise ValueError(
+                f"Unknown smoothing method {smoothing}, expected one of "
+                f"{self.SMOOTHING_METHODS}"
+            )
+        super().__init__(
+            n,
+            False,
+            replacement_threshold=replacement_threshold,
+            use_sampling_tables=use_sampling_tables,
+            cache_size=cache_size,
+        )
+        self.smoothing = smoothing
+        self.discount = discount
+        self.backoff_factor = backoff_factor
+        self.order_tables = None
+
+    def _set_counts(self, context_keys, n_gram_keys, n_gram_counts):
+        """Sets the n-gram count table of the model, and derives every lower order
+
+        Parameters:
+            context_keys (list[np.ndarray]): The keys of the n-grams' prefixes of
+                                             lengths 1 to n-1
+            n_gram_keys (np.ndarray): Sorted, unique n-gram keys
+            n_gram_counts (np.ndarray): The count of each n-gram
+
+        Returns:
+          None
+        """
+        super()._set_counts(context_keys, n_gram_keys, n_gram_counts)
+        self._build_order_tables()
+
+    def _build_order_tables(self):
+        """Derive the count tables of every order from 1 to n from the n-gram counts
+
+        Returns:
+          None
+        """
+        tables = build_order_tables(
+            self._levels[:-1],
+            self.n_gram_keys,
+            self.n_gram_counts,
+            len(self.vocabulary),
+            continuation_counts=self.smoothing == "kneser_ney",
+        )
+        # The levels of each order's trie, its counts, and their running sum
+        self.order_tables = [
+            (context_keys + [keys], counts, np.concatenate(([0], np.cumsum(counts))))
+            for context_keys, keys, counts in tables
+        ]
+
+    def _parameters(self):
+        """Get the constructor arguments which `save` records alongside the counts
+
+        Returns:
+          dict: Keyword arguments which recreate an untrained copy of this model
+        """
+        return {
+            "n": self.n,
+            "smoothing": self.smoothing,
+            "discount": self.discount,
+            "backoff_factor": self.backoff_factor,
+            "replacement_threshold": self.replacement_threshold,
+        }
+
+    @classmethod
+    def load(cls, path, use_sampling_tables=True, cache_size=10_000):
+        """Loads a model saved with `save`, and derives its lower orders
+
+        Parameters:
+            path (str): Directory the model was saved in
+            use_sampling_tables (bool): whether or not to cache the cumulative
+                                        distribution tables tokens are sampled from
+            cache_size (int): how many prefixes to cache values for
+
+        Returns:
+          BackoffLanguageModel: The trained model
+        """
+        model = super().load(
+            path, use_sampling_tables=use_sampling_tables, cache_size=cache_size
+        )
+        model._build_order_tables()
+        return model
+
+    def score_batch(self, poems):
+        """Calculates the smoothed log probability and perplexity of many poems at once
+
+        Every order of every n-gram is looked up in one vectorized pass per order.
+        Only tokens outside of the vocabulary get a probability of 0.
+
+        Parameters:
+          poems (list[list[str]]): A list of poems, each a sequence of tokens or an
+            array of token ids, such as `generate_poem(..., return_ids=True)` returns
+
+        Returns:
+          tuple[np.ndarray, np.ndarray]: The log probability (or log stupid backoff
+                                         score) of each poem, and the perplexity of
+                                         each poem (NaN for poems shorter than n tokens)
+        """
+        base = len(self.vocabulary)
+        ids, starts, poem_of_ngram = self._encode_ngrams(poems)
+        id_rows = ngram_id_rows(ids, self.n)[starts]
+        words = id_rows[:, -1]
+
+        is_kneser_ney = self.smoothing == "kneser_ney"
+        scores = np.full(len(starts), 1 / base if is_kneser_ney else 0.0)
+        for order, (levels, counts, cumulative_counts) in enumerate(self.order_tables, 1):
+            # The context of each word is the order-1 tokens before it
+            context_indices, context_found = find_ngram_prefixes(
+                levels, id_rows[:, self.n - order : -1], base
+            )
+            context_starts, context_stops = ngram_prefix_ranges(
+                levels, context_indices, order - 1, base
+            )
+            context_counts = np.where(
+                context_found,
+                cumulative_counts[context_stops] - cumulative_counts[context_starts],
+                0,
+            )
+            positions, found = extend_ngram_prefixes(
+                levels[-1], context_indices, context_found, words, base
+            )
+            ngram_counts = np.zeros(len(starts), dtype=np.int64)
+            ngram_counts[found] = counts[positions[found]]
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if is_kneser_ney:
+                    interpolated = (
+                        np.maximum(ngram_counts - self.discount, 0)
+                        + self.discount * (context_stops - context_starts) * scores
+                    ) / context_counts
+                    scores = np.where(context_counts > 0, interpolated, scores)
+                else:
+                    scores = np.where(
+                        (ngram_counts > 0) & (context_counts > 0),
+                        ngram_counts / context_counts,
+                        self.backoff_factor * scores,
+                    )
+
+        scores[words < 0] = 0
+        with np.errstate(divide="ignore"):
+            ngram_log_probabilities = np.log(scores)
+        return sum_poem_scores(ngram_log_probabilities, poem_of_ngram, len(poems))
+
+    def log_probability(self, n_gram):
+        """Calculates the smoothed log probability of the last token of an n-gram
+
+        Parameters:
+          n_gram (tuple[str]): An n_gram
+
+        Returns:
+          float: the log probability (or log stupid backoff score) of the n_gram
+        """
+        log_probabilities, _ = self.score_batch([list(n_gram)])
+        return log_probabilities[0]
+
+    def next_token_distribution(self, prefix):
+        """Get the probability of every token in the vocabulary coming after some prefix
+
+        Parameters:
+            prefix (tuple[str]): An sequence of tokens of length n-1. Only its last
+                                 n-1 tokens are used
+
+        Returns:
+            np.ndarray: The probability of each token id. Stupid backoff scores are
+                        normalized to sum to 1
+        """
+        base = len(self.vocabulary)
+        is_kneser_ney = self.smoothing == "kneser_ney"
+        probabilities = np.full(base, 1 / base if is_kneser_ney else 0.0)
+        prefix = tuple(prefix)
+        for order, (levels, counts, cumulative_counts) in enumerate(self.order_tables, 1):
+            if order - 1 > len(prefix):
+                break
+            context = prefix[len(prefix) - order + 1 :]
+            if any(token not in self.token_ids for token in context):
+                continue
+            start, stop = ngram_prefix_range(
+                levels, [self.token_ids[token] for token in context], base
+            )
+            context_count = cumulative_counts[stop] - cumulative_counts[start]
+            if context_count == 0:
+                # An unseen context leaves the lower orders' distribution as it is
+                continue
+            candidate_ids = levels[-1][start:stop] % base
+            if is_kneser_ney:
+                probabilities *= self.discount * (stop - start) / context_count
+                probabilities[candidate_ids] += (
+                    np.maximum(counts[start:stop] - self.discount, 0) / context_count
+                )
+            else:
+                probabilities *= self.backoff_factor
+                probabilities[candidate_ids] = counts[start:stop] / context_count
+        return probabilities / probabilities.sum()
+
+    def _next_token_prob_dist(self, prefix):
+        """Compute the probability distribution for the next token given some sequence of tokens
+
+        Parameters:
+            prefix (tuple[str]): An sequence of tokens of length n-1
+
+        Returns:
+            dict[str, float]: Probability distribution of tokens that could come after the given sequence
+        """
+        probabilities = self.next_token_distribution(prefix)
+        return {
+            self.vocabulary[i]: probabilities[i] for i in np.flatnonzero(probabilities)
+        }
+
+    def _sample_token_id(self, prefix, temperature, top_k, top_p, rng):
+        """Samples the id of a token given some prefix sequence of tokens
+
+        Without temperature or truncation, Kneser-Ney sampling walks down the orders
+        rather than building the distribution over the whole vocabulary. Starting from
+        the highest order whose context was seen, the order's discounted counts are
+        sampled from with the probability they account for, and otherwise sampling
+        backs off to the next order, and finally to the uniform distribution. This
+        draws from the same distribution as `next_token_distribution`, in time which
+        only depends on the number of candidates of each order's context.
+
+        Parameters:
+            prefix (tuple[str]): An n_gram of length n-1
+            temperature (float): Raises the weight of each candidate token to the power
+                                 1 / temperature
+            top_k (int): If given, only sample from the `top_k` most likely tokens
+            top_p (float): If given, only sample from the most likely tokens whose
+                           probabilities sum to at least `top_p`
+            rng (random.Random): Source of randomness. None uses the `random` module
+
+        Returns:
+            int: The id of a randomly sampled token given the prefix
+        """
+        if (
+            self.smoothing != "kneser_ney"
+            or temperature != 1
+            or top_k is not None
+            or top_p is not None
+        ):
+            return super()._sample_token_id(prefix, temperature, top_k, top_p, rng)
+
+        rng = rng or random
+        prefix = tuple(prefix)
+        for order in range(min(self.n, len(prefix) + 1), 0, -1):
+            context = prefix[len(prefix) - order + 1 :]
+            if any(token not in self.token_ids for token in context):
+                continue
+            # Keys of (order, context) never collide with `sampling_table`'s keys
+            candidate_ids, cumulative_weights, probability = self._sampling_tables.get_or_compute(
+                (order, context), lambda: self._discounted_sampling_table(order, context)
+            )
+            if probability > 0 and rng.random() < probability:
+                return int(
+                    candidate_ids[sample_from_cumulative_weights(cumulative_weights, rng)]
+                )
+        return rng.randrange(len(self.vocabulary))
+
+    def _discounted_sampling_table(self, order, context):
+        """Get the table Kneser-Ney sampling draws the tokens of one order from
+
+        Parameters:
+            order (int): The order, from 1 to n
+            context (tuple[str]): The order-1 tokens before the sampled token, all of
+                                  them in the vocabulary
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, float]: The ids of the tokens seen after the
+              context, the cumulative sums of their discounted counts, and the
+              probability that the sampled token is drawn from them rather than from
+              the lower orders
+        """
+        base = len(self.vocabulary)
+        levels, counts, cumulative_counts = self.order_tables[order - 1]
+        start, stop = ngram_prefix_range(
+            levels, [self.token_ids[token] for token in context], base
+        )
+        context_count = cumulative_counts[stop] - cumulative_counts[start]
+        if context_count == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0), 0.0
+        discounted_counts = np.maximum(counts[start:stop] - self.discount, 0)
+        return (
+            (levels[-1][start:stop] % base).astype(np.int32),
+            np.cumsum(discounted_counts),
+            float(discounted_counts.sum() / context_count),
+        )
+
+    def _candidate_weights(self, prefix):
+        """Get the tokens which could come after a prefix, and their probabilities
+
+        Parameters:
+            prefix (tuple[str]): An sequence of tokens of length n-1
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The ids of every token with a nonzero
+                                           probability, and its probability
+        """
+        probabilities = self.next_token_distribution(prefix)
+        candidate_ids = np.flatnonzero(probabilities).astype(np.int32)
+        return candidate_ids, probabilities[candidate_ids]
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        """Initializes an empty cache which evicts its least recently used entries
+
+        Parameters:
+            max_size (int): How many entries to keep. 0 disables caching, and None
+                            leaves the cache unbounded
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Generation may be stepped from several threads, e.g. by an executor
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # Locks cannot be pickled, and a copy sent to another process starts empty
+        return {"max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_size"])
+        self.hits = state["hits"]
+        self.misses = state["misses"]
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get_or_compute(self, key, compute):
+        """Get the value cached for a key, computing and caching it on a miss
+
+        Parameters:
+            key (Hashable): The key to look up
+            compute (Callable[[], Any]): Computes the value of the key
+
+        Returns:
+            Any: The value of the key
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        if self.max_size != 0:
+            with self._lock:
+                self._entries[key] = value
+                if self.max_size is not None and len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Drops every entry, keeping the hit and miss counts
+
+        Returns:
+          None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """Get the cache's statistics
+
+        Returns:
+          dict[str, int]: The number of "hits" and "misses", the current "size", and
+                          the "max_size"
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+
+def write_file_atomically(path, write, binary=False):
+    """Write a file under a temporary name in its directory, then rename it into place
+
+    Truncating a file which another process has memory-mapped would kill that process
+    with SIGBUS. Renaming leaves the old file intact for as long as it is mapped.
+
+    Parameters:
+      path (str): Path of the file to write
+      write (Callable[[IO], None]): Writes the file's contents to an open file
+      binary (bool): Whether to open the file in binary mode
+
+    Returns:
+      None
+    """
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb" if binary else "w") as outfile:
+            write(outfile)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def build_vocabulary(frequency_distribution, threshold, replacement_token):
+    """Build a vocabulary out of the tokens which occur at least some number of times
+
+    Parameters:
+      frequency_distribution (dict[str, int]): Frequency distribution of tokens
+      threshold (int): A natural number representing the count necessary
+                       for a token to be kept
+      replacement_token (str): Token which replaces infrequent tokens
+
+    Returns:
+      list[str]: The frequent tokens in order of first appearance, followed by
+      `replacement_token` if any token was infrequent
+
+    Examples:
+      >>> build_vocabulary({"a": 3, "b": 1, "c": 3}, 2, "<UNK>")
+      ["a", "c", "<UNK>"]
+    """
+    vocabulary = [
+        token for token, count in frequency_distribution.items() if count >= threshold
+    ]
+    if len(vocabulary) < len(frequency_distribution):
+        vocabulary.append(replacement_token)
+    return vocabulary
 
 
 def replace_infrequent_tokens(
@@ -236,6 +1369,396 @@ def frequency_distribution(items):
     return distribution
 
 
+def sample_from_cumulative_weights(cumulative_weights, rng=None):
+    """Draw an index at random, weighted by a table of cumulative weights
+
+    Parameters:
+      cumulative_weights (np.ndarray): Non-decreasing cumulative sums of the weights
+      rng (random.Random): Source of randomness. Defaults to the `random` module
+
+    Returns:
+      int: An index into `cumulative_weights`
+    """
+    threshold = (rng or random).random() * cumulative_weights[-1]
+    index = int(np.searchsorted(cumulative_weights, threshold, side="right"))
+    # Guard against floating point error when `threshold` rounds up to the total
+    return min(index, len(cumulative_weights) - 1)
+
+
+def truncate_sampling_table(candidate_ids, weights, temperature=1.0, top_k=None, top_p=None):
+    """Apply temperature, top-k and nucleus (top-p) truncation to a sampling distribution
+
+    Parameters:
+      candidate_ids (np.ndarray): The ids of the candidate tokens
+      weights (np.ndarray): The unnormalized, positive weight of each candidate
+      temperature (float): Raises each weight to the power 1 / temperature. Must be
+                           positive
+      top_k (int): If given, only keep the `top_k` candidates with the largest weights
+      top_p (float): If given, only keep the smallest set of candidates with the
+                     largest weights whose probabilities sum to at least `top_p`,
+                     which must be in (0, 1]
+
+    Returns:
+      tuple[np.ndarray, np.ndarray]: The ids of the kept candidates, and their
+                                     cumulative weights. Without truncation the
+                                     candidates keep their order, otherwise they are
+                                     sorted from most to least likely
+    """
+    if temperature <= 0:
+        raise ValueError(f"temperature must be positive, got {temperature}")
+    if top_k is not None and top_k < 1:
+        raise ValueError(f"top_k must be at least 1, got {top_k}")
+    if top_p is not None and not 0 < top_p <= 1:
+        raise ValueError(f"top_p must be in (0, 1], got {top_p}")
+
+    if temperature != 1:
+        # Scale by the largest weight first, so that small temperatures do not overflow
+        weights = (weights / weights.max()) ** (1 / temperature)
+    if top_k is None and top_p is None:
+        return candidate_ids, np.cumsum(weights)
+
+    order = np.argsort(-weights, kind="stable")
+    if top_k is not None:
+        order = order[:top_k]
+    cumulative_weights = np.cumsum(weights[order])
+    if top_p is not None:
+        # Keep every candidate up to and including the one which reaches top_p
+        num_kept = np.searchsorted(
+            cumulative_weights, top_p * cumulative_weights[-1], side="left"
+        )
+        order = order[: num_kept + 1]
+        cumulative_weights = cumulative_weights[: num_kept + 1]
+    return candidate_ids[order], cumulative_weights
+
+
+def ngram_id_rows(ids, n):
+    """View every n-gram in a sequence of token ids as a row of n ids, without copying
+
+    Parameters:
+      ids (np.ndarray): A sequence of token ids
+      n (int): The n-gram order
+
+    Returns:
+      np.ndarray: A read-only array of shape (max(0, len(ids) - n + 1), n)
+    """
+    if len(ids) < n:
+        return np.zeros((0, n), dtype=ids.dtype)
+    return np.lib.stride_tricks.sliding_window_view(ids, n)
+
+
+def count_ngrams(id_rows, base, weights=None):
+    """Count n-grams, interning every prefix of them to a dense id
+
+    The counts are a trie stored level by level. The keys of level k are the distinct
+    k-token prefixes of the n-grams, each packed as (index of its (k-1)-token prefix
+    in level k-1) * base + (its last token id). Keys sort in the same order as the
+    prefixes, so the n-grams sharing a prefix are contiguous in every deeper level,
+    and a key is never larger than the number of distinct prefixes times `base`,
+    however large n is.
+
+    Parameters:
+      id_rows (np.ndarray): An array of shape (num_ngrams, n) of token ids, each
+                            smaller than `base`. Rows may repeat
+      base (int): The size of the vocabulary
+      weights (np.ndarray): If given, how many times each row occurs. Defaults to once
+
+    Returns:
+      tuple[list[np.ndarray], np.ndarray, np.ndarray]: The sorted keys of the prefixes
+        of lengths 1 to n-1, and the sorted, unique n-gram keys and their counts
+    """
+    context_keys = []
+    indices = np.zeros(len(id_rows), dtype=np.int64)
+    for column in range(id_rows.shape[1]):
+        keys, indices = np.unique(indices * base + id_rows[:, column], return_inverse=True)
+        if column < id_rows.shape[1] - 1:
+            context_keys.append(keys)
+    counts = np.bincount(indices.ravel(), weights=weights, minlength=len(keys))
+    return context_keys, keys, counts.astype(np.int64)
+
+
+def merge_ngram_counts(count_tables, base):
+    """Merge several n-gram count tables into one
+
+    Parameters:
+      count_tables (list[tuple[list[np.ndarray], np.ndarray, np.ndarray]]): Tables
+        returned by `count_ngrams`, all with the same n and base
+      base (int): The size of the vocabulary
+
+    Returns:
+      tuple[list[np.ndarray], np.ndarray, np.ndarray]: The merged table, with the
+                                                       counts of each n-gram summed
+    """
+    return count_ngrams(
+        np.concatenate(
+            [unpack_ngrams(context_keys, keys, base) for context_keys, keys, _ in count_tables]
+        ),
+        base,
+        weights=np.concatenate([counts for _, _, counts in count_tables]),
+    )
+
+
+def unpack_ngrams(context_keys, keys, base):
+    """Unpack n-gram keys back into rows of token ids
+
+    Parameters:
+      context_keys (list[np.ndarray]): The keys of the prefixes of lengths 1 to n-1,
+                                       as returned by `count_ngrams`
+      keys (np.ndarray): Keys of n-grams, or of prefixes one token longer than the
+                         last level of `context_keys`
+      base (int): The size of the vocabulary
+
+    Returns:
+      np.ndarray: An array of shape (len(keys), len(context_keys) + 1) of token ids
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    rows = np.empty((len(keys), len(context_keys) + 1), dtype=np.int32)
+    for column in range(len(context_keys), -1, -1):
+        rows[:, column] = keys % base
+        if column > 0:
+            keys = context_keys[column - 1][keys // base]
+    return rows
+
+
+def find_ngram_prefixes(levels, id_rows, base):
+    """Look up many prefixes at once in the levels of a trie built by `count_ngrams`
+
+    Parameters:
+      levels (list[np.ndarray]): The keys of the prefixes of lengths 1 to n-1,
+                                 followed by the n-gram keys
+      id_rows (np.ndarray): An array of shape (num_prefixes, k) of token ids, with
+                            k <= n. Unknown tokens are -1
+      base (int): The size of the vocabulary
+
+    Returns:
+      tuple[np.ndarray, np.ndarray]: The index of each prefix in `levels[k-1]` (or 0
+        for empty prefixes), and whether it was found there
+    """
+    indices = np.zeros(len(id_rows), dtype=np.int64)
+    found = np.ones(len(id_rows), dtype=bool)
+    for column in range(id_rows.shape[1]):
+        indices, found = extend_ngram_prefixes(
+            levels[column], indices, found, id_rows[:, column], base
+        )
+    return indices, found
+
+
+def extend_ngram_prefixes(level, indices, found, token_ids, base):
+    """Extend prefixes found in one level of a trie by one token, and look them up in the next
+
+    Parameters:
+      level (np.ndarray): The keys of the level one token deeper than the prefixes
+      indices (np.ndarray): The index of each prefix in its own level
+      found (np.ndarray): Whether each prefix was found
+      token_ids (np.ndarray): The token to extend each prefix with. Unknown tokens
+                              are -1
+      base (int): The size of the vocabulary
+
+    Returns:
+      tuple[np.ndarray, np.ndarray]: The index of each extended prefix in `level`,
+                                     and whether it was found there
+    """
+    keys = indices * base + np.maximum(token_ids, 0)
+    positions = np.searchsorted(level, keys)
+    found = found & (token_ids >= 0) & (positions < len(level))
+    found[found] = level[positions[found]] == keys[found]
+    return positions, found
+
+
+def ngram_prefix_ranges(levels, indices, length, base):
+    """Find the slice of the n-gram keys holding the n-grams which extend each prefix
+
+    Parameters:
+      levels (list[np.ndarray]): The keys of the prefixes of lengths 1 to n-1,
+                                 followed by the n-gram keys
+      indices (np.ndarray): The index of each prefix in `levels[length-1]`, as found
+                            by `find_ngram_prefixes`. Use 0 for the empty prefix
+      length (int): The number of tokens in the prefixes
+      base (int): The size of the vocabulary
+
+    Returns:
+      tuple[np.ndarray, np.ndarray]: The start and stop index of each prefix's n-grams
+    """
+    starts, stops = indices, indices + 1
+    # The children of a contiguous run of prefixes are contiguous in the next level
+    for level in levels[length:]:
+        starts = np.searchsorted(level, starts * base)
+        stops = np.searchsorted(level, stops * base)
+    return starts, stops
+
+
+def ngram_prefix_range(levels, prefix_ids, base):
+    """Find the slice of the n-gram keys holding the n-grams which extend one prefix
+
+    Parameters:
+      levels (list[np.ndarray]): The keys of the prefixes of lengths 1 to n-1,
+                                 followed by the n-gram keys
+      prefix_ids (list[int]): The token ids of a prefix of at most n tokens
+      base (int): The size of the vocabulary
+
+    Returns:
+      tuple[int, int]: The start and stop index of the prefix's n-grams, which are
+                       equal if the prefix was never seen
+    """
+    index = 0
+    for level, token_id in zip(levels, prefix_ids):
+        key = index * base + token_id
+        index = int(np.searchsorted(level, key))
+        if index == len(level) or level[index] != key:
+            return 0, 0
+    start, stop = index, index + 1
+    for level in levels[len(prefix_ids) :]:
+        start, stop = np.searchsorted(level, [start * base, stop * base]).tolist()
+    return start, stop
+
+
+def _count_shard(shard):
+    """Count the n-grams in one shard of a corpus, for `LanguageModel.train_parallel`
+
+    Parameters:
+      shard (tuple[list[str], dict[str, int], str, int]): The shard's tokens, the
+        vocabulary's token ids, the UNK token, and the n-gram order
+
+    Returns:
+      tuple[list[np.ndarray], np.ndarray, np.ndarray]: The shard's count table, as
+                                                       returned by `count_ngrams`
+    """
+    tokens, token_ids, unk, n = shard
+    unk_id = token_ids.get(unk, -1)
+    ids = np.fromiter(
+        (token_ids.get(token, unk_id) for token in tokens),
+        dtype=np.int32,
+        count=len(tokens),
+    )
+    return count_ngrams(ngram_id_rows(ids, n), len(token_ids))
+
+
+# The model generation workers sample from, set once per worker by `_set_generation_model`
+_generation_model = None
+
+
+def _set_generation_model(model):
+    """Keep the model to generate with in a worker process of `LanguageModel.generate`
+
+    Parameters:
+      model (LanguageModel): The trained model
+
+    Returns:
+      None
+    """
+    global _generation_model
+    _generation_model = model
+
+
+def _load_generation_model(model_class, path, use_sampling_tables, cache_size):
+    """Load the model to generate with in a worker process of `LanguageModel.generate`
+
+    Parameters:
+      model_class (type): The class of the saved model
+      path (str): Directory the model was saved in
+      use_sampling_tables (bool): whether or not to cache the cumulative distribution
+        tables tokens are sampled from
+      cache_size (int): how many prefixes to cache values for
+
+    Returns:
+      None
+    """
+    _set_generation_model(
+        model_class.load(path, use_sampling_tables=use_sampling_tables, cache_size=cache_size)
+    )
+
+
+def _generate_poems_in_worker(chunk):
+    """Generate a chunk of poems in a worker process of `LanguageModel.generate`
+
+    Parameters:
+      chunk (tuple): The seed of each poem's random number generator, followed by the
+        max_words, temperature, top_k and top_p options of `generate_poem`
+
+    Returns:
+      list[str]: The poems
+    """
+    return _generate_poems(_generation_model, *chunk)
+
+
+def _generate_poems(model, poem_seeds, max_words, temperature, top_k, top_p):
+    """Generate one poem per seed, each from a random number generator seeded with its seed
+
+    Parameters:
+      model (LanguageModel): The trained model
+      poem_seeds (list[int]): The seed of each poem's random number generator
+      max_words (int): Maximum number of words in each poem
+      temperature (float): Raises the weight of each candidate token to the power
+        1 / temperature
+      top_k (int): If given, only sample from the `top_k` most likely tokens
+      top_p (float): If given, only sample from the most likely tokens whose
+        probabilities sum to at least `top_p`
+
+    Returns:
+      list[str]: The poems
+    """
+    return [
+        model.generate_poem(
+            max_words,
+            temperature=temperature,
+            top_k=top_k,
+            top_p=top_p,
+            rng=random.Random(poem_seed),
+        )
+        for poem_seed in poem_seeds
+    ]
+
+
+def build_order_tables(context_keys, n_gram_keys, n_gram_counts, base, continuation_counts):
+    """Derive the count table of every order from 1 to n from the counts of the n-grams
+
+    Parameters:
+      context_keys (list[np.ndarray]): The keys of the n-grams' prefixes of lengths
+                                       1 to n-1, as returned by `count_ngrams`
+      n_gram_keys (np.ndarray): Sorted, unique n-gram keys
+      n_gram_counts (np.ndarray): The count of each n-gram
+      base (int): The size of the vocabulary
+      continuation_counts (bool): Whether every order below n counts how many distinct
+        tokens precede each k-gram, as Kneser-Ney smoothing does, rather than how many
+        times it occurs
+
+    Returns:
+      list[tuple[list[np.ndarray], np.ndarray, np.ndarray]]: The count tables of
+        orders 1 to n, as returned by `count_ngrams`
+    """
+    tables = [(list(context_keys), np.asarray(n_gram_keys), np.asarray(n_gram_counts))]
+    for _ in range(len(context_keys)):
+        context_keys, keys, counts = tables[0]
+        # Every k-gram is counted where it ends a (k+1)-gram, so only the k-grams
+        # inside the corpus' leading POEM_BEGIN padding are missed
+        suffix_rows = unpack_ngrams(context_keys, keys, base)[:, 1:]
+        # Each distinct (k+1)-gram adds one left context to the k-gram it ends with
+        weights = None if continuation_counts else counts
+        tables.insert(0, count_ngrams(suffix_rows, base, weights=weights))
+    return tables
+
+
+def sum_poem_scores(ngram_log_probabilities, poem_of_ngram, num_poems):
+    """Sum the log probabilities of each poem's n-grams, and compute each poem's perplexity
+
+    Parameters:
+      ngram_log_probabilities (np.ndarray): The log probability of every n-gram
+      poem_of_ngram (np.ndarray): The poem each n-gram belongs to
+      num_poems (int): Number of poems
+
+    Returns:
+      tuple[np.ndarray, np.ndarray]: The log probability of each poem, and the
+                                     perplexity of each poem (NaN for poems
+                                     without any n-grams)
+    """
+    log_probabilities = np.bincount(
+        poem_of_ngram, weights=ngram_log_probabilities, minlength=num_poems
+    )
+    num_ngrams = np.bincount(poem_of_ngram, minlength=num_poems)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        perplexities = np.exp(-log_probabilities / num_ngrams)
+    return log_probabilities, np.where(num_ngrams > 0, perplexities, np.nan)
+
+
 def ngram_prefix(n_gram):
     """Get all but the last word in an n_gram
 
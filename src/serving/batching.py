@@ -0,0 +1,111 @@
+"""
+Group requests which arrive close together into batches
+
+A single worker thread takes requests off a queue. Once the first request of a batch
+arrives, it waits a short time for more, then hands the whole batch to a handler, so
+that concurrent callers share one batched model step instead of queueing for a
+step each.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class RequestBatcher:
+    def __init__(self, handler, max_batch_size=32, max_wait_seconds=0.005):
+        """Start a worker thread which processes submitted requests in batches
+
+        Args:
+            handler (Callable[[list], list]): Processes a batch of requests, and
+                returns the result of each request in the same order. It is only ever
+                called from the worker thread
+            max_batch_size (int): Largest number of requests to process at once
+            max_wait_seconds (float): How long to wait for more requests after the
+                first request of a batch arrives
+        """
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.num_batches = 0
+        self.num_requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+        """Queue a request to be processed in the next batch
+
+        Args:
+            request (Any): The request, passed on to the handler
+
+        Returns:
+            concurrent.futures.Future: Resolves to the request's result, or to the
+            exception the handler raised for its batch
+        """
+        future = Future()
+        self._queue.put((request, future))
+        return future
+
+    def close(self):
+        """Process the requests which were already submitted, then stop the worker thread
+
+        Returns:
+            None
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        """Collect and process batches until the batcher is closed
+
+        Returns:
+            None
+        """
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        # Past the deadline, still take requests which are already waiting
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._process(batch)
+
+    def _process(self, batch):
+        """Run the handler on a batch, and resolve the future of each of its requests
+
+        Args:
+            batch (list[tuple[Any, Future]]): The requests and their futures
+
+        Returns:
+            None
+        """
+        requests = [request for request, _ in batch]
+        futures = [future for _, future in batch]
+        self.num_batches += 1
+        self.num_requests += len(batch)
+        try:
+            results = self.handler(requests)
+        except Exception as exception:
+            for future in futures:
+                future.set_exception(exception)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
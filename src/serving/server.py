@@ -0,0 +1,335 @@
+"""
+A long-lived poem generation service, served over HTTP or a Unix socket
+
+The n-gram and neural language models are loaded once and kept warm. Requests for
+the same model which arrive close together are grouped by a `RequestBatcher`, and
+the neural model advances all of a batch's poems in one batched step.
+
+Endpoints:
+    GET /health: The models being served
+    POST /generate: A JSON request such as
+        {"model": "neural", "seed": "i sing ", "max_length": 150, "temperature": 0.8}
+        answered with {"poem": "..."}
+"""
+
+import json
+import math
+import os
+import pickle
+import socketserver
+import stat
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import keras
+import numpy as np
+
+from dataprep.neural_lm_dataprep import postprocess_for_neural_lm
+from dataprep.ngram_lm_dataprep import postprocess_for_ngram_lm
+from models.neural_generation import CharacterGenerator
+from models.ngram_language_model import LanguageModel
+from serving.batching import RequestBatcher
+
+
+class GenerationService:
+    def __init__(
+        self,
+        character_generator=None,
+        ngram_model=None,
+        max_batch_size=32,
+        max_wait_seconds=0.005,
+        max_length_limit=1000,
+        random_seed=None,
+    ):
+        """Serve requests to generate poems with models which are already loaded
+
+        Args:
+            character_generator (CharacterGenerator): If given, serves "neural" requests
+            ngram_model (LanguageModel): If given, serves "ngram" requests
+            max_batch_size (int): Largest number of requests to generate at once
+            max_wait_seconds (float): How long to wait for more requests to batch with
+                the first request of a batch
+            max_length_limit (int): Largest `max_length` a request may ask for
+            random_seed (int): Seed of the random number generator of the neural model
+        """
+        self.character_generator = character_generator
+        self.ngram_model = ngram_model
+        self.max_length_limit = max_length_limit
+        self._rng = np.random.default_rng(random_seed)
+        self._batchers = {}
+        if character_generator is not None:
+            self._batchers["neural"] = RequestBatcher(
+                self._generate_neural_batch, max_batch_size, max_wait_seconds
+            )
+        if ngram_model is not None:
+            self._batchers["ngram"] = RequestBatcher(
+                self._generate_ngram_batch, max_batch_size, max_wait_seconds
+            )
+        if not self._batchers:
+            raise ValueError("At least one model must be served")
+
+    @property
+    def models(self):
+        """The names of the models being served"""
+        return sorted(self._batchers)
+
+    def generate(self, request, timeout=None):
+        """Generate a poem, batched with any other requests for the same model
+
+        Args:
+            request (dict): The "model" to generate with ("neural" or "ngram"), the
+                "seed" phrase to continue (neural only), the "max_length" in
+                characters (neural) or words (ngram), and optionally the "temperature",
+                "top_k", and "top_p" (ngram only) sampling options
+            timeout (float): How long to wait for the poem, in seconds
+
+        Returns:
+            dict: The generated "poem"
+        """
+        request = self.validate(request)
+        return self._batchers[request["model"]].submit(request).result(timeout)
+
+    def validate(self, request):
+        """Check a request and fill in its defaults
+
+        Args:
+            request (dict): A request, as passed to `generate`
+
+        Returns:
+            dict: The request with every option filled in
+
+        Raises:
+            ValueError: If the request is invalid
+        """
+        if not isinstance(request, dict):
+            raise ValueError("A request must be a JSON object")
+        model = request.get("model", self.models[0])
+        if model not in self._batchers:
+            raise ValueError(f"Unknown model {model!r}, expected one of {self.models}")
+        validated = {
+            "model": model,
+            "seed": request.get("seed", ""),
+            "max_length": request.get("max_length", 150),
+            "temperature": request.get("temperature", 1.0),
+            "top_k": request.get("top_k"),
+            "top_p": request.get("top_p"),
+        }
+        if not _is_integer(validated["max_length"]) or not (
+            0 < validated["max_length"] <= self.max_length_limit
+        ):
+            raise ValueError(f"max_length must be an integer in [1, {self.max_length_limit}]")
+        if not _is_number(validated["temperature"]) or validated["temperature"] <= 0:
+            raise ValueError("temperature must be a positive number")
+        if validated["top_k"] is not None and (
+            not _is_integer(validated["top_k"]) or validated["top_k"] < 1
+        ):
+            raise ValueError("top_k must be a positive integer")
+
+        if model == "neural":
+            vectorizer = self.character_generator.vectorizer
+            if not isinstance(validated["seed"], str) or not validated["seed"]:
+                raise ValueError("Neural generation needs a non-empty seed phrase")
+            unknown = set(validated["seed"]) - set(vectorizer.token_to_int_mapping)
+            if unknown:
+                raise ValueError(f"The seed contains unknown characters: {sorted(unknown)}")
+            if validated["top_p"] is not None:
+                raise ValueError("Neural generation does not support top_p")
+        else:
+            if validated["seed"]:
+                raise ValueError("N-gram generation does not take a seed phrase")
+            if validated["top_p"] is not None and not (
+                _is_number(validated["top_p"]) and 0 < validated["top_p"] <= 1
+            ):
+                raise ValueError("top_p must be in (0, 1]")
+        return validated
+
+    def close(self):
+        """Finish the requests already submitted, and stop batching
+
+        Returns:
+            None
+        """
+        for batcher in self._batchers.values():
+            batcher.close()
+
+    def _generate_neural_batch(self, requests):
+        """Generate a batch of poems with the neural model
+
+        Requests with the same `top_k` are generated together up to the longest
+        `max_length` among them, and each poem is then cut to its own `max_length`.
+
+        Args:
+            requests (list[dict]): Validated requests for the "neural" model
+
+        Returns:
+            list[dict]: The generated "poem" of each request
+        """
+        results = [None] * len(requests)
+        groups = {}
+        for i, request in enumerate(requests):
+            groups.setdefault(request["top_k"], []).append(i)
+        for top_k, indices in groups.items():
+            seeds = [requests[i]["seed"] for i in indices]
+            poems = self.character_generator.generate_batch(
+                seeds,
+                max_length=max(requests[i]["max_length"] for i in indices),
+                temperature=np.array([requests[i]["temperature"] for i in indices]),
+                top_k=top_k,
+                rng=self._rng,
+            )
+            for i, seed, poem in zip(indices, seeds, poems):
+                generated = poem[len(seed) :][: requests[i]["max_length"]]
+                results[i] = {"poem": postprocess_for_neural_lm(seed + generated)}
+        return results
+
+    def _generate_ngram_batch(self, requests):
+        """Generate a batch of poems with the n-gram model
+
+        Args:
+            requests (list[dict]): Validated requests for the "ngram" model
+
+        Returns:
+            list[dict]: The generated "poem" of each request
+        """
+        return [
+            {
+                "poem": postprocess_for_ngram_lm(
+                    self.ngram_model.generate_poem(
+                        request["max_length"],
+                        temperature=request["temperature"],
+                        top_k=request["top_k"],
+                        top_p=request["top_p"],
+                    )
+                )
+            }
+            for request in requests
+        ]
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """Answers HTTP requests with the `GenerationService` of the server"""
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "models": self.server.service.models})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            response = self.server.service.generate(request)
+        except (ValueError, KeyError) as error:
+            self._send_json(400, {"error": str(error)})
+            return
+        except Exception as error:
+            # E.g. a TimeoutError, or a failed model step. Answer rather than drop the connection
+            self._send_json(500, {"error": f"{type(error).__name__}: {error}"})
+            return
+        self._send_json(200, response)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body):
+        encoded = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+class GenerationHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        """Serve a `GenerationService` over TCP, handling each connection in its own thread
+
+        Args:
+            address (tuple[str, int]): The host and port to listen on
+            service (GenerationService): The service to answer requests with
+            quiet (bool): Whether to silence the log line of every request
+        """
+        self.service = service
+        self.quiet = quiet
+        super().__init__(address, GenerationRequestHandler)
+
+
+class UnixGenerationHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, service, quiet=False):
+        """Serve a `GenerationService` over a Unix socket, handling each connection in its own thread
+
+        Args:
+            path (str): Path of the socket to create. An existing socket there is replaced
+
+        Raises:
+            FileExistsError: If something other than a socket exists at the path
+            service (GenerationService): The service to answer requests with
+            quiet (bool): Whether to silence the log line of every request
+        """
+        self.service = service
+        self.quiet = quiet
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise FileExistsError(f"{path} exists and is not a socket")
+            os.remove(path)
+        super().__init__(path, GenerationRequestHandler)
+
+
+def _is_integer(value):
+    """Check whether a JSON value is an integer. Booleans are not, although they are ints"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    """Check whether a JSON value is a finite number. Booleans are not, although they are ints,
+    and neither are the NaN and Infinity literals Python's JSON parser accepts"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def load_service(
+    ngram_model_path=None,
+    ngram_model_class=LanguageModel,
+    neural_model_path=None,
+    vectorizer_path=None,
+    **service_options,
+):
+    """Load models from disk, once, and wrap them in a `GenerationService`
+
+    Args:
+        ngram_model_path (str): If given, directory of an n-gram model saved with
+            `LanguageModel.save`
+        ngram_model_class (type): The class of the saved n-gram model
+        neural_model_path (str): If given, path of a saved Keras model built by
+            `build_character_lstm_model`
+        vectorizer_path (str): Path of the pickled vectorizer of the neural model
+        **service_options: Passed on to `GenerationService`
+
+    Returns:
+        GenerationService: The service, with its models loaded
+    """
+    ngram_model = None
+    if ngram_model_path is not None:
+        ngram_model = ngram_model_class.load(ngram_model_path, use_sampling_tables=True)
+
+    character_generator = None
+    if neural_model_path is not None:
+        with open(vectorizer_path, "rb") as infile:
+            vectorizer = pickle.load(infile)
+        character_generator = CharacterGenerator(
+            keras.models.load_model(neural_model_path), vectorizer
+        )
+    return GenerationService(
+        character_generator=character_generator, ngram_model=ngram_model, **service_options
+    )
@@ -0,0 +1,84 @@
+"""
+Asynchronous generation which streams each token as soon as it is sampled
+
+Every model step runs in an executor, so the event loop stays free between steps and
+many generations can be interleaved on it. A caller gets the first token after a
+single step, rather than after the whole poem is finished.
+"""
+
+import asyncio
+
+_DONE = object()
+
+
+async def iterate_in_executor(iterator, executor=None):
+    """Advance a blocking iterator in an executor, yielding each item as it is produced
+
+    Args:
+        iterator (Iterator): An iterator whose every step may block, e.g. a model step
+        executor (concurrent.futures.Executor): Runs each step. Defaults to the event
+            loop's default executor
+
+    Returns:
+        AsyncIterator: The iterator's items
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(executor, next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+def stream_ngram_poem(
+    model, max_words, temperature=1.0, top_k=None, top_p=None, executor=None
+):
+    """Generate a poem with an n-gram language model, streaming each token
+
+    Args:
+        model (LanguageModel): A trained n-gram language model
+        max_words (int): Maximum number of words in the poem
+        temperature (float): Raises the weight of each candidate token to the power
+            1 / temperature
+        top_k (int): If given, only sample from the `top_k` most likely tokens
+        top_p (float): If given, only sample from the most likely tokens whose
+            probabilities sum to at least `top_p`
+        executor (concurrent.futures.Executor): Runs each sampling step. Defaults to
+            the event loop's default executor
+
+    Returns:
+        AsyncIterator[str]: The sampled tokens, ending with POEM_END if it is sampled
+        before the poem reaches `max_words`
+    """
+    return iterate_in_executor(
+        model.iter_poem_tokens(max_words, temperature=temperature, top_k=top_k, top_p=top_p),
+        executor,
+    )
+
+
+def stream_neural_poem(
+    generator, seed_phrase, max_length=150, temperature=1.0, top_k=None, rng=None, executor=None
+):
+    """Generate a poem with a character-based neural language model, streaming each character
+
+    Args:
+        generator (CharacterGenerator): Steps the trained model
+        seed_phrase (str): Text to condition generation on. Must be non-empty
+        max_length (int): Maximum number of characters to generate
+        temperature (float): Divides the model's log probabilities before sampling
+        top_k (int): If given, only sample from the `top_k` most likely characters
+        rng (np.random.Generator): Source of randomness. Defaults to a fresh, unseeded
+            generator
+        executor (concurrent.futures.Executor): Runs each model step. Defaults to the
+            event loop's default executor
+
+    Returns:
+        AsyncIterator[str]: The generated characters, ending with a poem boundary
+        character if one is sampled before `max_length`
+    """
+    return iterate_in_executor(
+        generator.iter_characters(
+            seed_phrase, max_length=max_length, temperature=temperature, top_k=top_k, rng=rng
+        ),
+        executor,
+    )
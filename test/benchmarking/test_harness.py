@@ -0,0 +1,47 @@
+"""
+Unit tests for the benchmarking harness
+
+"""
+
+from benchmarking.harness import (
+    benchmark_result,
+    compare_results,
+    load_results,
+    measure,
+    peak_memory,
+    save_results
+)
+
+
+class TestMeasure:
+    def test_measure(self):
+        calls = []
+        measurement = measure(lambda: calls.append(1), repeat=3, num_items=10)
+        # Three timed runs and one run tracing memory
+        assert len(calls) == 4
+        assert measurement["best_seconds"] <= measurement["mean_seconds"]
+        assert measurement["items_per_second"] > 0
+        assert "peak_memory_bytes" in measurement
+
+    def test_peak_memory(self):
+        assert peak_memory(lambda: bytearray(10_000_000)) >= 10_000_000
+
+
+class TestCompareResults:
+    def test_compare_results(self, tmp_path):
+        baseline = [
+            benchmark_result("train", {"n": 2}, {"best_seconds": 1.0}),
+            benchmark_result("train", {"n": 3}, {"best_seconds": 1.0}),
+            benchmark_result("score", {"n": 2}, {"best_seconds": 1.0}),
+        ]
+        current = [
+            benchmark_result("train", {"n": 2}, {"best_seconds": 1.05}),
+            benchmark_result("train", {"n": 3}, {"best_seconds": 2.0}),
+            benchmark_result("generate", {"n": 2}, {"best_seconds": 1.0}),
+        ]
+        save_results(baseline, tmp_path / "baseline.json")
+        comparison = compare_results(load_results(tmp_path / "baseline.json"), current)
+        assert [(row["parameters"]["n"], row["regression"]) for row in comparison] == [
+            (2, False),
+            (3, True),
+        ]
@@ -0,0 +1,32 @@
+"""
+Unit tests for the neural language model benchmarks
+
+"""
+
+from benchmarking.neural_benchmarks import benchmark_neural_pipeline, synthetic_poems
+
+
+class TestBenchmarkNeuralPipeline:
+    def test_benchmark_neural_pipeline(self):
+        results = benchmark_neural_pipeline(
+            synthetic_poems(4, poem_length=60),
+            "tiny",
+            repeat=1,
+            sequence_length=20,
+            bucket_sequence_lengths=(),
+            batch_size=16,
+            max_training_batches=2,
+            max_length=10,
+            generation_batch_size=2,
+            units=4,
+            profile=True,
+        )
+        assert [result["name"] for result in results] == [
+            "neural.vectorize",
+            "neural.windowed_batches",
+            "neural.train_epoch",
+            "neural.generate",
+            "neural.generate_batch",
+        ]
+        assert all(result["items_per_second"] > 0 for result in results)
+        assert all(result["hotspots"] for result in results)
@@ -0,0 +1,29 @@
+"""
+Unit tests for the n-gram language model benchmarks
+
+"""
+
+from benchmarking.ngram_benchmarks import benchmark_language_model, synthetic_corpus
+
+
+class TestSyntheticCorpus:
+    def test_synthetic_corpus(self):
+        poems = synthetic_corpus(250, 10, 3, poem_length=100)
+        assert [len(poem) for poem in poems] == [104, 104, 54]
+        assert poems[0][:2] == ["<p>", "<p>"] and poems[0][-2:] == ["</p>", "</p>"]
+        assert synthetic_corpus(250, 10, 3) == poems
+
+
+class TestBenchmarkLanguageModel:
+    def test_benchmark_language_model(self):
+        results = benchmark_language_model(
+            synthetic_corpus(1000, 20, 2), 2, "tiny", repeat=1, num_prefix_queries=10
+        )
+        assert [result["name"] for result in results] == [
+            "ngram.train",
+            "ngram.score",
+            "ngram.score_batch",
+            "ngram.generate_poem",
+            "ngram.count_ngrams_with_prefix",
+        ]
+        assert all(result["parameters"]["corpus"] == "tiny" for result in results)
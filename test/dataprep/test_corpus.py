@@ -0,0 +1,76 @@
+"""
+Unit tests for the `corpus` module
+
+"""
+
+import os
+
+from dataprep.corpus import build_corpus, load_corpus, load_manifest
+
+
+BOOK = """The Project Gutenberg eBook
+
+BOOK I.  INSCRIPTIONS
+
+One's-Self I Sing
+
+  One's-self I sing, a simple separate person.
+
+To the State
+
+  To the State, or any one of the States.
+"""
+
+
+class TestBuildCorpus:
+    def test_build_and_load(self, tmp_path):
+        (tmp_path / "books").mkdir()
+        (tmp_path / "books" / "a.txt").write_text(BOOK)
+        (tmp_path / "books" / "b.txt").write_text(BOOK.replace("State", "Nation"))
+        rebuilt = build_corpus(tmp_path / "books", tmp_path / "corpus", processes=2)
+        assert rebuilt == ["a.txt", "b.txt"]
+
+        corpus = load_corpus(tmp_path / "corpus")
+        assert list(corpus["source"]) == ["a.txt", "a.txt", "b.txt", "b.txt"]
+        assert list(corpus["poem_title"]) == ["One's-Self I Sing", "To the State",
+                                              "One's-Self I Sing", "To the Nation"]
+        assert corpus["ngram_tokens"][0] == ["one's-self", "i", "sing", ",", "a", "simple",
+                                             "separate", "person", "."]
+        assert corpus["neural_poem"][0] == "@one's-self i sing, a simple separate person.$"
+
+    def test_rebuild_skips_unchanged_books(self, tmp_path):
+        (tmp_path / "books").mkdir()
+        (tmp_path / "books" / "a.txt").write_text(BOOK)
+        (tmp_path / "books" / "b.txt").write_text(BOOK)
+        build_corpus(tmp_path / "books", tmp_path / "corpus", processes=1)
+
+        (tmp_path / "books" / "b.txt").write_text(BOOK.replace("State", "Nation"))
+        (tmp_path / "books" / "a.txt").unlink()
+        (tmp_path / "books" / "c.txt").write_text(BOOK)
+        rebuilt = build_corpus(tmp_path / "books", tmp_path / "corpus", processes=1)
+        assert rebuilt == ["b.txt", "c.txt"]
+        assert sorted(load_manifest(tmp_path / "corpus")) == ["b.txt", "c.txt"]
+        assert not (tmp_path / "corpus" / "a.txt.npz").exists()
+        assert list(load_corpus(tmp_path / "corpus")["poem_title"])[1] == "To the Nation"
+
+    def test_shard_is_no_larger_than_book(self, tmp_path):
+        (tmp_path / "books").mkdir()
+        line = "  I celebrate myself, and sing myself, and what I assume you shall assume.\n"
+        poems = [f"Poem {i}\n\n" + line * (i % 5 + 1) for i in range(50)]
+        poems.append("A Long Poem\n\n" + line * 2000)
+        book = "The Project Gutenberg eBook\n\nBOOK I.  INSCRIPTIONS\n\n" + "\n".join(poems)
+        (tmp_path / "books" / "a.txt").write_text(book)
+        build_corpus(tmp_path / "books", tmp_path / "corpus", processes=1)
+
+        assert len(load_corpus(tmp_path / "corpus")) == 51
+        assert os.path.getsize(tmp_path / "corpus" / "a.txt.npz") < len(book)
+
+    def test_rebuild_when_tokenizer_changes(self, tmp_path, monkeypatch):
+        (tmp_path / "books").mkdir()
+        (tmp_path / "books" / "a.txt").write_text(BOOK)
+        build_corpus(tmp_path / "books", tmp_path / "corpus", processes=1)
+        assert build_corpus(tmp_path / "books", tmp_path / "corpus", processes=1) == []
+
+        monkeypatch.setattr("dataprep.corpus.TOKENIZER_VERSION", 2)
+        assert build_corpus(tmp_path / "books", tmp_path / "corpus", processes=1) == ["a.txt"]
+        assert load_manifest(tmp_path / "corpus")["a.txt"]["tokenizer_version"] == 2
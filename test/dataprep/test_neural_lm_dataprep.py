@@ -59,6 +59,37 @@ class TestCharVectorizer:
         actual = self.vec.vectors_to_tokens(vectors)
         assert actual == expected
 
+    def test_tokens_to_ints(self):
+        actual = self.vec.tokens_to_ints(["f", "a", "c"])
+        assert actual.dtype == np.int8
+        assert list(actual) == [4, 0, 2]
+
+    def test_ints_to_tokens(self):
+        assert self.vec.ints_to_tokens(np.array([4, 0, 2])) == ["f", "a", "c"]
+
+    def test_string_to_ints(self):
+        assert list(self.vec.tokens_to_ints("fac")) == [4, 0, 2]
+
+    def test_unknown_token(self):
+        with pytest.raises(KeyError):
+            self.vec.tokens_to_ints("abz")
+
+    def test_ints_to_strings(self):
+        batch = [np.array([4, 0, 2]), np.array([], dtype=np.int8), np.array([3])]
+        assert self.vec.ints_to_strings(batch) == ["fac", "", "d"]
+
+    def test_word_vocabulary(self):
+        vec = Vectorizer()
+        vec.fit(["i", "sing", "of", "myself", "i", "sing"])
+        assert list(vec.tokens_to_ints(["sing", "myself", "i"])) == [1, 3, 0]
+        assert vec.ints_to_strings([np.array([0, 1, 2])], sep=" ") == ["i sing of"]
+
+    def test_int_dtype_grows_with_vocabulary(self):
+        vec = Vectorizer()
+        vec.fit([str(i) for i in range(300)])
+        assert vec.int_dtype() == np.int16
+
+
 class TestStandardize:
     def test_prepare_poem(self):
         poem = "One's-self I sing. A simple \n separate person."
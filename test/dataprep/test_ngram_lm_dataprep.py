@@ -5,7 +5,11 @@ Unit tests for the ngram langauge model preprocessing module
 
 from dataprep.ngram_lm_dataprep import (
     preprocess_for_ngram_lm,
-    postprocess_for_ngram_lm
+    postprocess_for_ngram_lm,
+    preprocess_poems_for_ngram_lm,
+    read_poems_csv,
+    read_poems_text,
+    tokenize
 )
 
 
@@ -17,6 +21,38 @@ class TestPreprocessPoem:
         assert actual == expected
 
 
+    def test_preprocess_poem_with_newlines_at_line_ends(self):
+        poem = "Starting from fish-shape Paumanok\n  where I was born,\n"
+        expected = ["starting", "from", "fish-shape", "paumanok", "<nl>", "where", "i", "was", "born", ",", "<nl>"]
+        assert preprocess_for_ngram_lm(poem, "<nl>") == expected
+
+
+class TestTokenize:
+    def test_clitics(self):
+        assert tokenize("i can't, they'll. he's") == ["i", "ca", "n't", ",", "they", "'ll", ".", "he", "'s"]
+
+    def test_split_words(self):
+        assert tokenize("i cannot, 'tis") == ["i", "can", "not", ",", "'t", "is"]
+
+    def test_curly_apostrophe(self):
+        assert tokenize("ponder’d") == ["ponder", "’", "d"]
+
+    def test_quotes_and_dashes(self):
+        assert tokenize('"hush"--and long-\nsteps...') == [
+            "``", "hush", "''", "--", "and", "long-", "<nl>", "steps", "..."
+        ]
+
+
+class TestPreprocessPoems:
+    def test_cache(self, tmp_path):
+        poems = ["One's-self I sing.", "A simple separate person."]
+        expected = [["one's-self", "i", "sing", "."], ["a", "simple", "separate", "person", "."]]
+        cache_path = tmp_path / "tokens"
+        assert preprocess_poems_for_ngram_lm(poems, cache_path=cache_path) == expected
+        assert preprocess_poems_for_ngram_lm(poems, cache_path=cache_path) == expected
+        assert preprocess_poems_for_ngram_lm(poems) == expected
+
+
 class TestPostprocessPoem:
     def test_postprocess_poem(self):
         poem = "<p><p> hush '   d me ,   NEWLINE i dance with  the <UNK> refrain toward sundown , <nl> thou <UNK> time . </p></p>"
@@ -25,3 +61,16 @@ class TestPostprocessPoem:
         print("HI")
         print(actual)
         assert actual == expected
+
+
+class TestReadPoems:
+    def test_read_poems_csv(self, tmp_path):
+        path = tmp_path / "poems.csv"
+        path.write_text('book_title,poem\nBOOK I.,"one\ntwo"\nBOOK I.,three\nBOOK II.,four\n')
+        assert list(read_poems_csv(path, chunksize=2)) == ["one\ntwo", "three", "four"]
+
+    def test_read_poems_text(self, tmp_path):
+        (tmp_path / "a.txt").write_text("one\ntwo")
+        (tmp_path / "b.txt").write_text("three")
+        paths = [tmp_path / "a.txt", tmp_path / "b.txt"]
+        assert list(read_poems_text(paths)) == ["one\ntwo", "three"]
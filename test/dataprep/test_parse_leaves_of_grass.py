@@ -11,7 +11,8 @@ from dataprep.parse_leaves_of_grass import (
     read_poem_body,
     read_book_body,
     split_into_poems,
-    split_into_books
+    split_into_books,
+    iter_leaves_of_grass
 )
 
 
@@ -122,4 +123,40 @@ class TestSplitIntoBooks:
             )
         ]
         actual = split_into_books(book_lines)
-        assert actual == expected
\ No newline at end of file
+        assert actual == expected
+
+class TestIterLeavesOfGrass:
+    def test_iter_leaves_of_grass(self):
+        lines = iter([
+            "The Project Gutenberg eBook of Leaves of Grass\n",
+            "\n",
+            "BOOK I.  INSCRIPTIONS\n",
+            "\n",
+            "One's-Self I Sing\n",
+            "\n",
+            "  One's-self I sing, a simple separate person,\n",
+            "  Yet utter the word Democratic, the word En-Masse.\n",
+            "\n",
+            "As I Ponder'd in Silence\n",
+            "  As I ponder'd in silence,\n",
+            "\n",
+            "BOOK II.  STARTING FROM PAUMANOK\n",
+            "  an orphaned line\n",
+            "Starting from Paumanok\n",
+            "  Starting from fish-shape Paumanok where I was born,\n",
+        ])
+        expected = [
+            (
+                "BOOK I.  INSCRIPTIONS",
+                "One's-Self I Sing",
+                "One's-self I sing, a simple separate person,\n"
+                "  Yet utter the word Democratic, the word En-Masse.",
+            ),
+            ("BOOK I.  INSCRIPTIONS", "As I Ponder'd in Silence", "As I ponder'd in silence,"),
+            (
+                "BOOK II.  STARTING FROM PAUMANOK",
+                "Starting from Paumanok",
+                "Starting from fish-shape Paumanok where I was born,",
+            ),
+        ]
+        assert list(iter_leaves_of_grass(lines)) == expected
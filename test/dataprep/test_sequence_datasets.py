@@ -0,0 +1,103 @@
+"""
+Unit tests for the `sequence_datasets` module
+
+"""
+
+import numpy as np
+
+from dataprep.sequence_datasets import (
+    concatenate_poems,
+    iter_poem_batches,
+    iter_windowed_batches,
+    load_sequence,
+    poem_window_starts,
+    save_sequence
+)
+
+
+class TestSaveAndLoadSequence:
+    def test_round_trip(self, tmp_path):
+        ids = np.array([3, 1, 4, 1, 5], dtype=np.int8)
+        save_sequence(ids, tmp_path / "ids.npy")
+        loaded = load_sequence(tmp_path / "ids.npy")
+        assert isinstance(loaded, np.memmap)
+        assert loaded.dtype == np.int8
+        assert np.array_equal(loaded, ids)
+
+
+class TestIterWindowedBatches:
+    def test_in_order(self):
+        ids = np.arange(7)
+        batches = list(iter_windowed_batches(ids, sequence_length=3, batch_size=3))
+        assert len(batches) == 2
+        inputs, targets = batches[0]
+        assert inputs.tolist() == [[0, 1, 2], [1, 2, 3], [2, 3, 4]]
+        assert targets.tolist() == [3, 4, 5]
+        inputs, targets = batches[1]
+        assert inputs.tolist() == [[3, 4, 5]]
+        assert targets.tolist() == [6]
+
+    def test_too_short(self):
+        assert list(iter_windowed_batches(np.arange(3), sequence_length=3, batch_size=2)) == []
+
+    def test_shuffled_covers_every_window_once(self):
+        ids = np.arange(50)
+        batches = list(iter_windowed_batches(
+            ids, sequence_length=4, batch_size=8, shuffle_buffer_size=10,
+            rng=np.random.default_rng(0)
+        ))
+        targets = np.concatenate([t for _, t in batches])
+        assert sorted(targets.tolist()) == list(range(4, 50))
+        assert targets.tolist() != list(range(4, 50))
+        for inputs, batch_targets in batches:
+            assert (inputs[:, -1] + 1 == batch_targets).all()
+
+
+class TestConcatenatePoems:
+    def test_concatenate_poems(self):
+        ids, offsets = concatenate_poems([np.array([1, 2, 3]), np.array([4]), np.array([5, 6])])
+        assert ids.tolist() == [1, 2, 3, 4, 5, 6]
+        assert offsets.tolist() == [0, 3, 4, 6]
+
+
+class TestPoemWindowStarts:
+    def test_windows_stay_within_poems(self):
+        offsets = np.array([0, 4, 5, 9])
+        assert poem_window_starts(offsets, 3).tolist() == [0, 1, 5, 6]
+
+    def test_selected_poems(self):
+        offsets = np.array([0, 4, 5, 9])
+        assert poem_window_starts(offsets, 3, np.array([2])).tolist() == [5, 6]
+
+
+class TestIterPoemBatches:
+    # Poems of length 6, 3, and 5, with ids that encode (poem, position)
+    ids, offsets = concatenate_poems([
+        np.array([10, 11, 12, 13, 14, 15]),
+        np.array([20, 21, 22]),
+        np.array([30, 31, 32, 33, 34]),
+    ])
+
+    def test_never_spans_two_poems(self):
+        batches = list(iter_poem_batches(self.ids, self.offsets, sequence_length=3, batch_size=2))
+        inputs = np.concatenate([x for x, _ in batches])
+        targets = np.concatenate([y for _, y in batches])
+        assert inputs.tolist() == [[10, 11, 12], [11, 12, 13], [12, 13, 14], [30, 31, 32], [31, 32, 33]]
+        assert targets.tolist() == [13, 14, 15, 33, 34]
+
+    def test_buckets_short_poems(self):
+        batches = list(iter_poem_batches(
+            self.ids, self.offsets, sequence_length=4, batch_size=8, bucket_sequence_lengths=(2,)
+        ))
+        assert [x.shape for x, _ in batches] == [(3, 4), (1, 2)]
+        assert batches[1][0].tolist() == [[20, 21]]
+        assert batches[1][1].tolist() == [22]
+
+    def test_shuffled_covers_every_window_once(self):
+        batches = list(iter_poem_batches(
+            self.ids, self.offsets, sequence_length=3, batch_size=2,
+            bucket_sequence_lengths=(1,), shuffle_buffer_size=2, rng=np.random.default_rng(0)
+        ))
+        targets = np.concatenate([y for _, y in batches])
+        assert sorted(targets.tolist()) == [13, 14, 15, 21, 22, 33, 34]
+        assert targets.tolist() != sorted(targets.tolist())
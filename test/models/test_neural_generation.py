@@ -0,0 +1,120 @@
+"""
+Unit tests for incremental generation with a character-based LSTM
+
+"""
+
+import os
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"  # Suppress tensorflow debugging info
+
+import numpy as np
+import pytest
+from keras.layers import LSTM, Dropout
+from pytest import approx
+
+from dataprep.neural_lm_dataprep import Vectorizer
+from models.neural_generation import CharacterGenerator, sample_from_distributions
+from models.neural_language_models import build_character_lstm_model
+
+
+@pytest.fixture(scope="module")
+def vectorizer():
+    vec = Vectorizer()
+    vec.fit(list("@abc $"))
+    return vec
+
+
+@pytest.fixture(scope="module")
+def model(vectorizer):
+    return build_character_lstm_model(
+        vocab_size=vectorizer.vocab_size(),
+        hidden_layers=[LSTM(8, return_sequences=True), Dropout(0.3), LSTM(8), Dropout(0.3)],
+        lr=0.01,
+    )
+
+
+class TestCharacterGenerator:
+    def test_prime_matches_full_sequence(self, model, vectorizer):
+        generator = CharacterGenerator(model, vectorizer)
+        seed = "@ab ca"
+        vec = vectorizer.tokens_to_vectors(list(seed)).reshape(1, len(seed), vectorizer.vocab_size())
+        expected = np.asarray(model(vec))[0]
+        distributions, _ = generator.prime([seed, "@a", seed[:3]])
+        assert distributions[0] == approx(expected, abs=1e-5)
+        assert distributions[2] == approx(
+            np.asarray(model(vec[:, :3]))[0], abs=1e-5
+        )
+
+    def test_generate(self, model, vectorizer):
+        generator = CharacterGenerator(model, vectorizer)
+        poem = generator.generate("@a", max_length=20, rng=np.random.default_rng(0))
+        assert poem.startswith("@a")
+        assert 3 <= len(poem) <= 22
+        assert set(poem) <= set(vectorizer.vocabulary())
+
+    def test_generate_is_reproducible(self, model, vectorizer):
+        generator = CharacterGenerator(model, vectorizer)
+        first = generator.generate("@a", max_length=20, rng=np.random.default_rng(1))
+        second = generator.generate("@a", max_length=20, rng=np.random.default_rng(1))
+        assert first == second
+
+    def test_iter_characters_matches_generate(self, model, vectorizer):
+        generator = CharacterGenerator(model, vectorizer)
+        for seed in range(5):
+            characters = generator.iter_characters(
+                "@a", max_length=20, temperature=0.8, rng=np.random.default_rng(seed)
+            )
+            poem = generator.generate(
+                "@a", max_length=20, temperature=0.8, rng=np.random.default_rng(seed)
+            )
+            assert "@a" + "".join(characters) == poem
+
+    def test_generate_batch(self, model, vectorizer):
+        generator = CharacterGenerator(model, vectorizer)
+        poems = generator.generate_batch(
+            ["@a", "@bc", "@a"], max_length=15, temperature=0.5, top_k=3,
+            rng=np.random.default_rng(0)
+        )
+        assert len(poems) == 3
+        for poem, seed in zip(poems, ["@a", "@bc", "@a"]):
+            assert poem.startswith(seed)
+            generated = poem[len(seed):]
+            assert 1 <= len(generated) <= 15
+            # Only the last character may be a poem boundary
+            assert not set(generated[:-1]) & {"@", "$"}
+
+
+    def test_embedding_model(self, vectorizer):
+        model = build_character_lstm_model(
+            vocab_size=vectorizer.vocab_size(),
+            hidden_layers=[LSTM(8, return_sequences=True), LSTM(8)],
+            lr=0.01,
+            embedding_dim=4,
+        )
+        ids = vectorizer.tokens_to_ints(list("@ab ca"))
+        model.fit(ids[None, :-1], ids[None, -1], epochs=1, verbose=0)
+        generator = CharacterGenerator(model, vectorizer)
+        distributions, _ = generator.prime(["@ab ca"])
+        expected = np.asarray(model(ids[None, :].astype(np.int32)))[0]
+        assert distributions[0] == approx(expected, abs=1e-5)
+
+
+class TestSampleFromDistributions:
+    def test_top_k(self):
+        distributions = np.array([[0.1, 0.2, 0.7], [0.5, 0.4, 0.1]])
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            ids = sample_from_distributions(distributions, top_k=1, rng=rng)
+            assert list(ids) == [2, 0]
+
+    def test_low_temperature_is_greedy(self):
+        distributions = np.array([[0.3, 0.3, 0.4], [0.45, 0.1, 0.45]])
+        ids = sample_from_distributions(
+            distributions, temperature=np.array([0.01, 1.0]), rng=np.random.default_rng(0)
+        )
+        assert ids[0] == 2
+        assert ids[1] in (0, 1, 2)
+
+    def test_zero_probability_is_never_sampled(self):
+        distributions = np.array([[0.0, 1.0, 0.0]] * 50)
+        ids = sample_from_distributions(distributions, rng=np.random.default_rng(0))
+        assert (ids == 1).all()
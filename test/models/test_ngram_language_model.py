@@ -3,9 +3,25 @@ Unit tests for the ngram language model
 
 """
 
+import multiprocessing
+import os
+import pickle
+import random
+import warnings
+
+import numpy as np
 from pytest import approx
 
-from models.ngram_language_model import LanguageModel
+from models.ngram_language_model import (
+    BackoffLanguageModel,
+    LanguageModel,
+    count_ngrams,
+    ngram_id_rows,
+    truncate_sampling_table,
+    unpack_ngrams
+)
+
+spawn_context = multiprocessing.get_context("spawn")
 
 
 class TestModelTraining:
@@ -55,3 +71,432 @@ class TestModelScoring:
         )
         assert approx(bigram_model.score(("i", "sing"))) == 0.33333333
         assert approx(bigram_model.score(("cool", "song"))) == 0.27272727
+
+
+class TestNextTokenProbDistGivenPrefix:
+    def test_bigram_model(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1)
+        bigram_model.train(
+            ["<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>",
+             "<p>", "i", "sing", "a", "cool", "song", "</p>"]
+        )
+        assert bigram_model.next_token_prob_dist_given_prefix(("sing",)) == approx(
+            {"i": 1 / 3, "of": 1 / 3, "a": 1 / 3}
+        )
+        assert bigram_model.next_token_prob_dist_given_prefix(("unseen",)) == {}
+
+    def test_count_ngrams_with_shorter_prefix(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(
+            ["<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>",
+             "<p>", "i", "sing", "a", "cool", "song", "</p>"]
+        )
+        assert trigram_model.count_ngrams_with_prefix(("i",)) == 3
+        assert trigram_model.count_ngrams_with_prefix(()) == 14
+        assert trigram_model.count_ngrams_with_prefix(("i", "sing", "a")) == 1
+
+
+class TestSamplingTables:
+    def test_sampling_table(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1, use_sampling_tables=True)
+        bigram_model.train(
+            ["<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>",
+             "<p>", "i", "sing", "a", "cool", "song", "</p>"]
+        )
+        candidate_ids, cumulative_weights = bigram_model.sampling_table(("sing",))
+        assert [bigram_model.vocabulary[i] for i in candidate_ids] == ["i", "of", "a"]
+        assert list(cumulative_weights) == [1, 2, 3]
+
+    def test_sample_token_given_prefix(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1, use_sampling_tables=True)
+        bigram_model.train(
+            ["<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>",
+             "<p>", "i", "sing", "a", "cool", "song", "</p>"]
+        )
+        for _ in range(20):
+            assert bigram_model.sample_token_given_prefix(("sing",)) in {"i", "of", "a"}
+            assert bigram_model.sample_token_given_prefix(("cool",)) == "song"
+
+
+    def test_truncated_sampling_table(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1, use_sampling_tables=True)
+        bigram_model.train(
+            ["<p>", "i", "sing", "i", "sing", "i", "sing", "of", "</p>",
+             "<p>", "i", "sing", "a", "</p>"]
+        )
+        candidate_ids, _ = bigram_model.sampling_table(("sing",), top_k=1)
+        assert [bigram_model.vocabulary[i] for i in candidate_ids] == ["i"]
+        for _ in range(20):
+            assert bigram_model.sample_token_given_prefix(("sing",), top_p=0.5) == "i"
+
+
+class TestCaching:
+    tokens = ["<p>", "one", "self", "i", "sing", "</p>"]
+
+    def test_least_recently_used_is_evicted(self):
+        bigram_model = LanguageModel(
+            2, False, replacement_threshold=1, use_sampling_tables=True, cache_size=2
+        )
+        bigram_model.train(self.tokens)
+        for prefix in [("<p>",), ("one",), ("<p>",), ("self",)]:
+            bigram_model.sampling_table(prefix)
+        assert (("<p>",), 1.0, None, None) in bigram_model._sampling_tables
+        assert (("one",), 1.0, None, None) not in bigram_model._sampling_tables
+        assert bigram_model.cache_info()["sampling_tables"] == {
+            "hits": 1, "misses": 3, "size": 2, "max_size": 2
+        }
+
+    def test_hits_and_misses(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1, use_sampling_tables=False)
+        bigram_model.train(self.tokens)
+        for _ in range(3):
+            assert bigram_model.count_ngrams_with_prefix(("i",)) == 1
+            assert bigram_model.next_token_prob_dist_given_prefix(("i",)) == {"sing": 1.0}
+        info = bigram_model.cache_info()
+        assert (info["prefix_counts"]["hits"], info["prefix_counts"]["misses"]) == (2, 1)
+        assert (info["distributions"]["hits"], info["distributions"]["misses"]) == (2, 1)
+        # Sampling tables are only cached if the model uses them
+        bigram_model.sampling_table(("i",))
+        assert bigram_model.cache_info()["sampling_tables"]["size"] == 0
+
+    def test_generation_hits_the_cache(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1)
+        bigram_model.train(self.tokens * 3)
+        for seed in range(50):
+            bigram_model.generate_poem(10, rng=random.Random(seed))
+        info = bigram_model.cache_info()["sampling_tables"]
+        # Only the 5 prefixes of the corpus are ever computed
+        assert info["misses"] == 5
+        assert info["hits"] > 100
+
+    def test_update_invalidates_caches(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1)
+        bigram_model.train(self.tokens)
+        assert bigram_model.count_ngrams_with_prefix(("i",)) == 1
+        bigram_model.update(["<p>", "i", "sing", "</p>"])
+        assert bigram_model.count_ngrams_with_prefix(("i",)) == 2
+        assert bigram_model.next_token_prob_dist_given_prefix(("<p>",)) == approx(
+            {"one": 0.5, "i": 0.5}
+        )
+
+
+class TestIterPoemTokens:
+    def test_iter_poem_tokens_matches_generate_poem(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(
+            ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>", "</p>",
+             "<p>", "<p>", "i", "sing", "a", "cool", "song", "</p>", "</p>"]
+        )
+        for seed in range(10):
+            random.seed(seed)
+            tokens = list(trigram_model.iter_poem_tokens(6))
+            random.seed(seed)
+            poem = trigram_model.generate_poem(6)
+            words = [token for token in tokens if token != "</p>"]
+            expected = "<p><p>" + "".join(" " + word for word in words)
+            if tokens[-1] == "</p>":
+                expected += "</p></p>"
+            assert poem == expected
+
+
+class TestGeneratePoem:
+    def test_generate_poem_token_ids(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(
+            ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>", "</p>",
+             "<p>", "<p>", "i", "sing", "a", "cool", "song", "</p>", "</p>"]
+        )
+        for seed in range(10):
+            poem = trigram_model.generate_poem(20, rng=random.Random(seed))
+            ids = trigram_model.generate_poem(20, rng=random.Random(seed), return_ids=True)
+            tokens = [trigram_model.vocabulary[i] for i in ids]
+            assert tokens[:2] == ["<p>", "<p>"] and tokens[-2:] == ["</p>", "</p>"]
+            assert poem == "<p><p> " + " ".join(tokens[2:-2]) + "</p></p>"
+            assert trigram_model.score_batch([ids])[0] == approx(
+                trigram_model.score_batch([tokens])[0]
+            )
+
+    def test_long_poem_stops_at_max_words(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1)
+        bigram_model.train(["<p>", "i", "sing", "i", "sing", "</p>"])
+        poem = bigram_model.generate_poem(5000, top_k=1)
+        assert len(poem.split()) == 5000
+
+
+class TestTruncateSamplingTable:
+    candidate_ids = np.array([0, 1, 2, 3])
+    weights = np.array([1.0, 4.0, 2.0, 3.0])
+
+    def test_no_truncation(self):
+        candidate_ids, cumulative_weights = truncate_sampling_table(self.candidate_ids, self.weights)
+        assert list(candidate_ids) == [0, 1, 2, 3]
+        assert list(cumulative_weights) == [1, 5, 7, 10]
+
+    def test_top_k(self):
+        candidate_ids, cumulative_weights = truncate_sampling_table(
+            self.candidate_ids, self.weights, top_k=2
+        )
+        assert list(candidate_ids) == [1, 3]
+        assert list(cumulative_weights) == [4, 7]
+
+    def test_top_p(self):
+        candidate_ids, _ = truncate_sampling_table(self.candidate_ids, self.weights, top_p=0.7)
+        assert list(candidate_ids) == [1, 3]
+        candidate_ids, _ = truncate_sampling_table(self.candidate_ids, self.weights, top_p=0.71)
+        assert list(candidate_ids) == [1, 3, 2]
+
+    def test_temperature(self):
+        _, cumulative_weights = truncate_sampling_table(
+            self.candidate_ids, self.weights, temperature=0.5
+        )
+        assert np.diff(cumulative_weights, prepend=0) == approx([1 / 16, 1, 1 / 4, 9 / 16])
+
+
+class TestCountNgrams:
+    def test_count_ngrams(self):
+        context_keys, keys, counts = count_ngrams(ngram_id_rows(np.array([1, 2, 0, 1, 2]), 2), 4)
+        # The prefixes 0, 1, 2 get the dense ids 0, 1, 2
+        assert [list(level) for level in context_keys] == [[0, 1, 2]]
+        assert list(keys) == [1, 6, 8]
+        assert list(counts) == [1, 2, 1]
+
+    def test_too_short(self):
+        _, keys, counts = count_ngrams(ngram_id_rows(np.array([1, 2]), 3), 4)
+        assert len(keys) == len(counts) == 0
+
+    def test_unpack_ngrams(self):
+        ids = np.array([3, 1, 2, 0, 3, 1, 2, 2])
+        context_keys, keys, counts = count_ngrams(ngram_id_rows(ids, 3), 4)
+        rows = unpack_ngrams(context_keys, keys, 4)
+        assert rows.tolist() == [[0, 3, 1], [1, 2, 0], [1, 2, 2], [2, 0, 3], [3, 1, 2]]
+        assert list(counts) == [1, 1, 1, 1, 2]
+
+    def test_high_order_with_large_vocabulary(self):
+        # 7000 ** 5 does not fit in an int64, but the keys only grow with what was seen
+        rng = np.random.default_rng(0)
+        words = [f"w{i}" for i in rng.integers(0, 7000, size=50_000)]
+        tokens = ["<p>"] * 4 + words + ["</p>"] * 4
+        model = LanguageModel(5, False, replacement_threshold=1)
+        model.train(tokens)
+        assert len(model.vocabulary) > 6000
+        assert model.count_ngrams_with_prefix(tuple(words[100:104])) >= 1
+        assert model.count_ngrams_with_prefix(tuple(words[100:105])) >= 1
+        assert model.next_token_prob_dist_given_prefix(tuple(words[:4])) == {words[4]: 1.0}
+        assert np.isfinite(model.score_batch([tokens[:200]])[0][0])
+
+
+class TestModelBatchScoring:
+    def test_matches_score(self):
+        trigram_model = LanguageModel(3, True, replacement_threshold=1)
+        trigram_model.train(
+            ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "a", "cool", "song", "</p>", "</p>",
+             "<p>", "<p>", "i", "sing", "a", "cool", "song", "</p>", "</p>"]
+        )
+        poems = [["<p>", "<p>", "i", "sing", "</p>"], ["a", "cool", "new", "song"], ["i"]]
+        log_probabilities, perplexities = trigram_model.score_batch(poems)
+        assert np.exp(log_probabilities[0]) == approx(trigram_model.score(poems[0]))
+        assert np.exp(log_probabilities[1]) == approx(trigram_model.score(poems[1]))
+        assert log_probabilities[2] == 0
+        assert perplexities[0] == approx(np.exp(-log_probabilities[0] / 3))
+        assert np.isnan(perplexities[2])
+
+    def test_unseen_ngram_without_smoothing(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1)
+        bigram_model.train(["<p>", "i", "sing", "</p>"])
+        log_probabilities, _ = bigram_model.score_batch([["i", "sing"], ["sing", "i"], ["i", "dance"]])
+        assert log_probabilities[0] == 0
+        assert log_probabilities[1] == -np.inf
+        assert log_probabilities[2] == -np.inf
+
+    def test_unseen_prefix_does_not_warn(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(["<p>", "<p>", "i", "sing", "</p>", "</p>"])
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            assert trigram_model.score(["<p>", "<p>", "zz"]) == 0
+            assert trigram_model.score(["zz", "zz", "i"]) == 0
+
+    def test_long_poem_does_not_underflow(self):
+        bigram_model = LanguageModel(2, True, replacement_threshold=1)
+        bigram_model.train(["<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>"])
+        log_probabilities, _ = bigram_model.score_batch([["i", "sing"] * 1000])
+        assert np.isfinite(log_probabilities[0])
+
+
+class TestSaveAndLoad:
+    def test_round_trip(self, tmp_path):
+        trigram_model = LanguageModel(3, True, replacement_threshold=2)
+        trigram_model.train(
+            ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "a", "cool", "song", "</p>", "</p>",
+             "<p>", "<p>", "i", "sing", "a", "cool", "song", "</p>", "</p>"]
+        )
+        trigram_model.save(tmp_path / "model")
+        loaded = LanguageModel.load(tmp_path / "model")
+        assert isinstance(loaded.n_gram_keys, np.memmap)
+        assert loaded.n == 3
+        assert loaded.is_laplace_smoothing is True
+        assert loaded.vocabulary == trigram_model.vocabulary
+        assert loaded.n_gram_frequencies == trigram_model.n_gram_frequencies
+        assert loaded.score(["i", "sing", "a"]) == approx(trigram_model.score(["i", "sing", "a"]))
+        assert loaded.count_ngrams_with_prefix(("i", "sing")) == 3
+
+
+    def test_save_over_loaded_model(self, tmp_path):
+        corpus = ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "a", "cool", "song", "</p>", "</p>"]
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(corpus)
+        trigram_model.save(tmp_path / "model")
+        loaded = LanguageModel.load(tmp_path / "model")
+        expected = loaded.n_gram_frequencies
+
+        # Saving a model over its own, still memory-mapped, files must not truncate them
+        loaded.save(tmp_path / "model")
+        trigram_model.update(corpus)
+        trigram_model.save(tmp_path / "model")
+        assert loaded.n_gram_frequencies == expected
+        reloaded = LanguageModel.load(tmp_path / "model")
+        assert reloaded.n_gram_frequencies == trigram_model.n_gram_frequencies
+        assert sorted(os.listdir(tmp_path / "model")) == sorted(
+            list(LanguageModel.ARRAY_FILES.values())
+            + [LanguageModel.METADATA_FILE, LanguageModel.VOCABULARY_FILE]
+        )
+
+
+class TestParallelAndIncrementalTraining:
+    corpus = ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "a", "cool", "song", "</p>", "</p>",
+              "<p>", "<p>", "i", "sing", "a", "cool", "song", "</p>", "</p>"]
+
+    def test_train_parallel_matches_train(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=2)
+        trigram_model.train(self.corpus)
+        parallel_model = LanguageModel(3, False, replacement_threshold=2)
+        parallel_model.train_parallel(self.corpus, processes=2, num_shards=5)
+        assert parallel_model.vocabulary == trigram_model.vocabulary
+        assert parallel_model.n_gram_frequencies == trigram_model.n_gram_frequencies
+
+    def test_update(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(self.corpus[:13])
+        trigram_model.update(self.corpus[13:])
+        full_model = LanguageModel(3, False, replacement_threshold=1)
+        full_model.train(self.corpus)
+        expected = full_model.n_gram_frequencies
+        # The n-grams spanning the boundary between the two batches are not counted
+        del expected[("</p>", "</p>", "<p>")], expected[("</p>", "<p>", "<p>")]
+        assert trigram_model.n_gram_frequencies == expected
+
+    def test_update_with_unknown_tokens(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1)
+        bigram_model.train(["<p>", "i", "sing", "</p>"])
+        bigram_model.update(["<p>", "i", "dance", "</p>"])
+        assert bigram_model.vocabulary == ["<p>", "i", "sing", "</p>", "<UNK>"]
+        assert bigram_model.count_ngrams_with_prefix(("i",)) == 2
+        assert bigram_model.count_ngrams_with_prefix(("i", "<UNK>")) == 1
+        assert bigram_model.count_ngrams_with_prefix(("sing", "</p>")) == 1
+
+
+class TestBulkGeneration:
+    corpus = ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "a", "cool", "song", "</p>", "</p>",
+              "<p>", "<p>", "i", "sing", "of", "a", "cool", "song", "</p>", "</p>"]
+
+    def test_same_seed_gives_same_poems_in_parallel(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(self.corpus)
+        poems = trigram_model.generate(20, 8, seed=3)
+        assert len(poems) == 20
+        assert all(poem.startswith("<p><p>") for poem in poems)
+        assert trigram_model.generate(20, 8, seed=3, processes=2, chunk_size=3) == poems
+        assert trigram_model.generate(20, 8, seed=4) != poems
+
+    def test_model_can_be_sent_to_other_processes(self):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1, use_sampling_tables=True)
+        trigram_model.train(self.corpus)
+        trigram_model.generate(5, 8, seed=0)
+        copy = pickle.loads(pickle.dumps(trigram_model))
+        assert copy.cache_info()["sampling_tables"]["size"] == 0
+        assert copy.generate(5, 8, seed=0) == trigram_model.generate(5, 8, seed=0)
+
+
+    def test_spawned_workers_load_a_saved_model(self, tmp_path, monkeypatch):
+        trigram_model = LanguageModel(3, False, replacement_threshold=1)
+        trigram_model.train(self.corpus)
+        trigram_model.save(tmp_path / "model")
+        loaded = LanguageModel.load(tmp_path / "model")
+        assert loaded._loaded_from == tmp_path / "model"
+
+        monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+        monkeypatch.setattr(multiprocessing, "get_context", lambda method=None: spawn_context)
+        poems = loaded.generate(10, 8, seed=3, processes=2)
+        assert poems == trigram_model.generate(10, 8, seed=3)
+
+        loaded.update(self.corpus)
+        assert loaded._loaded_from is None
+
+
+class TestStreamingTraining:
+    def test_train_from_stream_matches_train(self):
+        poems = [
+            ["<p>", "<p>", "one", "self", "i", "sing", "i", "sing", "a", "cool", "song", "</p>", "</p>"],
+            ["<p>", "<p>", "i", "sing", "a", "cool", "song", "</p>", "</p>"],
+            ["<p>", "<p>", "a", "cool", "song", "</p>", "</p>"],
+        ]
+        trigram_model = LanguageModel(3, False, replacement_threshold=2)
+        trigram_model.train([token for poem in poems for token in poem])
+        streamed_model = LanguageModel(3, False, replacement_threshold=2)
+        streamed_model.train_from_stream(lambda: iter(poems), chunk_size=4)
+        assert streamed_model.vocabulary == trigram_model.vocabulary
+        assert streamed_model.n_gram_frequencies == trigram_model.n_gram_frequencies
+
+
+class TestBackoffLanguageModel:
+    tokens = ["<p>", "a", "b", "</p>", "<p>", "a", "c", "</p>"]
+
+    def test_kneser_ney_probabilities(self):
+        model = BackoffLanguageModel(2, discount=0.5, replacement_threshold=1)
+        model.train(self.tokens)
+        assert np.exp(model.log_probability(("a", "b"))) == approx(1 / 3)
+        # An unseen bigram backs off to the continuation probability of "</p>"
+        assert np.exp(model.log_probability(("a", "</p>"))) == approx(1 / 6)
+
+    def test_distribution_matches_scores(self):
+        model = BackoffLanguageModel(3, replacement_threshold=1)
+        model.train(["<p>"] + self.tokens + ["</p>"])
+        for prefix in [("<p>", "a"), ("b", "c"), ("unseen", "a")]:
+            distribution = model.next_token_distribution(prefix)
+            assert distribution.sum() == approx(1)
+            assert distribution == approx(
+                np.exp([model.log_probability(prefix + (token,)) for token in model.vocabulary])
+            )
+
+    def test_sampling_walks_down_the_orders(self):
+        model = BackoffLanguageModel(3, replacement_threshold=1)
+        model.train(["<p>"] + self.tokens + ["</p>"])
+        rng = random.Random(0)
+        for prefix in [("<p>", "a"), ("b", "c"), ("unseen", "a")]:
+            samples = [model._sample_token_id(prefix, 1, None, None, rng) for _ in range(20000)]
+            frequencies = np.bincount(samples, minlength=len(model.vocabulary)) / len(samples)
+            assert frequencies == approx(model.next_token_distribution(prefix), abs=0.02)
+
+    def test_unseen_prefix_does_not_dead_end(self):
+        for smoothing in BackoffLanguageModel.SMOOTHING_METHODS:
+            model = BackoffLanguageModel(2, smoothing=smoothing, replacement_threshold=1)
+            model.train(self.tokens)
+            assert model.next_token_prob_dist_given_prefix(("unseen",))
+            assert model.sample_token_given_prefix(("</p>",)) in model.vocabulary
+            assert model.sample_token_given_prefix(("a",), top_k=1) == "b"
+
+    def test_stupid_backoff_scores(self):
+        model = BackoffLanguageModel(
+            2, smoothing="stupid_backoff", backoff_factor=0.4, replacement_threshold=1
+        )
+        model.train(self.tokens)
+        assert np.exp(model.log_probability(("a", "b"))) == approx(1 / 2)
+        assert np.exp(model.log_probability(("a", "</p>"))) == approx(0.4 * 2 / 7)
+
+    def test_save_and_load(self, tmp_path):
+        model = BackoffLanguageModel(2, smoothing="stupid_backoff", replacement_threshold=1)
+        model.train(self.tokens)
+        model.save(tmp_path / "model")
+        loaded = BackoffLanguageModel.load(tmp_path / "model")
+        assert loaded.smoothing == "stupid_backoff"
+        assert loaded.score_batch([self.tokens])[0] == approx(model.score_batch([self.tokens])[0])
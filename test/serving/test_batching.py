@@ -0,0 +1,43 @@
+"""
+Unit tests for batching requests
+
+"""
+
+import threading
+
+import pytest
+
+from serving.batching import RequestBatcher
+
+
+class TestRequestBatcher:
+    def test_concurrent_requests_are_batched(self):
+        started, release = threading.Event(), threading.Event()
+        batches = []
+
+        def handler(requests):
+            started.set()
+            release.wait()
+            batches.append(list(requests))
+            return [request * 2 for request in requests]
+
+        batcher = RequestBatcher(handler, max_batch_size=4, max_wait_seconds=0.05)
+        # The first request is held in the handler while the rest queue up
+        futures = [batcher.submit(0)]
+        started.wait(timeout=5)
+        futures += [batcher.submit(i) for i in range(1, 7)]
+        release.set()
+        assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6, 8, 10, 12]
+        batcher.close()
+        assert batches == [[0], [1, 2, 3, 4], [5, 6]]
+
+    def test_handler_errors_reach_every_request(self):
+        def handler(requests):
+            raise ValueError("bad batch")
+
+        batcher = RequestBatcher(handler, max_wait_seconds=0.05)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError, match="bad batch"):
+                future.result(timeout=5)
+        batcher.close()
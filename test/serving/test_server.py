@@ -0,0 +1,144 @@
+"""
+Unit tests for the poem generation service
+
+"""
+
+import http.client
+import json
+import os
+import socket
+import threading
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"  # Suppress tensorflow debugging info
+
+import pytest
+from keras.layers import LSTM
+
+from dataprep.neural_lm_dataprep import Vectorizer
+from models.neural_generation import CharacterGenerator
+from models.neural_language_models import build_character_lstm_model
+from models.ngram_language_model import LanguageModel
+from serving.server import GenerationHTTPServer, GenerationService, UnixGenerationHTTPServer
+
+
+@pytest.fixture(scope="module")
+def service():
+    vectorizer = Vectorizer()
+    vectorizer.fit(list("@abc $"))
+    model = build_character_lstm_model(
+        vocab_size=vectorizer.vocab_size(), hidden_layers=[LSTM(8)], lr=0.01, embedding_dim=4
+    )
+    ngram_model = LanguageModel(2, False, replacement_threshold=1, use_sampling_tables=True)
+    ngram_model.train(["<p>", "i", "sing", "</p>", "<p>", "i", "sing", "i", "sing", "</p>"])
+    service = GenerationService(
+        character_generator=CharacterGenerator(model, vectorizer),
+        ngram_model=ngram_model,
+        max_wait_seconds=0.05,
+        random_seed=0,
+    )
+    yield service
+    service.close()
+
+
+class TestGenerationService:
+    def test_concurrent_neural_requests(self, service):
+        requests = [
+            {"model": "neural", "seed": "@ab", "max_length": length, "temperature": 0.5 + length / 10}
+            for length in range(1, 9)
+        ]
+        results = [None] * len(requests)
+
+        def generate(i):
+            results[i] = service.generate(requests[i], timeout=30)
+
+        threads = [threading.Thread(target=generate, args=(i,)) for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for request, result in zip(requests, results):
+            assert result["poem"].startswith("ab")
+            assert len(result["poem"]) <= len("ab") + request["max_length"]
+        assert service._batchers["neural"].num_batches < len(requests)
+
+    def test_ngram_request(self, service):
+        poem = service.generate({"model": "ngram", "max_length": 20, "top_k": 1})["poem"]
+        assert poem.split()[:2] == ["i", "sing"]
+
+    def test_invalid_requests(self, service):
+        with pytest.raises(ValueError, match="unknown characters"):
+            service.generate({"model": "neural", "seed": "xyz"})
+        with pytest.raises(ValueError, match="Unknown model"):
+            service.generate({"model": "transformer"})
+        with pytest.raises(ValueError, match="max_length"):
+            service.generate({"model": "ngram", "max_length": 0})
+        with pytest.raises(ValueError, match="max_length"):
+            service.generate({"model": "ngram", "max_length": True})
+        with pytest.raises(ValueError, match="top_k"):
+            service.generate({"model": "ngram", "top_k": True})
+        for value in ["NaN", "Infinity"]:
+            request = json.loads(f'{{"model": "ngram", "temperature": {value}}}')
+            with pytest.raises(ValueError, match="temperature"):
+                service.generate(request)
+
+
+class TestHTTPServers:
+    def test_http_server(self, service):
+        server = GenerationHTTPServer(("127.0.0.1", 0), service, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connection = http.client.HTTPConnection(*server.server_address, timeout=30)
+            connection.request("GET", "/health")
+            assert json.loads(connection.getresponse().read())["models"] == ["neural", "ngram"]
+            connection.request("POST", "/generate", json.dumps({"model": "neural", "seed": "@a"}))
+            response = connection.getresponse()
+            assert response.status == 200
+            assert json.loads(response.read())["poem"].startswith("a")
+            connection.request("POST", "/generate", json.dumps({"model": "neural"}))
+            response = connection.getresponse()
+            assert response.status == 400
+            assert "seed" in json.loads(response.read())["error"]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_unexpected_errors_are_answered(self):
+        class FailingModel:
+            def generate_poem(self, *args, **kwargs):
+                raise RuntimeError("model step failed")
+
+        service = GenerationService(ngram_model=FailingModel())
+        server = GenerationHTTPServer(("127.0.0.1", 0), service, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connection = http.client.HTTPConnection(*server.server_address, timeout=30)
+            connection.request("POST", "/generate", json.dumps({"model": "ngram"}))
+            response = connection.getresponse()
+            assert response.status == 500
+            assert json.loads(response.read())["error"] == "RuntimeError: model step failed"
+        finally:
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+    def test_unix_socket_server_keeps_other_files(self, service, tmp_path):
+        path = tmp_path / "poems.sock"
+        path.write_text("not a socket")
+        with pytest.raises(FileExistsError):
+            UnixGenerationHTTPServer(str(path), service, quiet=True)
+        assert path.read_text() == "not a socket"
+
+    def test_unix_socket_server(self, service, tmp_path):
+        path = str(tmp_path / "poems.sock")
+        server = UnixGenerationHTTPServer(path, service, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connection = http.client.HTTPConnection("localhost", timeout=30)
+            connection.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.sock.connect(path)
+            connection.request("POST", "/generate", json.dumps({"model": "ngram", "max_length": 5}))
+            response = connection.getresponse()
+            assert response.status == 200
+            assert "poem" in json.loads(response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
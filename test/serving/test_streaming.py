@@ -0,0 +1,44 @@
+"""
+Unit tests for streaming generation
+
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from models.ngram_language_model import LanguageModel
+from serving.streaming import iterate_in_executor, stream_ngram_poem
+
+
+async def collect(stream):
+    return [item async for item in stream]
+
+
+class TestIterateInExecutor:
+    def test_streams_are_interleaved(self):
+        order = []
+
+        def steps(name):
+            for i in range(3):
+                order.append(name)
+                yield f"{name}{i}"
+
+        async def run():
+            with ThreadPoolExecutor(1) as executor:
+                return await asyncio.gather(
+                    collect(iterate_in_executor(steps("a"), executor)),
+                    collect(iterate_in_executor(steps("b"), executor)),
+                )
+
+        assert asyncio.run(run()) == [["a0", "a1", "a2"], ["b0", "b1", "b2"]]
+        # Neither stream waits for the other to finish
+        assert order == ["a", "b", "a", "b", "a", "b"]
+
+
+class TestStreamNgramPoem:
+    def test_stream_ngram_poem(self):
+        bigram_model = LanguageModel(2, False, replacement_threshold=1)
+        bigram_model.train(["<p>", "one", "self", "i", "sing", "i", "sing", "of", "</p>"])
+        tokens = asyncio.run(collect(stream_ngram_poem(bigram_model, 50, top_k=1)))
+        # The most likely continuation of "sing" is "i", so the poem never ends
+        assert tokens == ["one", "self"] + ["i", "sing"] * 23 + ["i"]